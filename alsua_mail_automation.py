@@ -10,26 +10,37 @@ import logging
 import re
 import sys
 import csv
+import threading
 from datetime import datetime, timedelta
-import win32com.client
-import pythoncom
-from modules.parser import parse_xls
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor
+from modules.parser import leer_viajes_xls, viaje_de_prefactura, formatear_fecha_viaje
 from modules.gm_login import login_to_gm
 from modules.gm_transport_general import GMTransportAutomation
 from cola_viajes import (
-    agregar_viaje_a_cola,
+    agregar_viajes_a_cola,
+    archivo_en_uso_cola,
     obtener_siguiente_viaje_cola,
     marcar_viaje_exitoso_cola,
     marcar_viaje_fallido_cola,
     registrar_error_reintentable_cola,
-    obtener_estadisticas_cola
+    obtener_estadisticas_cola,
+    obtener_resumen_cola
 )
 from viajes_log import registrar_viaje_fallido as log_viaje_fallido, viajes_log
 # Importar módulos de mejora
 from modules import robot_state_manager
 from modules.debug_logger import debug_logger
 from modules.email_alertas import enviar_alerta_robot_trabado, enviar_alerta_loop_infinito
-from modules.mysql_simple import MySQLSimple
+from modules import mysql_sync_worker
+from modules import dedup_remoto
+from modules.mail_source import crear_fuente_correo, FiltroCorreo
+from modules.mensajes_procesados import mensajes_procesados
+from modules.ingesta_correo import IngestorCorreo, ControladorIngesta
+from modules.control_ritmo import ControlRitmo
+from modules.orquestador import Orquestador
+from modules.prevalidador_viajes import PrevalidadorViajes
+from modules.estado_runtime import estado_runtime, ESTADO_RUNTIME_CONFIG
+from modules.cache_adjuntos import cache_adjuntos, huella_contenido
 
 logging.basicConfig(
     level=logging.INFO,
@@ -40,61 +51,108 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def verificar_determinante_existe(determinante):
-    """
-    Verifica si una determinante existe en clave_ruta_base.csv
-
-    Args:
-        determinante: Número de determinante a verificar
-
-    Returns:
-        bool: True si existe, False si no existe
-    """
-    csv_path = 'modules/clave_ruta_base.csv'
-
-    if not os.path.exists(csv_path):
-        logger.error(f"Archivo {csv_path} no existe")
-        return False
+# Correos de viajes: se filtra en la fuente (en Outlook, del lado del servidor)
+FILTRO_PREFACTURAS = FiltroCorreo(
+    remitente="PreFacturacionTransportes@walmart.com",
+    asunto_contiene="prefactura",
+    asunto_excluye="cancelado",
+    con_adjuntos=True
+)
 
-    try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('determinante') == str(determinante):
-                    return True
-        return False
-    except Exception as e:
-        logger.error(f"Error verificando determinante: {e}")
-        return False
+# Ingesta: el parseo de XLS (pandas) es CPU, un pool de procesos evita el GIL
+INGESTA_CONFIG = {
+    'trabajadores_parseo': max(1, min(4, (os.cpu_count() or 2) - 1)),
+    'usar_procesos': True,
+    'timeout_parseo_segundos': 120
+}
+
+# Tareas periódicas del bucle continuo: cada una con su intervalo y timeout (segundos)
+TAREAS_ORQUESTADOR = {
+    'viaje_stuck': {'intervalo': 60, 'timeout': 30},
+    'alerta_sin_trabajo': {'intervalo': 300, 'timeout': 60},
+    'limpieza': {'intervalo': 3600, 'timeout': 300, 'retraso_inicial': 3600},
+    'estadisticas_cola': {'intervalo': 600, 'timeout': 30, 'retraso_inicial': 600},
+    'prevalidacion': {'intervalo': 15, 'timeout': 60},
+    'refresco_dedup_remoto': {'intervalo': 60, 'timeout': 300}   # El TTL del cache decide si consulta
+}
+
+# Watchdog del viaje en proceso: minutos sin cambio de fase antes de pedir que se aborte
+MINUTOS_SIN_AVANCE_VIAJE = 45
 
 class AlsuaMailAutomation:
     # Variable de clase para controlar la ejecución desde Flask
     continuar_ejecutando = True
 
-    def __init__(self):
+    def __init__(self, fuente_correo=None):
         self.carpeta_descarga = os.path.abspath("archivos_descargados")
 
         self.driver = None
 
-        self.com_inicializado = False
+        # Fuente de correo (Outlook por default; Maildir/.eml para pruebas en Linux)
+        self.fuente_correo = fuente_correo or crear_fuente_correo()
+
+        # Ingesta de correo en su propio hilo (despierta por evento de la fuente)
+        self.controlador_ingesta = ControladorIngesta()
+        self.ingestor = IngestorCorreo(self.fuente_correo, self.revisar_y_extraer_correos,
+                                       controlador=self.controlador_ingesta)
 
-        self.emails_fallidos = {}
+        # Pausa entre viajes según la salud observada de GM (sin esperas fijas)
+        self.control_ritmo = ControlRitmo()
+        # False si el último viaje terminó antes de llegar a GM (duplicado, prevalidación, loop)
+        self._viaje_en_gm = False
+
+        # Los siguientes viajes de la cola se revisan mientras corre el actual
+        self.prevalidador = PrevalidadorViajes()
+
+        # Bucle continuo: tareas independientes (ver modules/orquestador.py)
+        self.orquestador = None
+        self._mostrar_debug = False
+        self._ciclos_procesamiento = 0
+        # El watchdog pide abortar; el hilo de procesamiento (dueño del driver) lo atiende
+        self._abortar_viaje = threading.Event()
+
+        # Estado que sobrevive reinicios (SQLite con TTL, ver modules/estado_runtime.py)
+        self.emails_fallidos = estado_runtime.vista(
+            'emails_fallidos', ESTADO_RUNTIME_CONFIG['ttl_emails_fallidos_dias'] * 86400
+        )
+        self._pool_parseo = None
 
         # Sistema de detección de loops infinitos
-        self.historial_procesamiento = {}  # {prefactura: [timestamp1, timestamp2, ...]}
+        self.historial_procesamiento = estado_runtime.vista('historial_procesamiento')  # {prefactura: [iso, ...]}
         self.ultimo_viaje_procesado = None
         self.ultimo_timestamp_procesado = None
 
-        # Sistema de alertas por email
-        self.ultimo_viaje_exitoso_timestamp = datetime.now()
-        self.ultimo_viaje_exitoso_prefactura = None
-        self.alerta_enviada = False
-
-        # Sistema de sincronización MySQL
-        self.mysql_sync = MySQLSimple()
+        # Sistema de alertas por email (si nunca ha habido éxito, se cuenta desde el primer arranque)
+        if estado_runtime.obtener('alertas', 'ultimo_viaje_exitoso_timestamp') is None:
+            self.ultimo_viaje_exitoso_timestamp = datetime.now()
 
         self._crear_carpeta_descarga()
         
+    @property
+    def ultimo_viaje_exitoso_timestamp(self):
+        valor = estado_runtime.obtener('alertas', 'ultimo_viaje_exitoso_timestamp')
+        return datetime.fromisoformat(valor) if valor else datetime.now()
+
+    @ultimo_viaje_exitoso_timestamp.setter
+    def ultimo_viaje_exitoso_timestamp(self, valor):
+        estado_runtime.guardar('alertas', 'ultimo_viaje_exitoso_timestamp', valor.isoformat())
+
+    @property
+    def ultimo_viaje_exitoso_prefactura(self):
+        return estado_runtime.obtener('alertas', 'ultimo_viaje_exitoso_prefactura')
+
+    @ultimo_viaje_exitoso_prefactura.setter
+    def ultimo_viaje_exitoso_prefactura(self, valor):
+        estado_runtime.guardar('alertas', 'ultimo_viaje_exitoso_prefactura', valor)
+
+    @property
+    def alerta_enviada(self):
+        return estado_runtime.obtener('alertas', 'alerta_enviada', False)
+
+    @alerta_enviada.setter
+    def alerta_enviada(self, valor):
+        estado_runtime.guardar('alertas', 'alerta_enviada', bool(valor))
+
     def _crear_carpeta_descarga(self):
         try:
             if not os.path.exists(self.carpeta_descarga):
@@ -117,27 +175,9 @@ class AlsuaMailAutomation:
             os.makedirs(self.carpeta_descarga, exist_ok=True)
             logger.warning(f"Carpeta fallback: {self.carpeta_descarga}")
     
-    def inicializar_com(self):
-        try:
-            if not self.com_inicializado:
-                pythoncom.CoInitialize()
-                self.com_inicializado = True
-                return True
-        except Exception as e:
-            logger.error(f"Error inicializando COM: {e}")
-            return False
-
-    def limpiar_com(self):
-        try:
-            if self.com_inicializado:
-                pythoncom.CoUninitialize()
-                self.com_inicializado = False
-        except Exception as e:
-            logger.warning(f"Error limpiando COM: {e}")
-    
     def ya_fue_procesado_correo_csv(self, mensaje):
         try:
-            prefactura = self.extraer_prefactura_del_asunto(mensaje.Subject or "")
+            prefactura = self.extraer_prefactura_del_asunto(mensaje.asunto)
             if not prefactura:
                 return False
             
@@ -147,6 +187,11 @@ class AlsuaMailAutomation:
                 logger.info(f"Correo duplicado: {prefactura} ({viaje_existente.get('estatus')} @ {viaje_existente.get('timestamp')})")
                 return True
 
+            # Facturado desde otra máquina o antes de rotar el CSV
+            if dedup_remoto.prefactura_facturada(prefactura):
+                logger.info(f"Correo duplicado: {prefactura} ya facturado en prefacturarobot")
+                return True
+
             return False
             
         except Exception as e:
@@ -176,110 +221,180 @@ class AlsuaMailAutomation:
         return None
     
     def convertir_fecha_formato(self, fecha_str):
-        try:
-            if not fecha_str or fecha_str == "nan":
-                return datetime.now().strftime("%d/%m/%Y")
-                
-            formatos = ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y"]
-            
-            for formato in formatos:
-                try:
-                    fecha_obj = datetime.strptime(str(fecha_str).split()[0], formato)
-                    return fecha_obj.strftime("%d/%m/%Y")
-                except:
-                    continue
-                    
-            logger.warning(f"No se pudo convertir fecha: {fecha_str}, usando fecha actual")
-            return datetime.now().strftime("%d/%m/%Y")
-            
-        except Exception as e:
-            logger.error(f"Error al convertir fecha: {e}")
-            return datetime.now().strftime("%d/%m/%Y")
+        return formatear_fecha_viaje(fecha_str)
     
-    def extraer_datos_de_correo(self, mensaje):
-        try:
-            if self.ya_fue_procesado_correo_csv(mensaje):
-                logger.info("Saltando correo ya procesado (encontrado en CSV)")
-                mensaje.UnRead = False
-                return None
-            
-            asunto = mensaje.Subject or ""
-            remitente = mensaje.SenderEmailAddress or ""
-            fecha_recibido = mensaje.ReceivedTime
-            
-            if not remitente or "PreFacturacionTransportes@walmart.com" not in remitente:
-                return None
-                
-            if "cancelado" in asunto.lower() or "no-reply" in remitente.lower():
-                mensaje.UnRead = False
-                return None
-                
-            if not "prefactura" in asunto.lower():
-                mensaje.UnRead = False
-                return None
+    def _descartar_correo(self, mensaje, resultado, prefactura=None):
+        """Marca leído un correo que no genera viaje y lo recuerda para no volver a abrirlo"""
+        mensaje.marcar_leido()
+        mensajes_procesados.registrar(mensaje.clave, resultado, prefactura)
+    
+    def _descargar_adjuntos(self, mensaje):
+        """
+        Fase del hilo de correo: validaciones del mensaje y descarga de los .xls
+
+        Returns:
+            dict: {'prefactura', 'determinante', 'asunto', 'adjuntos'} o None si el correo se descarta
+        """
+        if self.ya_fue_procesado_correo_csv(mensaje):
+            logger.info("Saltando correo ya procesado (encontrado en CSV)")
+            self._descartar_correo(mensaje, 'duplicado')
+            return None
+        
+        asunto = mensaje.asunto
+        remitente = mensaje.remitente
+        
+        if not remitente or "PreFacturacionTransportes@walmart.com" not in remitente:
+            return None
             
-            adjuntos = mensaje.Attachments
-            if adjuntos.Count == 0:
-                mensaje.UnRead = False
-                return None
+        if "cancelado" in asunto.lower() or "no-reply" in remitente.lower():
+            self._descartar_correo(mensaje, 'descartado')
+            return None
             
-            logger.info(f"Procesando correo NUEVO: {asunto}")
+        if not "prefactura" in asunto.lower():
+            self._descartar_correo(mensaje, 'descartado')
+            return None
+        
+        adjuntos = mensaje.adjuntos()
+        if not adjuntos:
+            self._descartar_correo(mensaje, 'descartado')
+            return None
+        
+        logger.info(f"Procesando correo NUEVO: {asunto}")
+        
+        prefactura = self.extraer_prefactura_del_asunto(asunto)
+        clave_determinante = self.extraer_clave_determinante(asunto)
+        
+        if not prefactura:
+            logger.warning(f"No se pudo extraer prefactura del asunto: {asunto}")
+            self._descartar_correo(mensaje, 'descartado')
+            return None
             
-            prefactura = self.extraer_prefactura_del_asunto(asunto)
-            clave_determinante = self.extraer_clave_determinante(asunto)
+        if not clave_determinante:
+            logger.warning(f"No se pudo extraer clave determinante del asunto: {asunto}")
+            self._descartar_correo(mensaje, 'descartado', prefactura)
+            return None
+        
+        archivos_xls = []
+        for archivo in adjuntos:
+            nombre = archivo.nombre
             
-            if not prefactura:
-                logger.warning(f"No se pudo extraer prefactura del asunto: {asunto}")
-                mensaje.UnRead = False
-                return None
-                
-            if not clave_determinante:
-                logger.warning(f"No se pudo extraer clave determinante del asunto: {asunto}")
-                mensaje.UnRead = False
-                return None
+            if not nombre.endswith(".xls"):
+                continue
             
-            for i in range(1, adjuntos.Count + 1):
-                archivo = adjuntos.Item(i)
-                nombre = archivo.FileName
-                
-                if not nombre.endswith(".xls"):
-                    continue
-                
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                nombre_unico = f"{timestamp}_{nombre}"
-                ruta_local = os.path.join(self.carpeta_descarga, nombre_unico)
+            try:
+                contenido = archivo.obtener_bytes()
+                huella = huella_contenido(contenido)
                 
-                try:
-                    archivo.SaveAsFile(ruta_local)
-                    logger.info(f"Archivo descargado: {ruta_local}")
-                except Exception as e:
-                    logger.error(f"Error al descargar archivo {nombre}: {e}")
-                    mensaje.UnRead = False
+                # Reenvío de un XLS ya parseado: ni se escribe a disco ni se vuelve a parsear
+                registros = cache_adjuntos.obtener_parseo(huella, clave_determinante)
+                if registros is not None:
+                    logger.info(f"Adjunto ya conocido ({huella[:12]}): usando resultado en cache")
+                    archivos_xls.append({'ruta': None, 'huella': huella, 'registros': registros})
                     continue
                 
-                resultado = parse_xls(ruta_local, determinante_from_asunto=clave_determinante)
-                
-                if "error" in resultado:
-                    logger.warning(f"Archivo no válido: {resultado['error']}")
-                    os.remove(ruta_local)
-                    
-                    if "no es tipo VACIO" in resultado['error']:
-                        logger.info("Correo válido pero viaje no es tipo VACIO - marcando como leído")
-                        mensaje.UnRead = False
-                        return None
-                    else:
-                        mensaje.UnRead = False
-                        continue
-                
-                resultado["prefactura"] = prefactura
-                resultado["fecha"] = self.convertir_fecha_formato(resultado.get("fecha"))
-                resultado["archivo_descargado"] = ruta_local
+                # Nombre por huella: copias idénticas del mismo XLS son un solo archivo
+                ruta_local = cache_adjuntos.guardar_archivo(contenido, self.carpeta_descarga, nombre, huella)
+                logger.info(f"Archivo descargado: {ruta_local}")
+                archivos_xls.append({'ruta': ruta_local, 'huella': huella})
+            except Exception as e:
+                logger.error(f"Error al descargar archivo {nombre}: {e}")
+                mensaje.marcar_leido()
+                continue
+        
+        if not archivos_xls:
+            return None
+        
+        return {
+            'prefactura': prefactura,
+            'determinante': clave_determinante,
+            'asunto': asunto,
+            'adjuntos': archivos_xls
+        }
+    
+    def _interpretar_parseo(self, mensaje, preparado, resultados):
+        """
+        Fase del hilo de correo: decide con los viajes de cada XLS (en orden de adjunto)
+
+        El primer XLS con viajes VACIO válidos aporta el viaje de la prefactura del
+        asunto (viaje_de_prefactura): una prefactura es un solo viaje en la cola, el log
+        y prefacturarobot; si el XLS trae más, sus filas se reportan para captura manual.
+
+        Args:
+            resultados: Iterable de (ruta, registros de iterar_viajes_xls)
 
-                logger.info(f"Viaje extraído: {resultado['prefactura']} | "
-                           f"Fecha:{resultado['fecha']} | Tractor:{resultado['placa_tractor']} | "
-                           f"Remolque:{resultado['placa_remolque']} | Det:{resultado['clave_determinante']} | ${resultado['importe']}")
+        Returns:
+            list: Viaje listo para la cola (vacía si el correo se descarta)
+        """
+        viajes = []
+        
+        for ruta_local, registros in resultados:
+            validos = [registro for registro in registros if "error" not in registro]
+            for registro in registros:
+                if "error" in registro:
+                    fila = f"Fila {registro['fila']}" if registro.get('fila') else "Archivo"
+                    logger.warning(f"{fila} no válida: {registro['error']}")
+            
+            if not validos:
+                mensaje.marcar_leido()
+                if any("no es tipo VACIO" in registro['error'] for registro in registros):
+                    logger.info("Correo válido pero viaje no es tipo VACIO - marcando como leído")
+                    mensajes_procesados.registrar(mensaje.clave, 'no_vacio', preparado['prefactura'])
+                    break
+                continue
+            
+            viaje = viaje_de_prefactura(validos, preparado['prefactura'])
+            viaje["fecha"] = self.convertir_fecha_formato(viaje.get("fecha"))
+            viaje["archivo_descargado"] = ruta_local
+            
+            logger.info(f"Viaje extraído: {viaje['prefactura']} (fila {viaje.get('fila')}) | "
+                       f"Fecha:{viaje['fecha']} | Tractor:{viaje['placa_tractor']} | "
+                       f"Remolque:{viaje['placa_remolque']} | Det:{viaje['clave_determinante']} | ${viaje['importe']}")
+            viajes.append(viaje)
+            break
+        
+        return viajes
+    
+    def _limpiar_adjuntos_sin_uso(self, preparados):
+        """
+        Borra los XLS descargados en el ciclo que ningún viaje de la cola usa
 
-                return resultado
+        Se hace al final del ciclo, ya con los viajes en cola: los archivos llevan nombre
+        por huella, así que otro correo del mismo ciclo (o un viaje encolado antes) puede
+        estar usando el mismo archivo que este correo no necesitó.
+        """
+        rutas = {adjunto['ruta'] for preparado in preparados for adjunto in preparado['adjuntos'] if adjunto['ruta']}
+        for ruta in rutas:
+            if archivo_en_uso_cola(ruta):
+                continue
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+    
+    def extraer_datos_de_correo(self, mensaje):
+        """
+        Extracción secuencial de un solo correo (descarga + parseo en el hilo actual)
+
+        Returns:
+            list: Datos del viaje agregado a la cola (vacía si no se agregó)
+        """
+        try:
+            preparado = self._descargar_adjuntos(mensaje)
+            if not preparado:
+                return []
+            
+            def resultados():
+                for adjunto in preparado['adjuntos']:
+                    registros = adjunto.get('registros')
+                    if registros is None:
+                        registros = leer_viajes_xls(adjunto['ruta'], preparado['determinante'])
+                        cache_adjuntos.guardar_parseo(adjunto['huella'], preparado['determinante'], registros)
+                    yield adjunto['ruta'], registros
+            
+            viajes = self._interpretar_parseo(mensaje, preparado, resultados())
+            agregadas = self._encolar_viajes([(mensaje, viajes)]) if viajes else set()
+            self._limpiar_adjuntos_sin_uso([preparado])
+            return [viaje for viaje in viajes if viaje['prefactura'] in agregadas]
                 
         except KeyboardInterrupt:
             logger.info("Interrupción manual - no marcando correo como leído")
@@ -287,98 +402,174 @@ class AlsuaMailAutomation:
         except Exception as e:
             logger.error(f"Error inesperado al procesar correo: {e}")
             try:
-                mensaje.UnRead = False
+                mensaje.marcar_leido()
             except:
                 pass
-            return None
-            
-        return None
+            return []
     
-    def revisar_y_extraer_correos(self, limite_viajes=3):
+    def _encolar_viajes(self, viajes_por_correo):
+        """
+        Agrega a la cola en un solo lote los viajes de varios correos
+
+        Solo se marcan leídos (y se registran como 'ingresado') los correos cuyo
+        viaje quedó encolado.
+
+        Args:
+            viajes_por_correo: Lista de (mensaje, [datos de viaje])
+
+        Returns:
+            set: Prefacturas agregadas a la cola
+        """
+        agregadas = agregar_viajes_a_cola([viaje for _, viajes in viajes_por_correo for viaje in viajes])
+        for mensaje, viajes in viajes_por_correo:
+            encolados = [viaje['prefactura'] for viaje in viajes if viaje['prefactura'] in agregadas]
+            for viaje in viajes:
+                if viaje['prefactura'] in agregadas:
+                    logger.info(f"Viaje agregado a cola: {viaje['prefactura']}")
+                else:
+                    logger.warning(f"No se pudo agregar viaje a cola: {viaje.get('prefactura')}")
+            if encolados:
+                mensajes_procesados.registrar(mensaje.clave, 'ingresado', encolados[0])
+                mensaje.marcar_leido()
+        return agregadas
+    
+    def _obtener_pool_parseo(self):
+        """Pool de parseo de XLS (se crea una vez y se reutiliza entre ciclos)"""
+        if self._pool_parseo is None:
+            trabajadores = INGESTA_CONFIG['trabajadores_parseo']
+            if INGESTA_CONFIG['usar_procesos']:
+                try:
+                    self._pool_parseo = ProcessPoolExecutor(max_workers=trabajadores)
+                except Exception as e:
+                    logger.warning(f"No se pudo crear pool de procesos ({e}) - usando hilos")
+            if self._pool_parseo is None:
+                self._pool_parseo = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="parse-xls")
+        return self._pool_parseo
+    
+    def cerrar_pool_parseo(self):
+        if self._pool_parseo is not None:
+            self._pool_parseo.shutdown(wait=False, cancel_futures=True)
+            self._pool_parseo = None
+    
+    def _resultado_parseo(self, futuro, adjunto, determinante):
+        """Viajes de un XLS parseado en el pool (copia propia); si el pool falla se parsea en este hilo"""
+        if adjunto.get('registros') is not None:
+            return adjunto['registros']
         try:
-            if not self.inicializar_com():
-                logger.error("No se pudo inicializar COM")
-                return False
-            
-            logger.info(f"Revisando correos (máximo {limite_viajes} viajes)...")
-            
-            try:
-                outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
-                inbox = outlook.GetDefaultFolder(6)
-                logger.info("Conexión a Outlook establecida exitosamente")
-            except Exception as e:
-                logger.error(f"Error conectando a Outlook: {e}")
+            registros = futuro.result(timeout=INGESTA_CONFIG['timeout_parseo_segundos'])
+        except Exception as e:
+            logger.warning(f"Parseo en pool falló ({type(e).__name__}: {e}) - parseando en línea")
+            if isinstance(e, BrokenExecutor):
+                self.cerrar_pool_parseo()
+            registros = leer_viajes_xls(adjunto['ruta'], determinante)
+        cache_adjuntos.guardar_parseo(adjunto['huella'], determinante, registros)
+        # El mismo futuro puede servir a varios correos con el mismo XLS
+        return [dict(registro) for registro in registros]
+    
+    def revisar_y_extraer_correos(self, limite_viajes=None):
+        """
+        Ingesta productor/consumidor: el hilo de correo descarga adjuntos mientras el pool
+        parsea los XLS en paralelo; los viajes válidos se agregan a la cola en un solo lote
+
+        Args:
+            limite_viajes: Máximo de correos a extraer en el ciclo (None = lo decide el
+                ControladorIngesta según la cola, el throughput y el backlog del correo)
+        """
+        try:
+            logger.info("Revisando correos...")
+
+            if not self.fuente_correo.conectar():
+                logger.error(f"No se pudo abrir la fuente de correo ({self.fuente_correo.nombre})")
                 return False
-            
-            mensajes = inbox.Items.Restrict("[UnRead] = True")
-            mensajes.Sort("[ReceivedTime]", True)
-            
-            correos_totales = mensajes.Count
+
+            # Solo llegan los correos de prefactura (remitente/asunto/adjuntos ya filtrados)
+            mensajes = list(self.fuente_correo.mensajes_no_leidos(FILTRO_PREFACTURAS))
             viajes_extraidos = 0
             correos_saltados = 0
             
-            logger.info(f"Correos no leídos encontrados: {correos_totales}")
+            logger.info(f"Correos de prefactura no leídos encontrados: {len(mensajes)}")
+            
+            if limite_viajes is None and mensajes:
+                limite_viajes = self.controlador_ingesta.calcular_lote(self._pendientes_en_cola(), len(mensajes))
+                logger.info(f"Lote de ingesta: {limite_viajes} de {len(mensajes)} correos")
+                if limite_viajes == 0:
+                    return False
             
+            # Productor: descarga en el hilo de correo y manda cada XLS al pool al momento
+            pool = self._obtener_pool_parseo()
+            en_proceso = []
+            en_vuelo = {}   # (huella, determinante) -> futuro: XLS repetidos en el ciclo se parsean una vez
             for mensaje in mensajes:
-                if viajes_extraidos >= limite_viajes:
-                    logger.info(f"Límite alcanzado: {limite_viajes} viajes extraídos")
+                if limite_viajes and len(en_proceso) >= limite_viajes:
+                    logger.info(f"Límite alcanzado: {limite_viajes} correos en extracción")
                     break
 
                 try:
-                    remitente = mensaje.SenderEmailAddress or ""
-                    if "PreFacturacionTransportes@walmart.com" not in remitente:
+                    # Correos ya manejados (en esta u otra ejecución): rechazo O(1) por Message-ID
+                    if mensajes_procesados.contiene(mensaje.clave):
+                        logger.info(f"Correo ya manejado anteriormente: {mensaje.asunto}")
+                        mensaje.marcar_leido()
+                        correos_saltados += 1
                         continue
 
-                    asunto = mensaje.Subject or ""
-                    prefactura = self.extraer_prefactura_del_asunto(asunto)
+                    prefactura = self.extraer_prefactura_del_asunto(mensaje.asunto)
 
                     if prefactura in self.emails_fallidos and self.emails_fallidos[prefactura] >= 3:
-                        try:
-                            carpeta_problemas = inbox.Folders("Problemas")
-                        except:
-                            carpeta_problemas = inbox.Folders.Add("Problemas")
-
-                        mensaje.Move(carpeta_problemas)
+                        mensaje.mover_a("Problemas")
+                        mensajes_procesados.registrar(mensaje.clave, 'problemas', prefactura)
                         correos_saltados += 1
                         continue
 
                     logger.info(f"Extrayendo viaje: {prefactura}")
-                    datos_viaje = self.extraer_datos_de_correo(mensaje)
-
-                    if datos_viaje:
-                        if isinstance(datos_viaje, list):
-                            correos_saltados += 1
-                            self.emails_fallidos[prefactura] = self.emails_fallidos.get(prefactura, 0) + 1
-                            continue
+                    preparado = self._descargar_adjuntos(mensaje)
+                    if not preparado:
+                        correos_saltados += 1
+                        continue
 
-                        if not isinstance(datos_viaje, dict):
-                            correos_saltados += 1
-                            self.emails_fallidos[prefactura] = self.emails_fallidos.get(prefactura, 0) + 1
+                    futuros = []
+                    for adjunto in preparado['adjuntos']:
+                        if adjunto.get('registros') is not None:
+                            futuros.append(None)
                             continue
+                        clave = (adjunto['huella'], preparado['determinante'])
+                        if clave not in en_vuelo:
+                            en_vuelo[clave] = pool.submit(leer_viajes_xls, adjunto['ruta'], preparado['determinante'])
+                        futuros.append(en_vuelo[clave])
+                    en_proceso.append((mensaje, preparado, futuros))
 
-                        if agregar_viaje_a_cola(datos_viaje):
-                            viajes_extraidos += 1
-                            logger.info(f"Viaje agregado a cola: {datos_viaje['prefactura']}")
-
-                            mensaje.UnRead = False
-                        else:
-                            logger.warning(f"No se pudo agregar viaje a cola: {datos_viaje.get('prefactura')}")
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error procesando mensaje individual: {e}")
+                    correos_saltados += 1
+                    self._registrar_correo_fallido(mensaje)
+            
+            # Consumidor: resultados en el orden de los correos
+            viajes_listos = []
+            for mensaje, preparado, futuros in en_proceso:
+                try:
+                    # Generador: si el primer XLS es válido no se espera a los demás
+                    resultados = (
+                        (adjunto['ruta'], self._resultado_parseo(futuro, adjunto, preparado['determinante']))
+                        for adjunto, futuro in zip(preparado['adjuntos'], futuros)
+                    )
+                    viajes = self._interpretar_parseo(mensaje, preparado, resultados)
+                    if viajes:
+                        viajes_listos.append((mensaje, viajes))
                     else:
                         correos_saltados += 1
-
                 except Exception as e:
                     logger.error(f"Error procesando mensaje individual: {e}")
                     correos_saltados += 1
-                    try:
-                        asunto = mensaje.Subject or ""
-                        prefactura = self.extraer_prefactura_del_asunto(asunto)
-                        self.emails_fallidos[prefactura] = self.emails_fallidos.get(prefactura, 0) + 1
-                    except:
-                        pass
-                    continue
+                    self._registrar_correo_fallido(mensaje)
+            
+            # Un solo lote a la cola con los viajes de todos los correos del ciclo
+            if viajes_listos:
+                viajes_extraidos = len(self._encolar_viajes(viajes_listos))
+            self._limpiar_adjuntos_sin_uso([preparado for _, preparado, _ in en_proceso])
             
             logger.info(f"Extracción completada:")
-            logger.info(f"   Correos revisados: {correos_totales}")
+            logger.info(f"   Correos revisados: {len(mensajes)}")
             logger.info(f"   Viajes extraídos: {viajes_extraidos}")
             logger.info(f"   Correos saltados: {correos_saltados}")
             
@@ -386,9 +577,21 @@ class AlsuaMailAutomation:
             
         except Exception as e:
             logger.error(f"Error revisando correos: {e}")
+            self.fuente_correo.registrar_error(e)
             return False
         finally:
-            self.limpiar_com()
+            self.fuente_correo.cerrar()
+    
+    def _pendientes_en_cola(self):
+        resumen = obtener_resumen_cola()
+        return sum(1 for v in resumen.get('viajes', []) if v.get('estado') == 'pendiente')
+    
+    def _registrar_correo_fallido(self, mensaje):
+        try:
+            prefactura = self.extraer_prefactura_del_asunto(mensaje.asunto)
+            self.emails_fallidos[prefactura] = self.emails_fallidos.get(prefactura, 0) + 1
+        except:
+            pass
     
     def crear_driver_nuevo(self):
         try:
@@ -434,26 +637,22 @@ class AlsuaMailAutomation:
         """
         ahora = datetime.now()
 
-        # Registrar intento actual
-        if prefactura not in self.historial_procesamiento:
-            self.historial_procesamiento[prefactura] = []
-
-        self.historial_procesamiento[prefactura].append(ahora)
-
-        # Limpiar intentos antiguos (fuera de la ventana)
+        # Limpiar intentos antiguos (fuera de la ventana) y registrar el actual
         ventana_inicio = ahora - timedelta(minutes=ventana_minutos)
-        self.historial_procesamiento[prefactura] = [
-            ts for ts in self.historial_procesamiento[prefactura]
-            if ts >= ventana_inicio
-        ]
+        historial = [datetime.fromisoformat(ts) for ts in self.historial_procesamiento.get(prefactura, [])]
+        historial = [ts for ts in historial if ts >= ventana_inicio] + [ahora]
+
+        # La entrada vence con la ventana: prefacturas viejas no se acumulan
+        estado_runtime.guardar('historial_procesamiento', prefactura,
+                               [ts.isoformat() for ts in historial], ttl_segundos=ventana_minutos * 60)
 
         # Contar intentos en la ventana
-        intentos_recientes = len(self.historial_procesamiento[prefactura])
+        intentos_recientes = len(historial)
 
         if intentos_recientes > max_intentos_ventana:
             logger.error(f"LOOP INFINITO DETECTADO: Viaje {prefactura} procesado {intentos_recientes} veces en {ventana_minutos} minutos")
             debug_logger.error(f"[{prefactura}] LOOP INFINITO: {intentos_recientes} intentos en {ventana_minutos} min")
-            debug_logger.error(f"[{prefactura}] Timestamps: {[ts.strftime('%H:%M:%S') for ts in self.historial_procesamiento[prefactura]]}")
+            debug_logger.error(f"[{prefactura}] Timestamps: {[ts.strftime('%H:%M:%S') for ts in historial]}")
 
             # Enviar alerta por email
             try:
@@ -484,36 +683,43 @@ class AlsuaMailAutomation:
         return 'DRIVER_CORRUPTO'
     
     def procesar_viaje_individual(self, viaje_registro):
+        self._viaje_en_gm = False
         try:
             viaje_id = viaje_registro.get('id')
             datos_viaje = viaje_registro.get('datos_viaje', {})
             prefactura = datos_viaje.get('prefactura', 'DESCONOCIDA')
-
-            # VERIFICACIÓN DE DETERMINANTE: Revisar si existe antes de procesar
             determinante = datos_viaje.get('clave_determinante')
-            if determinante and not verificar_determinante_existe(determinante):
-                logger.error(f"DETERMINANTE {determinante} NO EXISTE en clave_ruta_base.csv - Viaje {prefactura}")
-                debug_logger.error(f"[{prefactura}] Determinante {determinante} no encontrada en clave_ruta_base.csv")
+
+            # Prevalidación (determinante, duplicados, fecha/importe): normalmente ya se
+            # calculó mientras corría el viaje anterior
+            prevalidacion = self.prevalidador.tomar(viaje_registro)
+            for advertencia in prevalidacion['advertencias']:
+                debug_logger.warning(f"[{prefactura}] Prevalidación: {advertencia}")
+
+            if prevalidacion['falla']:
+                modulo_falla, motivo_falla = prevalidacion['falla']
+                logger.error(f"{motivo_falla} - Viaje {prefactura}")
+                debug_logger.error(f"[{prefactura}] Prevalidación: {motivo_falla}")
 
                 # Registrar como fallido en viajes_log.csv
                 log_viaje_fallido(
                     prefactura=prefactura,
-                    motivo_fallo=f"Determinante {determinante} no existe en clave_ruta_base.csv",
+                    motivo_fallo=motivo_falla,
                     determinante=determinante,
-                    fecha_viaje=datos_viaje.get('fecha_viaje', ''),
+                    fecha_viaje=datos_viaje.get('fecha', ''),
                     placa_tractor=datos_viaje.get('placa_tractor', ''),
                     placa_remolque=datos_viaje.get('placa_remolque', ''),
-                    monto_viaje=datos_viaje.get('monto_viaje', ''),
+                    importe=datos_viaje.get('importe', ''),
                     cliente_codigo=datos_viaje.get('cliente_codigo', '')
                 )
 
                 # Marcar como fallido en cola
-                marcar_viaje_fallido_cola(viaje_id, 'determinante_no_existe', f"Determinante {determinante} no existe")
+                marcar_viaje_fallido_cola(viaje_id, modulo_falla, motivo_falla)
 
                 # Actualizar robot_state_manager
-                robot_state_manager.incrementar_fallidos(prefactura, f"Determinante {determinante} no existe")
+                robot_state_manager.incrementar_fallidos(prefactura, motivo_falla)
 
-                return 'VIAJE_FALLIDO', 'determinante_no_existe'
+                return 'VIAJE_FALLIDO', modulo_falla
 
             # DETECCIÓN DE LOOP INFINITO: Verificar si este viaje se está procesando repetidamente
             if self.detectar_loop_infinito(prefactura, max_intentos_ventana=10, ventana_minutos=5):
@@ -536,20 +742,25 @@ class AlsuaMailAutomation:
 
             # LOGGING DETALLADO: Verificación de duplicados
             debug_logger.info(f"[{prefactura}] Paso 2/7: Verificando duplicados en viajes_log.csv")
-            try:
-                viaje_existente = viajes_log.verificar_viaje_existe(prefactura)
-                if viaje_existente and viaje_existente.get('estatus') == 'EXITOSO':
-                    logger.warning(f"DUPLICADO DETECTADO: {prefactura} ya fue procesado exitosamente - saltando")
-                    debug_logger.warning(f"[{prefactura}] DUPLICADO EXITOSO encontrado en viajes_log.csv")
-                    robot_state_manager.limpiar_viaje_actual()
-                    return 'EXITOSO', 'duplicado_detectado'
-                elif viaje_existente and viaje_existente.get('estatus') == 'FALLIDO':
-                    logger.info(f"REPROCESANDO: {prefactura} falló anteriormente - reintentando")
-                    debug_logger.info(f"[{prefactura}] Viaje fallido encontrado, reprocesando")
-                debug_logger.info(f"[{prefactura}] No es duplicado, continuando")
-            except Exception as e:
-                logger.error(f"Error verificando duplicados: {e}")
-                debug_logger.error(f"[{prefactura}] ERROR verificando duplicados: {e}")
+            viaje_existente = prevalidacion['registro_log']
+            if viaje_existente and viaje_existente.get('estatus') == 'EXITOSO':
+                logger.warning(f"DUPLICADO DETECTADO: {prefactura} ya fue procesado exitosamente - saltando")
+                debug_logger.warning(f"[{prefactura}] DUPLICADO EXITOSO encontrado en viajes_log.csv")
+                robot_state_manager.limpiar_viaje_actual()
+                return 'EXITOSO', 'duplicado_detectado'
+            if prevalidacion['facturada']:
+                logger.warning(f"DUPLICADO DETECTADO: {prefactura} ya está facturada en prefacturarobot - saltando")
+                debug_logger.warning(f"[{prefactura}] Prefactura facturada en prefacturarobot")
+                robot_state_manager.limpiar_viaje_actual()
+                return 'EXITOSO', 'duplicado_detectado'
+            if viaje_existente and viaje_existente.get('estatus') == 'FALLIDO':
+                logger.info(f"REPROCESANDO: {prefactura} falló anteriormente - reintentando")
+                debug_logger.info(f"[{prefactura}] Viaje fallido encontrado, reprocesando")
+            debug_logger.info(f"[{prefactura}] No es duplicado, continuando")
+
+            # Fecha e importe ya normalizados por la prevalidación
+            datos_viaje.update(prevalidacion['datos_normalizados'])
+            self._viaje_en_gm = True
 
             logger.info(f"Procesando viaje: {prefactura}")
 
@@ -619,12 +830,7 @@ class AlsuaMailAutomation:
                 elif resultado:
                     logger.info(f"Viaje completado exitosamente: {prefactura}")
                     logger.info("Datos completos (UUID, Viaje GM, placas) registrados automáticamente")
-                    logger.info("Sincronizando a MySQL...")
-                    try:
-                        stats = self.mysql_sync.sincronizar_desde_csv()
-                        logger.info(f"MySQL sincronizado - Exitosos: {stats['exitosos']}, Fallidos: {stats['fallidos']}")
-                    except Exception as e:
-                        logger.error(f"Error sincronizando a MySQL: {e}")
+                    # La sincronización a MySQL la hace el sync worker en segundo plano
 
                     # Actualizar estado: viaje exitoso
                     robot_state_manager.incrementar_exitosos(prefactura)
@@ -635,8 +841,10 @@ class AlsuaMailAutomation:
                     self.ultimo_viaje_exitoso_prefactura = prefactura
                     self.alerta_enviada = False  # Resetear para permitir nueva alerta si vuelve a trabarse
 
+                    # Los viajes de un mismo XLS comparten el archivo: se borra con el último
                     archivo_descargado = datos_viaje.get('archivo_descargado')
-                    if archivo_descargado and os.path.exists(archivo_descargado):
+                    if (archivo_descargado and os.path.exists(archivo_descargado)
+                            and not archivo_en_uso_cola(archivo_descargado, excluir_id=viaje_id)):
                         os.remove(archivo_descargado)
                         logger.info(f"Archivo limpiado: {os.path.basename(archivo_descargado)}")
 
@@ -726,6 +934,16 @@ class AlsuaMailAutomation:
         else:
             return 'modulo_desconocido'
     
+    def _registrar_ritmo(self, resultado, inicio_viaje):
+        """
+        Registra en control_ritmo solo los viajes que llegaron a GM
+
+        Un duplicado, una falla de prevalidación o un loop detectado terminan sin abrir
+        GM: su duración y resultado no dicen nada de la salud de GM ni ameritan pausa.
+        """
+        if self._viaje_en_gm:
+            self.control_ritmo.registrar_viaje(resultado, time.monotonic() - inicio_viaje)
+
     def procesar_cola_viajes(self):
         try:
             logger.info("Iniciando procesamiento de cola de viajes...")
@@ -741,31 +959,27 @@ class AlsuaMailAutomation:
                 datos_viaje = viaje_registro.get('datos_viaje', {})
                 prefactura = datos_viaje.get('prefactura', 'DESCONOCIDA')
                 
+                inicio_viaje = time.monotonic()
                 resultado, modulo_error = self.procesar_viaje_individual(viaje_registro)
+                self._registrar_ritmo(resultado, inicio_viaje)
                 
                 if resultado == 'EXITOSO':
                     marcar_viaje_exitoso_cola(viaje_id)
                     logger.info(f"Viaje {prefactura} completado y removido de cola")
-
-                    logger.info("Esperando 5 segundos antes del siguiente viaje...")
-                    time.sleep(5)
                     
                 elif resultado == 'LOGIN_LIMIT':
                     registrar_error_reintentable_cola(viaje_id, 'LOGIN_LIMIT', f'Límite de usuarios en {modulo_error}')
-                    logger.warning(f"Límite de usuarios - {prefactura} reintentará en 15 minutos")
+                    logger.warning(f"Límite de usuarios - {prefactura} reintentará tras la pausa")
 
-                    # Cerrar Chrome antes de espera larga para evitar sesión expirada de GM Transport
+                    # Cerrar Chrome antes de la espera para evitar sesión expirada de GM Transport
                     if self.driver:
-                        logger.info("Cerrando Chrome para evitar sesión expirada durante espera de 15 min...")
+                        logger.info("Cerrando Chrome para evitar sesión expirada durante la espera...")
                         try:
                             self.driver.quit()
                         except:
                             pass
                         finally:
                             self.driver = None
-
-                    logger.info("Esperando 15 minutos por límite de usuarios...")
-                    time.sleep(15 * 60)
                     
                 elif resultado == 'DRIVER_CORRUPTO':
                     registrar_error_reintentable_cola(viaje_id, 'DRIVER_CORRUPTO', f'Driver corrupto en {modulo_error}')
@@ -776,8 +990,8 @@ class AlsuaMailAutomation:
                     marcar_viaje_fallido_cola(viaje_id, modulo_error, motivo_detallado)
                     logger.error(f"{prefactura} FALLÓ EN: {modulo_error} - removido de cola")
 
-                    logger.info("Esperando 30 segundos después de viaje fallido...")
-                    time.sleep(30)
+                if self._viaje_en_gm:
+                    self.control_ritmo.pausar(resultado)
             
         except KeyboardInterrupt:
             logger.info("Interrupción manual del procesamiento")
@@ -799,184 +1013,201 @@ class AlsuaMailAutomation:
         except Exception as e:
             logger.warning(f"Error obteniendo estadísticas de cola: {e}")
     
-    def ejecutar_bucle_continuo(self, mostrar_debug=False):
-        from cola_viajes import resetear_viajes_atascados
-        viajes_reseteados = resetear_viajes_atascados()
-        if viajes_reseteados > 0:
-            logger.warning(f"Se resetearon {viajes_reseteados} viajes atascados")
+    def _verificar_viaje_stuck(self):
+        """
+        Watchdog: viaje en proceso sin cambio de fase por MINUTOS_SIN_AVANCE_VIAJE
 
-        robot_state_manager.actualizar_estado_robot("ejecutando")
-        debug_logger.info("Iniciando bucle continuo de automatización")
+        Solo actúa si la tarea de procesamiento sigue ocupada. No toca el driver (este
+        hilo no es el de Selenium): pide abortar y el hilo de procesamiento cierra
+        Chrome al regresar del viaje (_atender_aborto).
+        """
+        if not (self.orquestador and self.orquestador.tarea_en_curso('procesamiento_viajes')):
+            return
+        if self._abortar_viaje.is_set():
+            return
+
+        viaje_actual, minutos_sin_avance = robot_state_manager.obtener_avance_viaje()
+        if not viaje_actual or minutos_sin_avance is None or minutos_sin_avance < MINUTOS_SIN_AVANCE_VIAJE:
+            return
+
+        mensaje = (f"Viaje {viaje_actual.get('prefactura', 'DESCONOCIDO')} sin avance desde hace "
+                   f"{int(minutos_sin_avance)} min en fase '{viaje_actual.get('fase', 'DESCONOCIDA')}' - "
+                   f"se pide abortarlo")
+        logger.error(mensaje)
+        debug_logger.error(mensaje)
+        self._abortar_viaje.set()
+
+    def _atender_aborto(self, prefactura, resultado):
+        """En el hilo de procesamiento: si el watchdog pidió abortar, Chrome se reinicia aquí"""
+        if not self._abortar_viaje.is_set():
+            return
+        self._abortar_viaje.clear()
+        if resultado == 'EXITOSO' or not self.driver:
+            logger.info(f"Aborto pedido por el watchdog para {prefactura}: el viaje ya terminó ({resultado})")
+            return
+
+        logger.warning(f"Aborto pedido por el watchdog para {prefactura} - cerrando Chrome")
+        try:
+            self.driver.quit()
+        except:
+            pass
+        finally:
+            self.driver = None
 
-        self.mostrar_estadisticas_inicio()
+    def _verificar_alerta_sin_trabajo(self):
+        """Alerta por email si el robot lleva 15 horas sin procesar viajes"""
+        horas_sin_trabajar = (datetime.now() - self.ultimo_viaje_exitoso_timestamp).total_seconds() / 3600
+
+        if horas_sin_trabajar >= 15 and not self.alerta_enviada:
+            logger.error(f"⚠️ ROBOT SIN TRABAJAR: {horas_sin_trabajar:.1f} horas sin procesar viajes")
+            debug_logger.error(f"Robot lleva {horas_sin_trabajar:.1f}h sin procesar viajes - enviando alerta")
+
+            # Enviar email de alerta
+            if enviar_alerta_robot_trabado(horas_sin_trabajar, self.ultimo_viaje_exitoso_prefactura):
+                self.alerta_enviada = True
+                logger.info("✅ Alerta por email enviada exitosamente")
+            else:
+                logger.warning("⚠️ No se pudo enviar alerta por email")
 
+    def _procesar_siguiente_viaje(self):
+        """Un paso del procesamiento: el siguiente viaje de la cola, o esperar a la ingesta"""
+        self._ciclos_procesamiento += 1
+        if self._mostrar_debug:
+            logger.info(f"Ciclo #{self._ciclos_procesamiento}")
+
+        # Entre viajes: un viaje que quedó marcado en proceso (ej. tras un crash) se libera
         try:
-            contador_ciclos = 0
-            contador_sync_mysql = 0
-            ultimo_sync_mysql = time.time()
-            ultima_cant_viajes = -1  # Para tracking de cambios en cola
+            limpiado, mensaje = robot_state_manager.verificar_y_limpiar_viaje_stuck(timeout_minutos=10)
+            if limpiado:
+                logger.error(mensaje)
+                debug_logger.error(mensaje)
+                # Si se limpió un viaje stuck, agregar pausa para estabilidad
+                time.sleep(30)
+        except Exception as e:
+            logger.warning(f"Error verificando viajes stuck: {e}")
 
-            while AlsuaMailAutomation.continuar_ejecutando:
-                # La variable de clase controla la ejecución
+        viaje_registro = obtener_siguiente_viaje_cola()
 
-                try:
-                    contador_ciclos += 1
-                    if mostrar_debug:
-                        logger.info(f"Ciclo #{contador_ciclos}")
+        if not viaje_registro:
+            # Cola vacía: esperar a que la ingesta agregue viajes (sin polling del correo);
+            # si el último lote dejó correos en espera se piden ya
+            if self.controlador_ingesta.obtener_metricas()['correos_en_espera'] > 0:
+                self.ingestor.solicitar_revision()
+            if self.ingestor.esperar_viajes(timeout=10):
+                logger.info("Nuevos viajes agregados a cola por la ingesta de correo")
+            return
 
-                    # Verificar viajes stuck (timeout: 10 minutos)
-                    try:
-                        limpiado, mensaje = robot_state_manager.verificar_y_limpiar_viaje_stuck(timeout_minutos=10)
-                        if limpiado:
-                            logger.error(mensaje)
-                            debug_logger.error(mensaje)
-                            # Si se limpió un viaje stuck, agregar pausa para estabilidad
-                            time.sleep(30)
-                    except Exception as e:
-                        logger.warning(f"Error verificando viajes stuck: {e}")
+        viaje_id = viaje_registro.get('id')
+        datos_viaje = viaje_registro.get('datos_viaje', {})
+        prefactura = datos_viaje.get('prefactura', 'DESCONOCIDA')
 
-                    # Verificar si el robot lleva 15 horas sin procesar viajes (sistema de alertas)
-                    try:
-                        ahora = datetime.now()
-                        horas_sin_trabajar = (ahora - self.ultimo_viaje_exitoso_timestamp).total_seconds() / 3600
-
-                        if horas_sin_trabajar >= 15 and not self.alerta_enviada:
-                            logger.error(f"⚠️ ROBOT SIN TRABAJAR: {horas_sin_trabajar:.1f} horas sin procesar viajes")
-                            debug_logger.error(f"Robot lleva {horas_sin_trabajar:.1f}h sin procesar viajes - enviando alerta")
-
-                            # Enviar email de alerta
-                            if enviar_alerta_robot_trabado(horas_sin_trabajar, self.ultimo_viaje_exitoso_prefactura):
-                                self.alerta_enviada = True
-                                logger.info("✅ Alerta por email enviada exitosamente")
-                            else:
-                                logger.warning("⚠️ No se pudo enviar alerta por email")
-                    except Exception as e:
-                        logger.warning(f"Error verificando tiempo sin trabajar: {e}")
+        logger.info(f"Procesando: {prefactura}")
 
-                    viaje_registro = obtener_siguiente_viaje_cola()
+        inicio_viaje = time.monotonic()
+        resultado, modulo_error = self.procesar_viaje_individual(viaje_registro)
+        self._registrar_ritmo(resultado, inicio_viaje)
+        self._atender_aborto(prefactura, resultado)
 
-                    # Actualizar cola en estado_robots.json (solo si cambia)
-                    try:
-                        from cola_viajes import leer_cola
-                        cola_actual = leer_cola()
-                        viajes = cola_actual.get('viajes', [])
-                        cant_actual = len(viajes)
-
-                        # Solo actualizar si la cantidad cambió
-                        if cant_actual != ultima_cant_viajes:
-                            if cant_actual > 0:
-                                viajes_pendientes = [
-                                    {
-                                        'prefactura': v.get('datos_viaje', {}).get('prefactura', 'N/A'),
-                                        'fecha': v.get('datos_viaje', {}).get('fecha', 'N/A'),
-                                        'placa_tractor': v.get('datos_viaje', {}).get('placa_tractor', 'N/A'),
-                                        'placa_remolque': v.get('datos_viaje', {}).get('placa_remolque', 'N/A')
-                                    }
-                                    for v in viajes
-                                    if v.get('estado') in ['pendiente', 'procesando']
-                                ]
-                                robot_state_manager.actualizar_cola(viajes_pendientes)
-                            else:
-                                robot_state_manager.actualizar_cola([])
-
-                            ultima_cant_viajes = cant_actual
-                    except:
-                        pass
+        # Throughput para el tamaño de lote de la ingesta; rellenar la cola si bajó del objetivo
+        self.controlador_ingesta.registrar_viaje_procesado()
+        if self.controlador_ingesta.necesita_viajes(self._pendientes_en_cola()):
+            self.ingestor.solicitar_revision()
 
-                    if viaje_registro:
-                        viaje_id = viaje_registro.get('id')
-                        datos_viaje = viaje_registro.get('datos_viaje', {})
-                        prefactura = datos_viaje.get('prefactura', 'DESCONOCIDA')
-
-                        logger.info(f"Procesando: {prefactura}")
-
-                        resultado, modulo_error = self.procesar_viaje_individual(viaje_registro)
-
-                        if resultado == 'EXITOSO':
-                            marcar_viaje_exitoso_cola(viaje_id)
-                            robot_state_manager.limpiar_viaje_actual()
-                            logger.info(f"{prefactura} COMPLETADO")
-
-                            # Actualizar timestamp del último viaje exitoso (para sistema de alertas)
-                            self.ultimo_viaje_exitoso_timestamp = datetime.now()
-                            self.ultimo_viaje_exitoso_prefactura = prefactura
-                            self.alerta_enviada = False
-
-                            contador_sync_mysql += 1
-                            time.sleep(60)
-
-                        elif resultado == 'LOGIN_LIMIT':
-                            registrar_error_reintentable_cola(viaje_id, 'LOGIN_LIMIT', f'Límite de usuarios en {modulo_error}')
-                            logger.warning(f"LOGIN LÍMITE - {prefactura}")
-                            time.sleep(15 * 60)
-
-                        elif resultado == 'DRIVER_CORRUPTO':
-                            registrar_error_reintentable_cola(viaje_id, 'DRIVER_CORRUPTO', f'Driver corrupto en {modulo_error}')
-                            robot_state_manager.limpiar_viaje_actual()
-                            logger.warning(f"DRIVER CORRUPTO - {prefactura}")
-
-                        else:
-                            motivo_detallado = f"PROCESO FALLÓ EN: {modulo_error}"
-                            marcar_viaje_fallido_cola(viaje_id, modulo_error, motivo_detallado)
-                            robot_state_manager.limpiar_viaje_actual()
-                            logger.error(f"{prefactura} FALLÓ: {modulo_error}")
-                            contador_sync_mysql += 1
-                            time.sleep(30)
-
-                        # Batch MySQL sync: cada 5 viajes o cada 10 minutos
-                        ahora = time.time()
-                        if contador_sync_mysql >= 5 or (ahora - ultimo_sync_mysql) > 600:
-                            from modules.mysql_simple import sincronizar_csv_a_mysql
-                            sincronizar_csv_a_mysql()
-                            contador_sync_mysql = 0
-                            ultimo_sync_mysql = ahora
-                    
-                    else:
-                        viajes_encontrados = self.revisar_y_extraer_correos(limite_viajes=3)
+        if resultado == 'EXITOSO':
+            marcar_viaje_exitoso_cola(viaje_id)
+            robot_state_manager.limpiar_viaje_actual()
+            logger.info(f"{prefactura} COMPLETADO")
 
-                        if viajes_encontrados:
-                            logger.info(f"Nuevos viajes agregados a cola: {viajes_encontrados}")
-                        else:
-                            time.sleep(10)
+            # Actualizar timestamp del último viaje exitoso (para sistema de alertas)
+            self.ultimo_viaje_exitoso_timestamp = datetime.now()
+            self.ultimo_viaje_exitoso_prefactura = prefactura
+            self.alerta_enviada = False
 
-                    # Limpieza zombie automática cada 100 ciclos (~1 hora)
-                    if contador_ciclos % 100 == 0:
-                        try:
-                            from cola_viajes import limpiar_viajes_zombie
-                            eliminados = limpiar_viajes_zombie()
-                            if eliminados > 0:
-                                logger.warning(f"Limpieza zombie: {eliminados} viajes eliminados")
-                        except:
-                            pass
+        elif resultado == 'LOGIN_LIMIT':
+            registrar_error_reintentable_cola(viaje_id, 'LOGIN_LIMIT', f'Límite de usuarios en {modulo_error}')
+            logger.warning(f"LOGIN LÍMITE - {prefactura}")
+
+        elif resultado == 'DRIVER_CORRUPTO':
+            registrar_error_reintentable_cola(viaje_id, 'DRIVER_CORRUPTO', f'Driver corrupto en {modulo_error}')
+            robot_state_manager.limpiar_viaje_actual()
+            logger.warning(f"DRIVER CORRUPTO - {prefactura}")
+
+        else:
+            motivo_detallado = f"PROCESO FALLÓ EN: {modulo_error}"
+            marcar_viaje_fallido_cola(viaje_id, modulo_error, motivo_detallado)
+            robot_state_manager.limpiar_viaje_actual()
+            logger.error(f"{prefactura} FALLÓ: {modulo_error}")
+
+        if self._viaje_en_gm:
+            self.control_ritmo.pausar(resultado, lambda: AlsuaMailAutomation.continuar_ejecutando)
+
+    def _limpieza_periodica(self):
+        """Viajes zombie en la cola y correos procesados fuera de retención"""
+        from cola_viajes import limpiar_viajes_zombie
+        try:
+            eliminados = limpiar_viajes_zombie()
+            if eliminados > 0:
+                logger.warning(f"Limpieza zombie: {eliminados} viajes eliminados")
+        except Exception as e:
+            logger.warning(f"Error en limpieza zombie: {e}")
+        try:
+            mensajes_procesados.purgar()
+        except Exception as e:
+            logger.warning(f"Error purgando mensajes procesados: {e}")
+
+    def _registrar_estadisticas_cola(self):
+        stats = obtener_estadisticas_cola()
+        if stats.get('total_viajes', 0) > 0:
+            logger.info(f"Cola actual: {stats.get('pendientes', 0)} pendientes")
+
+    def _crear_orquestador(self):
+        """Ingesta, sync, procesamiento y watchdogs como tareas independientes"""
+        orquestador = Orquestador(continuar=lambda: AlsuaMailAutomation.continuar_ejecutando)
+
+        # Sync CSV → MySQL en segundo plano (alimentado por cada registro nuevo de viajes_log)
+        orquestador.agregar_servicio("sync_mysql", mysql_sync_worker.iniciar_sync_worker,
+                                     mysql_sync_worker.detener_sync_worker)
+        # Los correos nuevos se agregan a la cola aunque haya backlog
+        orquestador.agregar_servicio("ingesta_correo", self.ingestor.iniciar, self.ingestor.detener)
+
+        # Selenium siempre desde el mismo hilo
+        orquestador.agregar_continua("procesamiento_viajes", self._procesar_siguiente_viaje)
+
+        periodicas = {
+            'viaje_stuck': self._verificar_viaje_stuck,
+            'alerta_sin_trabajo': self._verificar_alerta_sin_trabajo,
+            'limpieza': self._limpieza_periodica,
+            'estadisticas_cola': self._registrar_estadisticas_cola,
+            'prevalidacion': self.prevalidador.adelantar,
+            'refresco_dedup_remoto': dedup_remoto.refrescar_dedup_remoto
+        }
+        for nombre, funcion in periodicas.items():
+            orquestador.agregar_periodica(nombre, funcion, **TAREAS_ORQUESTADOR[nombre])
+        return orquestador
+
+    def ejecutar_bucle_continuo(self, mostrar_debug=False):
+        from cola_viajes import resetear_viajes_atascados
+        viajes_reseteados = resetear_viajes_atascados()
+        if viajes_reseteados > 0:
+            logger.warning(f"Se resetearon {viajes_reseteados} viajes atascados")
+
+        robot_state_manager.actualizar_estado_robot("ejecutando")
+        debug_logger.info("Iniciando bucle continuo de automatización")
+
+        self.mostrar_estadisticas_inicio()
+
+        self._mostrar_debug = mostrar_debug
+        self._ciclos_procesamiento = 0
+        self.orquestador = self._crear_orquestador()
+
+        try:
+            # Bloquea hasta que continuar_ejecutando pase a False
+            self.orquestador.ejecutar()
 
-                    if contador_ciclos % 10 == 0:
-                        try:
-                            stats = obtener_estadisticas_cola()
-                            if stats.get('total_viajes', 0) > 0:
-                                logger.info(f"Cola actual: {stats.get('pendientes', 0)} pendientes")
-                        except:
-                            pass
-                    
-                except KeyboardInterrupt:
-                    logger.info("Interrupción manual detectada")
-                    break
-                    
-                except Exception as e:
-                    logger.error(f"Error en ciclo continuo: {e}")
-                    logger.info("Continuando con siguiente ciclo en 30 segundos...")
-                    time.sleep(30)
-                    
         except KeyboardInterrupt:
             logger.info("Sistema detenido por usuario")
 
         finally:
-            # Sync final de MySQL antes de cerrar
-            try:
-                from modules.mysql_simple import sincronizar_csv_a_mysql
-                sincronizar_csv_a_mysql()
-            except:
-                pass
-
             robot_state_manager.limpiar_viaje_actual()
             robot_state_manager.actualizar_estado_robot("detenido")
             debug_logger.info("Bucle continuo finalizado")
@@ -987,7 +1218,8 @@ class AlsuaMailAutomation:
                 except:
                     pass
 
-            self.limpiar_com()
+            self.fuente_correo.desconectar()
+            self.cerrar_pool_parseo()
 
             logger.info("Sistema de automatización finalizado")
     
@@ -1059,7 +1291,8 @@ class AlsuaMailAutomation:
                 except:
                     pass
             
-            self.limpiar_com()
+            self.fuente_correo.desconectar()
+            self.cerrar_pool_parseo()
     
     def mostrar_estadisticas(self):
         try:
@@ -1075,11 +1308,18 @@ class AlsuaMailAutomation:
             logger.warning(f"Error obteniendo estadísticas de cola: {e}")
 
 def main():
-    sistema = AlsuaMailAutomation()
+    # --maildir RUTA: leer correos de un Maildir/carpeta .eml local en vez de Outlook
+    fuente_correo = None
+    if "--maildir" in sys.argv:
+        indice = sys.argv.index("--maildir")
+        ruta = sys.argv[indice + 1] if len(sys.argv) > indice + 1 else None
+        fuente_correo = crear_fuente_correo('maildir', ruta)
+
+    sistema = AlsuaMailAutomation(fuente_correo)
 
     sistema.mostrar_estadisticas()
 
-    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+    if "--test" in sys.argv:
         logger.info("MODO PRUEBA: Ejecutando revisión de test...")
         sistema.ejecutar_revision_unica()
     else:
@@ -10,6 +10,7 @@ import logging
 import sys
 import csv
 from modules import robot_state_manager
+from modules.mysql_sync_worker import leer_estado_sync
 from alsua_mail_automation import AlsuaMailAutomation
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -72,7 +73,7 @@ def api_estado():
     """API que devuelve el estado completo del robot en JSON"""
     estado = robot_state_manager.obtener_estado_completo()
     robot = estado['robots']['robot_1']
-    cola = estado['cola']
+    cola = robot_state_manager.obtener_cola()
 
     # Verificar si está trabado
     trabado, mensaje_trabado = robot_state_manager.verificar_si_trabado()
@@ -89,14 +90,43 @@ def api_estado():
         'estadisticas': {
             'viajes_exitosos': robot['estadisticas']['viajes_exitosos'],
             'viajes_fallidos': robot['estadisticas']['viajes_fallidos'],
-            'viajes_pendientes': len(cola.get('viajes', []))
+            'viajes_pendientes': cola.get('total', 0)
+        },
+        'cola': {
+            'viajes': cola.get('viajes', []),
+            'ultima_actualizacion': cola.get('ultima_actualizacion')
         },
-        'cola': cola,
         'viajes_exitosos': robot.get('viajes_exitosos_recientes', []),
-        'viajes_fallidos': robot.get('viajes_fallidos_recientes', [])
+        'viajes_fallidos': robot.get('viajes_fallidos_recientes', []),
+        'sync_mysql': leer_estado_sync(),
+        'correo': sistema_estado["instancia"].fuente_correo.obtener_metricas() if sistema_estado["instancia"] else None,
+        'ingesta': sistema_estado["instancia"].ingestor.obtener_estado() if sistema_estado["instancia"] else None,
+        'ritmo': sistema_estado["instancia"].control_ritmo.obtener_metricas() if sistema_estado["instancia"] else None,
+        'prevalidacion': sistema_estado["instancia"].prevalidador.obtener_metricas() if sistema_estado["instancia"] else None,
+        'tareas': sistema_estado["instancia"].orquestador.obtener_estado()
+        if sistema_estado["instancia"] and sistema_estado["instancia"].orquestador else None
     })
 
 
+@app.route("/api/metricas/fases")
+def api_metricas_fases():
+    """API que devuelve los histogramas de duración por fase de viaje"""
+    from modules.metricas_fases import obtener_resumen_fases
+
+    try:
+        dias = request.args.get('dias', 7, type=int)
+        return jsonify({
+            'success': True,
+            'metricas': obtener_resumen_fases(dias)
+        })
+    except Exception as e:
+        logger.error(f"Error obteniendo métricas de fases: {e}")
+        return jsonify({
+            'success': False,
+            'mensaje': f'Error: {str(e)}'
+        }), 500
+
+
 @app.route("/iniciar")
 def iniciar_robot():
     """Inicia el robot de automatización en un hilo separado"""
@@ -808,14 +838,102 @@ def api_reprocesar_viajes():
         }), 500
 
 
+def _validar_viajes_excel(df, indice_log, prefactura_facturada):
+    """
+    Validación por columnas de la carga de Excel (sin iterrows)
+
+    Mismo orden de reglas que la validación por fila: prefactura vacía, ya
+    EXITOSO/facturado, determinante, fecha, placas e importe; cada fila se
+    reporta con la primera regla que no cumple.
+
+    Returns:
+        tuple: (viajes [(datos_viaje, es_reproceso)], errores, exitosos_rechazados)
+    """
+    import pandas as pd
+
+    def texto(columna):
+        # Celdas vacías como '' sin importar la versión de pandas (astype(str) puede dejar NaN)
+        return columna.astype(str).str.strip().where(columna.notna(), '')
+
+    # Prefactura como texto (una columna con celdas vacías llega como float: 7400000.0)
+    prefacturas = df['Numero Prefactura']
+    if pd.api.types.is_float_dtype(prefacturas) and (prefacturas.dropna() % 1 == 0).all():
+        prefacturas = prefacturas.astype('Int64')
+    prefactura = texto(prefacturas).replace({'nan': '', '<NA>': ''})
+
+    estatus_log = prefactura.map(indice_log)
+    unicas = prefactura[prefactura != ''].unique()
+    # Consulta en memoria al cache de prefacturarobot (se refresca en su tarea de fondo)
+    facturadas = {p for p in unicas if prefactura_facturada(p)}
+    ya_exitoso = (estatus_log == 'EXITOSO') | prefactura.isin(facturadas)
+
+    determinante_original = texto(df['Determinante'])
+    determinante_numero = pd.to_numeric(determinante_original, errors='coerce')
+    determinante_numero = determinante_numero.where(determinante_numero.abs() != float('inf'))
+    determinante = determinante_numero.dropna().astype('int64').astype(str).reindex(df.index)
+    determinante_valido = determinante.str.fullmatch(r'\d{4}').fillna(False).astype(bool)
+
+    fechas = df['Fecha Embarque']
+    fecha_vacia = fechas.isna()
+    fecha_texto = fechas.map(lambda valor: isinstance(valor, str))
+    fecha_objeto = ~fecha_vacia & ~fecha_texto & fechas.map(lambda valor: hasattr(valor, 'strftime'))
+    fecha = fechas.astype(str).str.split(' ').str[0].where(fecha_texto)
+    fecha = fecha.fillna(pd.to_datetime(fechas.where(fecha_objeto), errors='coerce').dt.strftime('%d/%m/%Y'))
+
+    placa_tractor = texto(df['Placa Tracto'])
+    placa_remolque = texto(df['Placa Remolque'])
+    placas_vacias = placa_tractor.isin(['', 'nan']) | placa_remolque.isin(['', 'nan'])
+
+    importe_texto = texto(df['Total Facturar']).str.replace('$', '', regex=False).str.replace(',', '', regex=False)
+    importe = pd.to_numeric(importe_texto, errors='coerce')
+    importe_valido = importe.notna() & (importe > 0)
+
+    # Primera regla que falla por fila (None = fila válida)
+    razon = pd.Series(None, index=df.index, dtype=object)
+    prefactura_vacia = prefactura == ''
+    razon[prefactura_vacia] = 'Prefactura vacía'
+    pendiente = ~prefactura_vacia & ~ya_exitoso
+    reglas = [
+        (~determinante_valido, 'Determinante inválido: ' + determinante.fillna(determinante_original)),
+        (fecha_vacia, 'Fecha vacía'),
+        (fecha.isna(), 'Fecha inválida: ' + fechas.astype(str)),
+        (placas_vacias, 'Placas vacías'),
+        (~importe_valido, 'Importe inválido: ' + importe_texto),
+    ]
+    for falla, mensaje in reglas:
+        marcar = pendiente & razon.isna() & falla
+        razon[marcar] = mensaje[marcar] if isinstance(mensaje, pd.Series) else mensaje
+
+    errores = [
+        {'fila': idx + 2, 'prefactura': prefactura[idx], 'razon': razon[idx]}
+        for idx in razon.index[razon.notna()]
+    ]
+
+    validos = pendiente & razon.isna()
+    viajes = [
+        ({
+            'prefactura': prefactura[idx],
+            'fecha': fecha[idx],
+            'clave_determinante': determinante[idx],
+            'placa_tractor': placa_tractor[idx],
+            'placa_remolque': placa_remolque[idx],
+            'importe': float(importe[idx]),
+            'cliente_codigo': '040512',
+            'tipo_viaje': 'VACIO',
+            'determinante_fuente': 'EXCEL_MANUAL'
+        }, estatus_log[idx] == 'FALLIDO')
+        for idx in df.index[validos]
+    ]
+    return viajes, errores, int((~prefactura_vacia & ya_exitoso).sum())
+
+
 @app.route("/api/agregar-viajes-excel", methods=["POST"])
 def agregar_viajes_excel():
     """API para agregar viajes desde archivo Excel"""
-    from cola_viajes import agregar_viaje_a_cola
-    from viajes_log import verificar_viaje_existe
+    from cola_viajes import agregar_viajes_a_cola
+    from viajes_log import obtener_indice_estatus
+    from modules.dedup_remoto import prefactura_facturada
     import pandas as pd
-    from datetime import datetime
-    import re
 
     try:
         if 'excel_file' not in request.files:
@@ -850,112 +968,18 @@ def agregar_viajes_excel():
                 'mensaje': f'Columnas faltantes: {", ".join(columnas_faltantes)}'
             }), 400
 
-        nuevos = 0
-        a_reprocesar = 0
-        exitosos_rechazados = 0
-        duplicados_cola = 0
-        rechazados = 0
-        errores = []
-
-        for idx, row in df.iterrows():
-            try:
-                es_reproceso = False
-                prefactura = str(row['Numero Prefactura']).strip()
-
-                if not prefactura or prefactura == 'nan':
-                    rechazados += 1
-                    errores.append({
-                        'fila': idx + 2,
-                        'prefactura': prefactura,
-                        'razon': 'Prefactura vacía'
-                    })
-                    continue
-
-                viaje_existente = verificar_viaje_existe(prefactura)
-                if viaje_existente and viaje_existente.get('estatus') == 'EXITOSO':
-                    exitosos_rechazados += 1
-                    continue
-
-                es_reproceso = viaje_existente and viaje_existente.get('estatus') == 'FALLIDO'
-
-                determinante = str(int(float(str(row['Determinante']).strip()))).strip()
-                if not re.match(r'^\d{4}$', determinante):
-                    rechazados += 1
-                    errores.append({
-                        'fila': idx + 2,
-                        'prefactura': prefactura,
-                        'razon': f'Determinante inválido: {determinante}'
-                    })
-                    continue
-
-                fecha_embarque = row['Fecha Embarque']
-                if pd.isna(fecha_embarque):
-                    rechazados += 1
-                    errores.append({
-                        'fila': idx + 2,
-                        'prefactura': prefactura,
-                        'razon': 'Fecha vacía'
-                    })
-                    continue
-
-                if isinstance(fecha_embarque, str):
-                    fecha = fecha_embarque.split(' ')[0]
-                else:
-                    fecha = fecha_embarque.strftime('%d/%m/%Y')
-
-                placa_tractor = str(row['Placa Tracto']).strip()
-                placa_remolque = str(row['Placa Remolque']).strip()
-
-                if not placa_tractor or placa_tractor == 'nan' or not placa_remolque or placa_remolque == 'nan':
-                    rechazados += 1
-                    errores.append({
-                        'fila': idx + 2,
-                        'prefactura': prefactura,
-                        'razon': 'Placas vacías'
-                    })
-                    continue
-
-                importe_str = str(row['Total Facturar']).replace('$', '').replace(',', '').strip()
-                try:
-                    importe = float(importe_str)
-                    if importe <= 0:
-                        raise ValueError("Importe debe ser mayor a 0")
-                except:
-                    rechazados += 1
-                    errores.append({
-                        'fila': idx + 2,
-                        'prefactura': prefactura,
-                        'razon': f'Importe inválido: {importe_str}'
-                    })
-                    continue
-
-                datos_viaje = {
-                    'prefactura': prefactura,
-                    'fecha': fecha,
-                    'clave_determinante': determinante,
-                    'placa_tractor': placa_tractor,
-                    'placa_remolque': placa_remolque,
-                    'importe': importe,
-                    'cliente_codigo': '040512',
-                    'tipo_viaje': 'VACIO',
-                    'determinante_fuente': 'EXCEL_MANUAL'
-                }
-
-                if agregar_viaje_a_cola(datos_viaje):
-                    if es_reproceso:
-                        a_reprocesar += 1
-                    else:
-                        nuevos += 1
-                else:
-                    duplicados_cola += 1
-
-            except Exception as e:
-                rechazados += 1
-                errores.append({
-                    'fila': idx + 2,
-                    'prefactura': str(row.get('Numero Prefactura', 'DESCONOCIDA')),
-                    'razon': str(e)
-                })
+        # Índice del log en una sola lectura y un solo lote a la cola
+        viajes, errores, exitosos_rechazados = _validar_viajes_excel(
+            df.reset_index(drop=True), obtener_indice_estatus(), prefactura_facturada
+        )
+        rechazados = len(errores)
+
+        agregadas = agregar_viajes_a_cola([datos for datos, _ in viajes]) if viajes else set()
+        a_reprocesar = sum(1 for datos, es_reproceso in viajes if es_reproceso and datos['prefactura'] in agregadas)
+        nuevos = len(agregadas) - a_reprocesar
+        duplicados_cola = len(viajes) - len(agregadas)
+        if duplicados_cola:
+            logger.info(f"Excel: {duplicados_cola} viajes ya estaban en cola")
 
         total_excel = len(df)
         agregados_cola = nuevos + a_reprocesar
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Backfill de prefacturas - Ingesta masiva de XLS históricos (ej. tras una caída del buzón)
+
+Funcionalidades:
+- Recorre un árbol de carpetas buscando los .xls de prefactura
+- Prefactura tomada del nombre del archivo (7 dígitos); determinante del XLS (o --determinante)
+- Parseo en paralelo con un pool de procesos, con la misma lógica que la ingesta de
+  correo: un viaje por prefactura (viaje_de_prefactura); las filas VACIO de más se
+  reportan como error para captura manual
+- Dedup contra el índice de viajes_log.csv (una sola lectura) y prefacturarobot:
+  EXITOSO/facturado se omite, FALLIDO se vuelve a encolar (igual que la carga de Excel)
+- Salida JSONL (un viaje por línea) o agregado a la cola en un solo lote
+- Reporte de archivos/s, viajes y errores por archivo/fila
+
+Uso:
+    python backfill_prefacturas.py respaldo_correos/ --jsonl viajes.jsonl
+    python backfill_prefacturas.py respaldo_correos/ --encolar --trabajadores 4
+"""
+
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+RAIZ_PROYECTO = os.path.dirname(os.path.abspath(__file__))
+
+
+def buscar_archivos(raiz, patron):
+    """Rutas (ordenadas) de los archivos bajo raiz que cumplen el patrón"""
+    rutas = []
+    for carpeta, _, archivos in os.walk(raiz):
+        rutas.extend(os.path.join(carpeta, nombre) for nombre in archivos
+                     if fnmatch.fnmatch(nombre.lower(), patron.lower()))
+    return sorted(rutas)
+
+
+def prefactura_de_archivo(ruta):
+    """Prefactura (7 dígitos) del nombre del archivo, o None"""
+    match = re.search(r"(?<!\d)\d{7}(?!\d)", os.path.basename(ruta))
+    return match.group(0) if match else None
+
+
+def escribir_jsonl(salida, viajes):
+    """Un viaje por línea en el stream dado (no lo cierra)"""
+    for viaje in viajes:
+        salida.write(json.dumps(viaje, ensure_ascii=False) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de prefacturas desde una carpeta de XLS")
+    parser.add_argument('carpeta', help="Carpeta raíz con los .xls (se recorre completa)")
+    salida = parser.add_mutually_exclusive_group(required=True)
+    salida.add_argument('--jsonl', metavar='ARCHIVO', help="Escribir los viajes como JSONL ('-' = stdout)")
+    salida.add_argument('--encolar', action='store_true', help="Agregar los viajes a la cola en un solo lote")
+    parser.add_argument('--patron', default="*.xls", help="Patrón de nombre de archivo (default: *.xls)")
+    parser.add_argument('--determinante', help="Determinante a usar como si viniera del asunto")
+    parser.add_argument('--trabajadores', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--verbose', action='store_true', help="Mostrar el log de parseo")
+    args = parser.parse_args()
+
+    rutas = buscar_archivos(os.path.abspath(args.carpeta), args.patron)
+    if not rutas:
+        print(f"No hay archivos {args.patron} en {args.carpeta}")
+        return
+
+    # La cola y el log son los del robot (rutas relativas al proyecto)
+    ruta_jsonl = os.path.abspath(args.jsonl) if args.jsonl and args.jsonl != '-' else args.jsonl
+    os.chdir(RAIZ_PROYECTO)
+    sys.path.insert(0, RAIZ_PROYECTO)
+    nivel_silencio = logging.NOTSET if args.verbose else logging.ERROR
+    logging.disable(nivel_silencio)
+
+    from modules.parser import leer_viajes_xls, viaje_de_prefactura, formatear_fecha_viaje
+    from modules.dedup_remoto import prefactura_facturada, refrescar_dedup_remoto
+    from viajes_log import obtener_indice_estatus
+
+    indice = obtener_indice_estatus()
+    # prefacturarobot se consulta una vez aquí; en el ciclo solo se lee el cache en memoria
+    refrescar_dedup_remoto()
+    errores = []
+    pendientes = []
+    for ruta in rutas:
+        prefactura = prefactura_de_archivo(ruta)
+        if prefactura:
+            pendientes.append((ruta, prefactura))
+        else:
+            errores.append((ruta, None, "Sin prefactura (7 dígitos) en el nombre del archivo"))
+
+    viajes = []
+    vistas = set()
+    omitidos = repetidos = reprocesos = 0
+
+    inicio = time.perf_counter()
+    trabajadores = max(1, args.trabajadores)
+    with ProcessPoolExecutor(max_workers=trabajadores, initializer=logging.disable,
+                             initargs=(nivel_silencio,)) as pool:
+        resultados = pool.map(leer_viajes_xls, [ruta for ruta, _ in pendientes], repeat(args.determinante),
+                              chunksize=max(1, len(pendientes) // (trabajadores * 4)))
+
+        for (ruta, prefactura), registros in zip(pendientes, resultados):
+            validos = [registro for registro in registros if "error" not in registro]
+            errores.extend((ruta, registro.get('fila'), registro['error'])
+                           for registro in registros if "error" in registro)
+
+            viaje = viaje_de_prefactura(validos, prefactura)
+            if not viaje:
+                continue
+            errores.extend((ruta, fila, "Viaje adicional de la prefactura: requiere captura manual")
+                           for fila in viaje.get('filas_adicionales', []))
+
+            estatus = indice.get(prefactura)
+            if estatus == 'EXITOSO' or prefactura_facturada(prefactura):
+                omitidos += 1
+                continue
+            if prefactura in vistas:
+                repetidos += 1
+                continue
+            vistas.add(prefactura)
+            reprocesos += 1 if estatus == 'FALLIDO' else 0
+
+            viaje['fecha'] = formatear_fecha_viaje(viaje.get('fecha'))
+            viaje['archivo_origen'] = ruta
+            viajes.append(viaje)
+    duracion = time.perf_counter() - inicio
+
+    if args.encolar:
+        from cola_viajes import agregar_viajes_a_cola
+        agregadas = agregar_viajes_a_cola(viajes) if viajes else set()
+        destino = f"{len(agregadas)} agregados a la cola ({len(viajes) - len(agregadas)} ya estaban en cola)"
+    else:
+        if ruta_jsonl == '-':
+            # stdout no se cierra: el reporte y el intérprete lo siguen usando
+            escribir_jsonl(sys.stdout, viajes)
+        else:
+            with open(ruta_jsonl, 'w', encoding='utf-8') as f:
+                escribir_jsonl(f, viajes)
+        destino = f"{len(viajes)} escritos en {ruta_jsonl}"
+
+    reporte = sys.stderr if ruta_jsonl == '-' else sys.stdout
+    print(f"\nBackfill de prefacturas: {len(rutas)} archivos en {duracion:.1f}s "
+          f"({len(pendientes) / duracion if duracion else 0:.1f} archivos/s, {trabajadores} procesos)", file=reporte)
+    print(f"   Viajes nuevos: {len(viajes) - reprocesos}", file=reporte)
+    print(f"   Viajes a reintentar (FALLIDO en log): {reprocesos}", file=reporte)
+    print(f"   Omitidos (EXITOSO/facturado): {omitidos}", file=reporte)
+    print(f"   Repetidos entre archivos: {repetidos}", file=reporte)
+    print(f"   Errores: {len(errores)}", file=reporte)
+    for ruta, fila, error in errores[:20]:
+        ubicacion = f"{os.path.basename(ruta)}:{fila}" if fila else os.path.basename(ruta)
+        print(f"      {ubicacion} - {error}", file=reporte)
+    if len(errores) > 20:
+        print(f"      ... y {len(errores) - 20} más", file=reporte)
+    print(f"   Salida: {destino}", file=reporte)
+
+
+if __name__ == "__main__":
+    main()
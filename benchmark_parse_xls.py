@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark de parse_xls: lectura directa de celdas (xlrd on_demand) contra pandas
+
+Mide por archivo:
+- latencia (promedio y p95) de parse_xls con motor 'auto' (directo con respaldo) y 'pandas'
+- memoria pico (tracemalloc) de cada motor
+- que ambos motores regresen exactamente el mismo resultado
+Además mide el costo de importar modules.parser (sin pandas al importar).
+
+Uso:
+    python benchmark_parse_xls.py                          # archivos_descargados/*.xls
+    python benchmark_parse_xls.py ruta/*.xls --repeticiones 20
+    python benchmark_parse_xls.py --sinteticos 200         # XLS generados (requiere xlwt)
+"""
+
+import argparse
+import glob
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RAIZ_PROYECTO = os.path.dirname(os.path.abspath(__file__))
+
+
+def generar_sinteticos(carpeta, cantidad):
+    """XLS con el layout de la prefactura (6 filas de título, encabezados en la fila 7)"""
+    import xlwt
+
+    rutas = []
+    formato_fecha = xlwt.easyxf(num_format_str='YYYY-MM-DD')
+    encabezados = ["No", "Tipo de Viaje", "Fecha de Embarque", "Placa Remolque", "Placa Tractor",
+                   "Entrega1", "$Total de Viaje a Facturar"] + [f"Dato{i}" for i in range(40)]
+    for i in range(cantidad):
+        libro = xlwt.Workbook()
+        hoja = libro.add_sheet("Prefactura")
+        for fila in range(6):
+            hoja.write(fila, 0, f"PREFACTURA DE TRANSPORTE - {fila}")
+        for columna, nombre in enumerate(encabezados):
+            hoja.write(6, columna, nombre)
+        hoja.write(7, 0, 1)
+        hoja.write(7, 1, "VACIO" if i % 5 else "LLENO")
+        hoja.write(7, 2, datetime(2025, 1, 1 + i % 28), formato_fecha)
+        hoja.write(7, 3, f"{10 + i % 90}UB{100 + i % 900}")
+        hoja.write(7, 4, f"{10 + i % 90}AA{100 + i % 900}")
+        hoja.write(7, 5, f"{1000 + i % 9000} - CEDIS")
+        hoja.write(7, 6, f"${1000 + i * 7.5:,.2f}")
+        for columna in range(40):
+            hoja.write(7, 7 + columna, i * columna)
+        ruta = os.path.join(carpeta, f"prefactura_{i:04d}.xls")
+        libro.save(ruta)
+        rutas.append(ruta)
+    return rutas
+
+
+def medir_importacion():
+    """Tiempo de importar modules.parser en un proceso nuevo y si arrastra pandas"""
+    codigo = (
+        "import sys, time; inicio = time.perf_counter(); import modules.parser; "
+        "print(f'{(time.perf_counter() - inicio) * 1000:.1f}', 'pandas' in sys.modules)"
+    )
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ_PROYECTO,
+                            capture_output=True, text=True).stdout.split()
+    if len(salida) == 2:
+        print(f"   importar modules.parser: {salida[0]} ms (pandas cargado: {salida[1]})")
+
+
+def medir_motor(parse_xls, motor, rutas, repeticiones):
+    latencias = []
+    for _ in range(repeticiones):
+        for ruta in rutas:
+            inicio = time.perf_counter()
+            parse_xls(ruta, "1234", motor=motor)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    tracemalloc.start()
+    for ruta in rutas:
+        parse_xls(ruta, "1234", motor=motor)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencias.sort()
+    p95 = latencias[int(len(latencias) * 0.95) - 1] if len(latencias) >= 20 else latencias[-1]
+    print(f"   {motor:<8} {statistics.mean(latencias):8.2f} ms/archivo   p95 {p95:8.2f} ms   "
+          f"memoria pico {pico / 1024:8.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse_xls: directo (xlrd) vs pandas")
+    parser.add_argument('archivos', nargs='*', help="Archivos .xls o patrones (default: archivos_descargados/*.xls)")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--sinteticos', type=int, default=0, help="Generar N XLS sintéticos (requiere xlwt)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, RAIZ_PROYECTO)
+    logging.disable(logging.WARNING)
+
+    if args.sinteticos:
+        rutas = generar_sinteticos(tempfile.mkdtemp(prefix="bench_xls_"), args.sinteticos)
+    else:
+        patrones = args.archivos or [os.path.join(RAIZ_PROYECTO, "archivos_descargados", "*.xls")]
+        rutas = sorted({ruta for patron in patrones for ruta in glob.glob(patron)})
+    if not rutas:
+        print("No hay archivos .xls para medir (usa --sinteticos N o pasa rutas)")
+        return
+
+    from modules.parser import parse_xls
+
+    print(f"Benchmark parse_xls: {len(rutas)} archivos x {args.repeticiones} repeticiones")
+    medir_importacion()
+
+    diferencias = [ruta for ruta in rutas
+                   if parse_xls(ruta, "1234", motor="auto") != parse_xls(ruta, "1234", motor="pandas")]
+    print(f"   resultados idénticos: {len(rutas) - len(diferencias)}/{len(rutas)}")
+    for ruta in diferencias[:10]:
+        print(f"      difiere: {ruta}")
+
+    # pandas primero para que su importación no cuente en la latencia
+    medir_motor(parse_xls, "pandas", rutas, args.repeticiones)
+    medir_motor(parse_xls, "auto", rutas, args.repeticiones)
+
+
+if __name__ == "__main__":
+    main()
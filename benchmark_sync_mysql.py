@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark del sync viajes_log.csv → prefacturarobot usando DestinoSQLite
+No necesita red ni servidor MySQL: corre en una carpeta temporal
+
+Modos medidos:
+- registro_por_registro: procesar_registro_exitoso/fallido (commit + verificación por fila)
+- lotes: procesar_lote en lotes de TAMANO_LOTE_SYNC (executemany + un commit por lote)
+- sync_completo: sincronizar_desde_csv (tail del CSV → outbox → shipper en lotes)
+
+Uso:
+    python benchmark_sync_mysql.py                  # 10k y 100k filas
+    python benchmark_sync_mysql.py --filas 5000
+"""
+
+import argparse
+import csv
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ_PROYECTO = os.path.dirname(os.path.abspath(__file__))
+
+CAMPOS = [
+    'timestamp', 'prefactura', 'determinante', 'fecha_viaje', 'placa_tractor', 'placa_remolque',
+    'estatus', 'motivo_fallo', 'uuid', 'viajegm', 'numero_factura', 'importe', 'cliente_codigo'
+]
+
+
+def generar_filas(cantidad, semilla=7):
+    """Filas sintéticas del log: ~80% exitosas, ~20% fallidas, algunas prefacturas repetidas"""
+    aleatorio = random.Random(semilla)
+    inicio = datetime(2025, 1, 1)
+    filas = []
+    for i in range(cantidad):
+        # ~10% reintentos de una prefactura anterior
+        numero = aleatorio.randrange(max(i, 1)) if i and aleatorio.random() < 0.1 else i
+        exitoso = aleatorio.random() < 0.8
+        filas.append({
+            'timestamp': (inicio + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S'),
+            'prefactura': str(7000000 + numero),
+            'determinante': str(aleatorio.randrange(1000, 9999)),
+            'fecha_viaje': '01/01/2025',
+            'placa_tractor': f"{aleatorio.randrange(10, 99)}AA{aleatorio.randrange(100, 999)}",
+            'placa_remolque': f"{aleatorio.randrange(10, 99)}UB{aleatorio.randrange(100, 999)}",
+            'estatus': 'EXITOSO' if exitoso else 'FALLIDO',
+            'motivo_fallo': '' if exitoso else 'PROCESO FALLÓ EN: gm_salida',
+            'uuid': f"UUID-{i:08d}" if exitoso else '',
+            'viajegm': f"COB{i:06d}" if exitoso else '',
+            'numero_factura': f"F{i:06d}" if exitoso else '',
+            'importe': f"{aleatorio.uniform(1000, 50000):.2f}",
+            'cliente_codigo': '040512'
+        })
+    return filas
+
+
+def escribir_csv(ruta, filas):
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPOS)
+        writer.writeheader()
+        writer.writerows(filas)
+
+
+def medir(nombre, cantidad, funcion):
+    inicio = time.perf_counter()
+    funcion()
+    segundos = time.perf_counter() - inicio
+    print(f"   {nombre:<22} {segundos:8.2f}s   {cantidad / segundos:10.0f} filas/s")
+    return segundos
+
+
+def ejecutar_benchmark(cantidad, carpeta):
+    from modules.mysql_simple import MySQLSimple, DestinoSQLite, TAMANO_LOTE_SYNC
+    from modules.mysql_outbox import OutboxMySQL
+
+    print(f"\n{cantidad:,} filas")
+    filas = generar_filas(cantidad)
+    ruta_csv = os.path.join(carpeta, f"viajes_log_{cantidad}.csv")
+    escribir_csv(ruta_csv, filas)
+
+    def nuevo_sync(modo):
+        destino = DestinoSQLite(os.path.join(carpeta, f"destino_{modo}_{cantidad}.db"))
+        outbox = OutboxMySQL(os.path.join(carpeta, f"outbox_{modo}_{cantidad}.db"))
+        sync = MySQLSimple(ruta_csv, outbox=outbox, destino=destino)
+        sync.archivo_watermark = os.path.join(carpeta, f"watermark_{modo}_{cantidad}.json")
+        return sync
+
+    def registro_por_registro():
+        sync = nuevo_sync("fila")
+        sync.conectar()
+        for fila in filas:
+            if fila['estatus'] == 'EXITOSO':
+                sync.procesar_registro_exitoso(fila)
+            else:
+                sync.procesar_registro_fallido(fila)
+        sync.destino.cerrar()
+
+    def lotes():
+        sync = nuevo_sync("lote")
+        sync.conectar()
+        for inicio in range(0, len(filas), TAMANO_LOTE_SYNC):
+            sync.procesar_lote(filas[inicio:inicio + TAMANO_LOTE_SYNC])
+        sync.destino.cerrar()
+
+    def sync_completo():
+        sync = nuevo_sync("completo")
+        sync.sincronizar_desde_csv()
+        sync.destino.cerrar()
+
+    medir("registro_por_registro", cantidad, registro_por_registro)
+    medir("lotes", cantidad, lotes)
+    medir("sync_completo", cantidad, sync_completo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del sync CSV → prefacturarobot (SQLite)")
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000],
+                        help="Cantidades de filas a medir (default: 10000 100000)")
+    args = parser.parse_args()
+
+    # Los módulos crean sus archivos en el directorio actual al importarse
+    carpeta = tempfile.mkdtemp(prefix="bench_sync_")
+    os.chdir(carpeta)
+    sys.path.insert(0, RAIZ_PROYECTO)
+    logging.disable(logging.WARNING)
+
+    print(f"Benchmark sync CSV → prefacturarobot (SQLite) en {carpeta}")
+    for cantidad in args.filas:
+        ejecutar_benchmark(cantidad, carpeta)
+
+
+if __name__ == "__main__":
+    main()
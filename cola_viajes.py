@@ -1,6 +1,8 @@
+import functools
 import json
 import os
 import uuid
+import threading
 from datetime import datetime
 import logging
 
@@ -9,9 +11,20 @@ logger = logging.getLogger(__name__)
 
 ARCHIVO_COLA = "cola_viajes.json"
 
+def _con_lock(metodo):
+    """Serializa lectura-modificación-escritura de la cola (ingesta y proceso corren en hilos distintos)"""
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self._lock:
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
 class ColaViajes:
     def __init__(self):
         self.archivo = os.path.abspath(ARCHIVO_COLA)
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
         self._verificar_archivo()
         
     def _verificar_archivo(self):
@@ -42,8 +55,11 @@ class ColaViajes:
             num_viajes = len(datos.get("viajes", []))
             logger.warning(f"⚠️ GUARDANDO COLA: {num_viajes} viajes en archivo: {self.archivo}")
 
-            with open(self.archivo, 'w', encoding='utf-8') as f:
+            # Archivo temporal + os.replace: un lector nunca ve la cola a medio escribir
+            temporal = f"{self.archivo}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
                 json.dump(datos, f, indent=2, ensure_ascii=False)
+            os.replace(temporal, self.archivo)
 
             logger.warning(f"⚠️ ESCRITURA COMPLETADA - Verificando...")
 
@@ -63,6 +79,7 @@ class ColaViajes:
             logger.error(traceback.format_exc())
             return False
     
+    @_con_lock
     def resetear_viajes_atascados(self):
         try:
             datos = self._leer_cola()
@@ -91,6 +108,7 @@ class ColaViajes:
             logger.error(f"Error reseteando viajes atascados: {e}")
             return 0
 
+    @_con_lock
     def limpiar_viajes_zombie(self):
         """
         Elimina SILENCIOSAMENTE de la cola los viajes que ya fueron procesados (zombie)
@@ -129,6 +147,7 @@ class ColaViajes:
             logger.error(f"Error limpiando viajes zombie: {e}")
             return 0
     
+    @_con_lock
     def agregar_viaje(self, datos_viaje):
         try:
             prefactura = datos_viaje.get('prefactura')
@@ -164,6 +183,52 @@ class ColaViajes:
             logger.error(f"Error agregando viaje a cola: {e}")
             return False
     
+    @_con_lock
+    def agregar_viajes(self, lista_datos_viaje):
+        """
+        Agrega varios viajes con una sola lectura y una sola escritura de la cola
+
+        Returns:
+            set: Prefacturas realmente agregadas (las duplicadas o sin prefactura se omiten)
+        """
+        agregadas = set()
+        try:
+            datos = self._leer_cola()
+            existentes = {v.get("datos_viaje", {}).get("prefactura") for v in datos.get("viajes", [])}
+
+            for datos_viaje in lista_datos_viaje:
+                prefactura = datos_viaje.get('prefactura')
+                if not prefactura:
+                    logger.error("No se puede agregar viaje sin prefactura")
+                    continue
+                if prefactura in existentes:
+                    logger.warning(f"Viaje {prefactura} ya existe en cola")
+                    continue
+
+                datos["viajes"].append({
+                    "id": str(uuid.uuid4()),
+                    "datos_viaje": datos_viaje,
+                    "estado": "pendiente",
+                    "fecha_agregado": datetime.now().isoformat(),
+                    "intentos": 0,
+                    "errores": []
+                })
+                existentes.add(prefactura)
+                agregadas.add(prefactura)
+
+            if not agregadas:
+                return agregadas
+
+            if self._guardar_cola(datos):
+                logger.info(f"{len(agregadas)} viajes agregados a cola")
+                return agregadas
+            return set()
+
+        except Exception as e:
+            logger.error(f"Error agregando viajes a cola: {e}")
+            return set()
+    
+    @_con_lock
     def obtener_siguiente_viaje(self, max_intentos=5):
         try:
             datos = self._leer_cola()
@@ -222,6 +287,7 @@ class ColaViajes:
             logger.error(f"Error obteniendo siguiente viaje: {e}")
             return None
     
+    @_con_lock
     def marcar_viaje_exitoso(self, viaje_id):
         try:
             datos = self._leer_cola()
@@ -247,6 +313,7 @@ class ColaViajes:
             logger.error(f"Error marcando viaje exitoso: {e}")
             return False
     
+    @_con_lock
     def marcar_viaje_fallido(self, viaje_id, modulo_error, motivo):
         try:
             datos = self._leer_cola()
@@ -273,6 +340,7 @@ class ColaViajes:
             logger.error(f"Error marcando viaje fallido: {e}")
             return False
     
+    @_con_lock
     def registrar_error_reintentable(self, viaje_id, tipo_error, detalle):
         try:
             datos = self._leer_cola()
@@ -305,6 +373,72 @@ class ColaViajes:
             logger.error(f"Error registrando error reintentable: {e}")
             return False
     
+    @_con_lock
+    def obtener_proximos_pendientes(self, limite):
+        """
+        Copia de los siguientes viajes pendientes, en el orden en que se tomarán
+        (solo lectura: no los marca como procesando)
+
+        Args:
+            limite: Máximo de viajes a regresar
+        """
+        datos = self._leer_cola()
+        return [viaje for viaje in datos.get("viajes", []) if viaje.get("estado") == "pendiente"][:limite]
+
+    @_con_lock
+    def archivo_en_uso(self, ruta, excluir_id=None):
+        """
+        True si algún viaje de la cola (salvo excluir_id) usa el archivo descargado
+
+        Copias idénticas de un XLS (reenvíos con otra prefactura) comparten archivo por
+        huella y apuntan a la misma ruta: el archivo se borra cuando ya nadie lo usa.
+        """
+        datos = self._leer_cola()
+        return any(
+            viaje.get("datos_viaje", {}).get("archivo_descargado") == ruta and viaje.get("id") != excluir_id
+            for viaje in datos.get("viajes", [])
+        )
+
+    def obtener_resumen_pendientes(self):
+        """
+        Resumen de viajes pendientes/procesando derivado directamente de la cola.
+        Solo relee cola_viajes.json cuando cambia su versión (mtime + tamaño),
+        así el dashboard puede consultarlo en cada refresco sin costo.
+
+        Returns:
+            dict: viajes (prefactura, fecha, placas, estado), total y versión del snapshot
+        """
+        try:
+            stat = os.stat(self.archivo)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+
+        with self._snapshot_lock:
+            if self._snapshot is not None and self._snapshot['version'] == version:
+                return self._snapshot
+
+            datos = self._leer_cola() if version else {"viajes": []}
+            viajes_pendientes = [
+                {
+                    'prefactura': v.get('datos_viaje', {}).get('prefactura', 'N/A'),
+                    'fecha': v.get('datos_viaje', {}).get('fecha', 'N/A'),
+                    'placa_tractor': v.get('datos_viaje', {}).get('placa_tractor', 'N/A'),
+                    'placa_remolque': v.get('datos_viaje', {}).get('placa_remolque', 'N/A'),
+                    'estado': v.get('estado')
+                }
+                for v in datos.get('viajes', [])
+                if v.get('estado') in ['pendiente', 'procesando']
+            ]
+
+            self._snapshot = {
+                'viajes': viajes_pendientes,
+                'total': len(viajes_pendientes),
+                'version': version,
+                'ultima_actualizacion': datetime.fromtimestamp(version[0] / 1e9).isoformat() if version else None
+            }
+            return self._snapshot
+
     def obtener_estadisticas(self):
         try:
             datos = self._leer_cola()
@@ -342,9 +476,18 @@ def limpiar_viajes_zombie():
 def agregar_viaje_a_cola(datos_viaje):
     return cola_viajes.agregar_viaje(datos_viaje)
 
+def agregar_viajes_a_cola(lista_datos_viaje):
+    return cola_viajes.agregar_viajes(lista_datos_viaje)
+
 def obtener_siguiente_viaje_cola():
     return cola_viajes.obtener_siguiente_viaje()
 
+def obtener_proximos_viajes_cola(limite):
+    return cola_viajes.obtener_proximos_pendientes(limite)
+
+def archivo_en_uso_cola(ruta, excluir_id=None):
+    return cola_viajes.archivo_en_uso(ruta, excluir_id)
+
 def marcar_viaje_exitoso_cola(viaje_id):
     return cola_viajes.marcar_viaje_exitoso(viaje_id)
 
@@ -360,6 +503,9 @@ def obtener_estadisticas_cola():
 def leer_cola():
     return cola_viajes._leer_cola()
 
+def obtener_resumen_cola():
+    return cola_viajes.obtener_resumen_pendientes()
+
 if __name__ == "__main__":
     print("Probando sistema de cola...")
     
@@ -0,0 +1,112 @@
+"""
+Cache de Adjuntos - Deduplicación de XLS por contenido
+
+Funcionalidades:
+- Huella sha256 del contenido de cada adjunto (Walmart reenvía la misma prefactura seguido)
+- Viajes del XLS (iterar_viajes_xls) cacheados por huella + determinante del asunto en
+  estado_runtime (persistente, con TTL): un reenvío no se vuelve a escribir a disco ni a parsear
+- Solo se cachean resultados deterministas (viajes válidos o errores de validación),
+  nunca errores de lectura que podrían ser transitorios
+- Archivos en archivos_descargados nombrados por huella: copias idénticas son un solo archivo
+"""
+
+import hashlib
+import os
+import logging
+
+from modules.estado_runtime import estado_runtime
+
+logger = logging.getLogger(__name__)
+
+CACHE_ADJUNTOS_CONFIG = {
+    'habilitado': True,
+    'ttl_dias': 30
+}
+
+# Errores de parseo que dependen solo del contenido (se pueden cachear)
+ERRORES_CACHEABLES = ("no es tipo VACIO", "Archivo vacío", "determinante")
+
+
+def huella_contenido(contenido):
+    """sha256 hex del contenido de un adjunto"""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+class CacheAdjuntos:
+    """Cache de resultados de parseo por contenido del adjunto"""
+
+    def __init__(self, estado=None, config=None):
+        """
+        Args:
+            estado: EstadoRuntime donde se persisten los resultados (default: el global)
+            config: Dict con las claves de CACHE_ADJUNTOS_CONFIG
+        """
+        self.estado = estado or estado_runtime
+        self.config = dict(CACHE_ADJUNTOS_CONFIG, **(config or {}))
+        self.aciertos = 0
+        self.fallos = 0
+        self.escrituras_evitadas = 0
+
+    def _clave(self, huella, determinante):
+        return f"{huella}:{determinante or ''}"
+
+    def obtener_parseo(self, huella, determinante):
+        """
+        Registros cacheados de iterar_viajes_xls para este contenido y determinante
+
+        Returns:
+            list: Copia de los registros (viajes o errores por fila), o None si no está en cache
+        """
+        if not self.config['habilitado']:
+            return None
+        registros = self.estado.obtener('viajes_xls', self._clave(huella, determinante))
+        if registros is None:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return [dict(registro) for registro in registros]
+
+    def guardar_parseo(self, huella, determinante, registros):
+        if not self.config['habilitado'] or not self.es_cacheable(registros):
+            return
+        self.estado.guardar('viajes_xls', self._clave(huella, determinante), registros,
+                            ttl_segundos=self.config['ttl_dias'] * 86400)
+
+    @staticmethod
+    def es_cacheable(registros):
+        return all(
+            registro.get("error") is None or any(texto in registro["error"] for texto in ERRORES_CACHEABLES)
+            for registro in registros
+        )
+
+    def guardar_archivo(self, contenido, carpeta, nombre, huella=None):
+        """
+        Escribe el adjunto con nombre por huella; si ya existe una copia idéntica no escribe
+
+        Returns:
+            str: Ruta del archivo
+        """
+        huella = huella or huella_contenido(contenido)
+        ruta = os.path.join(carpeta, f"{huella[:16]}_{nombre}")
+        if os.path.exists(ruta) and os.path.getsize(ruta) == len(contenido):
+            self.escrituras_evitadas += 1
+            return ruta
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+        return ruta
+
+    def obtener_estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else None,
+            'escrituras_evitadas': self.escrituras_evitadas,
+            'entradas': self.estado.contar('viajes_xls')
+        }
+
+
+# Instancia global para uso en todo el proyecto
+cache_adjuntos = CacheAdjuntos()
@@ -0,0 +1,91 @@
+"""
+Clave Ruta Base - Lectura compartida de clave_ruta_base.csv
+
+Funcionalidades:
+- Índice en memoria determinante -> ruta_gm, base_origen, tipo_documento
+- Se relee solo cuando cambia el archivo (mtime + tamaño): una determinante agregada
+  desde el dashboard se ve en el siguiente viaje sin reiniciar el robot
+- Una sola lectura para el prevalidador, la verificación previa al viaje y los módulos de GM
+- Mismos estados que la búsqueda original: ENCONTRADO, DETERMINANTE_NO_ENCONTRADA,
+  ARCHIVO_CSV_NO_EXISTE, ERROR_LECTURA_CSV
+"""
+
+import csv
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_CLAVES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clave_ruta_base.csv')
+
+
+class ClaveRutaBase:
+    def __init__(self, archivo=ARCHIVO_CLAVES):
+        self.archivo = archivo
+        self._lock = threading.Lock()
+        self._indice = None
+        self._version = None
+        self._lecturas = 0
+
+    def _obtener_indice(self):
+        """Índice vigente; relee el CSV si cambió su versión"""
+        stat = os.stat(self.archivo)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if self._indice is not None and self._version == version:
+                return self._indice
+
+            indice = {}
+            with open(self.archivo, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    # Igual que la búsqueda lineal: la primera aparición gana
+                    indice.setdefault(str(row.get('determinante', '')).strip(), row)
+
+            self._indice = indice
+            self._version = version
+            self._lecturas += 1
+            logger.debug(f"clave_ruta_base.csv cargado: {len(indice)} determinantes")
+            return indice
+
+    def buscar(self, determinante):
+        """
+        Fila de la determinante
+
+        Returns:
+            tuple: (fila dict o None, estado)
+        """
+        if not os.path.exists(self.archivo):
+            return None, "ARCHIVO_CSV_NO_EXISTE"
+        try:
+            fila = self._obtener_indice().get(str(determinante).strip())
+        except Exception as e:
+            logger.error(f"Error al leer {self.archivo}: {e}")
+            return None, "ERROR_LECTURA_CSV"
+        return (fila, "ENCONTRADO") if fila else (None, "DETERMINANTE_NO_ENCONTRADA")
+
+    def existe(self, determinante):
+        fila, _ = self.buscar(determinante)
+        return fila is not None
+
+    def obtener_estadisticas(self):
+        with self._lock:
+            return {
+                'determinantes': len(self._indice) if self._indice is not None else None,
+                'lecturas_archivo': self._lecturas
+            }
+
+
+# Instancia global para uso en todo el proyecto
+clave_ruta_base = ClaveRutaBase()
+
+
+def buscar_determinante(determinante):
+    """(fila, estado) de la determinante en clave_ruta_base.csv (wrapper)"""
+    return clave_ruta_base.buscar(determinante)
+
+
+def determinante_existe(determinante):
+    """True si la determinante está en clave_ruta_base.csv (wrapper)"""
+    return clave_ruta_base.existe(determinante)
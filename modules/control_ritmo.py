@@ -0,0 +1,168 @@
+"""
+Control de Ritmo - Pausa entre viajes según la salud observada de GM Transport
+
+Funcionalidades:
+- Sustituye las pausas fijas (60s tras éxito, 30s tras fallo, 15 min tras LOGIN_LIMIT)
+- Ventana de los últimos viajes: tasa de error y duración del viaje contra su mediana
+  (GM lento = páginas lentas = viajes más largos)
+- Día sano: pausa_minima (viajes seguidos); la pausa crece con la presión de errores
+  o de latencia hasta pausa_maxima
+- Fallos consecutivos: pausa base que se duplica con cada fallo seguido
+- LOGIN_LIMIT: espera exponencial según los eventos recientes (no 15 min desde el primero)
+- Cada decisión se registra en el log y queda en las métricas para el API
+"""
+
+import statistics
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CONTROL_RITMO_CONFIG = {
+    'pausa_minima_segundos': 0,             # Piso en un día sano: viajes seguidos
+    'pausa_maxima_segundos': 300,           # Techo por errores o latencia
+    'pausa_base_fallo_segundos': 15,        # Primer fallo; se duplica por fallo consecutivo
+    'ventana_viajes': 20,
+    'umbral_tasa_error': 0.2,               # Tasa de error tolerada antes de frenar
+    'factor_latencia': 1.5,                 # Viajes recientes > 1.5x la mediana = GM lento
+    'minimo_muestras_latencia': 5,
+    'espera_login_limit_inicial': 120,      # Primer LOGIN_LIMIT; se duplica por evento reciente
+    'espera_login_limit_maxima': 15 * 60,
+    'ventana_login_limit_minutos': 60,
+    'tramo_espera_segundos': 5              # Granularidad para cortar la espera al detener el robot
+}
+
+RESULTADOS_SIN_FALLA = ('EXITOSO', 'DRIVER_CORRUPTO')
+
+
+class ControlRitmo:
+    """Decide la pausa entre viajes a partir de los resultados recientes"""
+
+    def __init__(self, config=None):
+        self.config = dict(CONTROL_RITMO_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._viajes = deque(maxlen=self.config['ventana_viajes'])     # (resultado, duración)
+        self._login_limit = deque()
+        self._fallos_consecutivos = 0
+        self._decisiones = deque(maxlen=20)
+        self._segundos_en_pausa = 0.0
+
+    def registrar_viaje(self, resultado, duracion_segundos):
+        """
+        Registra el resultado de un viaje
+
+        Args:
+            resultado: 'EXITOSO', 'LOGIN_LIMIT', 'DRIVER_CORRUPTO' o cualquier otro (fallido)
+            duracion_segundos: Tiempo de procesar_viaje_individual
+        """
+        with self._lock:
+            self._viajes.append((resultado, duracion_segundos))
+            if resultado == 'LOGIN_LIMIT':
+                self._login_limit.append(time.monotonic())
+            if resultado == 'EXITOSO':
+                self._fallos_consecutivos = 0
+            elif resultado not in RESULTADOS_SIN_FALLA and resultado != 'LOGIN_LIMIT':
+                self._fallos_consecutivos += 1
+
+    def _eventos_login_limit(self):
+        limite = time.monotonic() - self.config['ventana_login_limit_minutos'] * 60
+        while self._login_limit and self._login_limit[0] < limite:
+            self._login_limit.popleft()
+        return len(self._login_limit)
+
+    def _tasa_error(self):
+        if not self._viajes:
+            return 0.0
+        return sum(1 for resultado, _ in self._viajes if resultado not in RESULTADOS_SIN_FALLA) / len(self._viajes)
+
+    def _razon_latencia(self):
+        """Mediana de los 3 últimos viajes exitosos contra la mediana de la ventana"""
+        duraciones = [duracion for resultado, duracion in self._viajes if resultado == 'EXITOSO']
+        if len(duraciones) < self.config['minimo_muestras_latencia']:
+            return 1.0
+        referencia = statistics.median(duraciones)
+        return statistics.median(duraciones[-3:]) / referencia if referencia else 1.0
+
+    def calcular_pausa(self, resultado):
+        """
+        Pausa antes del siguiente viaje
+
+        Returns:
+            tuple: (segundos, motivo)
+        """
+        config = self.config
+        with self._lock:
+            if resultado == 'LOGIN_LIMIT':
+                eventos = max(1, self._eventos_login_limit())
+                segundos = min(config['espera_login_limit_inicial'] * 2 ** (eventos - 1),
+                               config['espera_login_limit_maxima'])
+                return segundos, f"LOGIN_LIMIT ({eventos} en {config['ventana_login_limit_minutos']} min)"
+
+            tasa = self._tasa_error()
+            razon = self._razon_latencia()
+            fallos = self._fallos_consecutivos
+
+        umbral = config['umbral_tasa_error']
+        presion_errores = max(0.0, (tasa - umbral) / (1 - umbral)) if umbral < 1 else 0.0
+        presion_latencia = min(1.0, max(0.0, (razon - config['factor_latencia']) / config['factor_latencia']))
+        presion = max(presion_errores, presion_latencia)
+        segundos = config['pausa_minima_segundos'] + presion * (config['pausa_maxima_segundos'] - config['pausa_minima_segundos'])
+        motivo = f"error {tasa:.0%}, latencia x{razon:.2f}"
+
+        if resultado not in RESULTADOS_SIN_FALLA and fallos:
+            segundos = max(segundos, config['pausa_base_fallo_segundos'] * 2 ** (fallos - 1))
+            motivo += f", {fallos} fallo(s) seguidos"
+
+        segundos = min(max(segundos, config['pausa_minima_segundos']), config['pausa_maxima_segundos'])
+        return round(segundos, 1), motivo
+
+    def pausar(self, resultado, continuar=None):
+        """
+        Calcula la pausa tras un viaje, la registra y espera
+
+        Args:
+            resultado: Resultado del viaje que acaba de terminar
+            continuar: Función que regresa False para cortar la espera (robot detenido)
+
+        Returns:
+            float: Segundos de pausa decididos
+        """
+        segundos, motivo = self.calcular_pausa(resultado)
+        with self._lock:
+            self._decisiones.append({
+                'fecha': datetime.now().isoformat(),
+                'resultado': resultado,
+                'pausa_segundos': segundos,
+                'motivo': motivo
+            })
+            self._segundos_en_pausa += segundos
+        if segundos:
+            logger.info(f"Ritmo: pausa de {segundos:.0f}s tras {resultado} ({motivo})")
+        else:
+            logger.info(f"Ritmo: siguiente viaje sin pausa ({motivo})")
+        self.esperar(segundos, continuar)
+        return segundos
+
+    def esperar(self, segundos, continuar=None):
+        fin = time.monotonic() + segundos
+        while True:
+            restante = fin - time.monotonic()
+            if restante <= 0 or (continuar is not None and not continuar()):
+                return
+            time.sleep(min(restante, self.config['tramo_espera_segundos']))
+
+    def obtener_metricas(self):
+        with self._lock:
+            return {
+                'viajes_en_ventana': len(self._viajes),
+                'tasa_error': round(self._tasa_error(), 3),
+                'razon_latencia': round(self._razon_latencia(), 2),
+                'fallos_consecutivos': self._fallos_consecutivos,
+                'login_limit_recientes': self._eventos_login_limit(),
+                'segundos_en_pausa': round(self._segundos_en_pausa),
+                'ultima_decision': self._decisiones[-1] if self._decisiones else None,
+                'decisiones_recientes': list(self._decisiones)
+            }
@@ -0,0 +1,257 @@
+"""
+Dedup Remoto - Cache local del estatus de prefacturarobot
+
+Funcionalidades:
+- Carga masiva de NOPREFACTURA/estatusr desde prefacturarobot a un dict en memoria
+- Refresco incremental por keyset numérico (solo prefacturas con número mayor o igual al
+  último visto; no depende del largo ni de sufijos en la clave)
+- Recarga completa cuando vence el TTL (detecta cambios de estatus hechos en otra máquina)
+- El refresco corre en una tarea de fondo (refrescar()); la consulta nunca toca MySQL
+- Write-through: los lotes que confirma el sync actualizan el cache al momento
+- Persiste en cache_prefacturarobot.json para arrancar sin esperar a MySQL
+- Consulta O(1) en memoria: solo 'facturado' bloquea (un 'pendiente' puede reintentarse)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import logging
+from datetime import datetime
+
+from modules.mysql_simple import DestinoMySQL, agregar_observador_confirmados
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_CACHE = "cache_prefacturarobot.json"
+
+DEDUP_REMOTO_CONFIG = {
+    'habilitado': True,
+    'ttl_incremental_segundos': 300,     # Refresco de prefacturas nuevas
+    'ttl_completo_segundos': 6 * 3600,   # Recarga completa (cambios de estatus)
+    'espera_tras_error_segundos': 120,   # No reintentar MySQL en cada consulta si está caído
+    'tamano_pagina': 5000
+}
+
+
+def _numero_prefactura(prefactura):
+    """Número de la prefactura (dígitos iniciales: '7400000-2' -> 7400000), 0 si no tiene"""
+    match = re.match(r"\s*(\d+)", str(prefactura))
+    return int(match.group(1)) if match else 0
+
+
+class CacheEstatusRemoto:
+    """Cache TTL de NOPREFACTURA → estatusr de prefacturarobot"""
+
+    def __init__(self, archivo=ARCHIVO_CACHE, destino=None, config=None):
+        """
+        Inicializa el cache (carga el snapshot persistido si existe)
+
+        Args:
+            archivo: Archivo JSON donde se persiste el cache
+            destino: Destino SQL a consultar (default: DestinoMySQL)
+            config: Dict con las claves de DEDUP_REMOTO_CONFIG
+        """
+        self.archivo = os.path.abspath(archivo)
+        self.destino = destino or DestinoMySQL()
+        self.config = dict(DEDUP_REMOTO_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._lock_refresco = threading.Lock()
+
+        self._estatus = {}
+        self._max_numero = 0
+        self._confirmados_en_refresco = None   # Write-through recibido durante una recarga completa
+        self._carga_completa = 0.0      # time.time() de la última recarga completa
+        self._ultimo_refresco = 0.0     # time.monotonic() del último refresco incremental
+        self._proximo_intento = 0.0
+        self._ultimo_error = None
+        self._cargar()
+
+    def _cargar(self):
+        try:
+            if not os.path.exists(self.archivo):
+                return
+            with open(self.archivo, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            self._estatus = datos.get('estatus', {})
+            self._max_numero = max((_numero_prefactura(p) for p in self._estatus), default=0)
+            self._carga_completa = datos.get('carga_completa', 0.0)
+            logger.info(f"Cache de prefacturarobot cargado: {len(self._estatus)} prefacturas")
+        except Exception as e:
+            logger.warning(f"Error cargando cache de prefacturarobot: {e}")
+
+    def _guardar(self):
+        """Escribe el cache de forma atómica (archivo temporal + replace)"""
+        try:
+            datos = {
+                'estatus': self._estatus,
+                'max_numero': self._max_numero,
+                'carga_completa': self._carga_completa,
+                'actualizado': datetime.now().isoformat()
+            }
+            temporal = f"{self.archivo}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(datos, f)
+            os.replace(temporal, self.archivo)
+        except Exception as e:
+            logger.warning(f"Error guardando cache de prefacturarobot: {e}")
+
+    def _consultar(self, desde_numero):
+        """
+        Lee (NOPREFACTURA, estatusr) con número de prefactura >= desde_numero
+
+        Paginado por keyset compuesto (número, clave): el número ordena sin importar el
+        largo de la clave y la clave desempata las que comparten número.
+        """
+        marcador = self.destino.marcador
+        numero = self.destino.numero_prefactura
+        filas = []
+        conexion = self.destino.conectar()
+        if conexion is None:
+            raise ConnectionError("Conexión no disponible")
+        cursor = conexion.cursor()
+        ultimo_numero, ultima_clave = desde_numero, ""
+        try:
+            while True:
+                cursor.execute(
+                    f"SELECT NOPREFACTURA, estatusr, {numero} FROM prefacturarobot "
+                    f"WHERE {numero} > {marcador} OR ({numero} = {marcador} AND NOPREFACTURA > {marcador}) "
+                    f"ORDER BY {numero}, NOPREFACTURA LIMIT {marcador}",
+                    (ultimo_numero, ultimo_numero, ultima_clave, self.config['tamano_pagina'])
+                )
+                pagina = cursor.fetchall()
+                filas.extend((nopref, estatusr) for nopref, estatusr, _ in pagina)
+                if len(pagina) < self.config['tamano_pagina']:
+                    break
+                ultima_clave, _, ultimo_numero = pagina[-1]
+                ultima_clave, ultimo_numero = str(ultima_clave), int(ultimo_numero or 0)
+        finally:
+            cursor.close()
+            self.destino.liberar(conexion)
+        return filas
+
+    def refrescar(self):
+        """
+        Refresca el cache si venció el TTL (incremental o completo)
+
+        Hace I/O contra MySQL: se llama desde una tarea de fondo (orquestador, backfill),
+        nunca desde la consulta. Las consultas siguen respondiendo con el cache mientras tanto.
+        """
+        if not self.config['habilitado']:
+            return
+        if not self._lock_refresco.acquire(blocking=False):
+            return      # Ya hay un refresco en curso
+        try:
+            ahora = time.monotonic()
+            if ahora < self._proximo_intento:
+                return
+
+            completa = time.time() - self._carga_completa >= self.config['ttl_completo_segundos']
+            if not completa and ahora - self._ultimo_refresco < self.config['ttl_incremental_segundos']:
+                return
+
+            if completa:
+                with self._lock:
+                    self._confirmados_en_refresco = []
+            try:
+                inicio = time.perf_counter()
+                filas = self._consultar(0 if completa else self._max_numero)
+            except Exception as e:
+                with self._lock:
+                    self._confirmados_en_refresco = None
+                    self._ultimo_error = str(e)
+                self._proximo_intento = ahora + self.config['espera_tras_error_segundos']
+                logger.warning(f"No se pudo refrescar cache de prefacturarobot ({e}) - usando cache local")
+                return
+
+            with self._lock:
+                estatus = {} if completa else self._estatus
+                for nopref, estatusr in filas:
+                    estatus[str(nopref)] = estatusr
+                if completa:
+                    # Lo confirmado por el sync mientras corría la consulta no se pierde
+                    self._aplicar_confirmados(estatus, self._confirmados_en_refresco)
+                    self._confirmados_en_refresco = None
+                    self._estatus = estatus
+                    self._carga_completa = time.time()
+                self._max_numero = max([self._max_numero if not completa else 0] +
+                                       [_numero_prefactura(nopref) for nopref, _ in filas])
+                self._ultimo_refresco = ahora
+                self._ultimo_error = None
+                total = len(self._estatus)
+                if completa or filas:
+                    self._guardar()
+
+            logger.info(f"Cache prefacturarobot {'recargado' if completa else 'actualizado'}: "
+                        f"{len(filas)} filas en {time.perf_counter() - inicio:.2f}s "
+                        f"({total} prefacturas)")
+        finally:
+            self._lock_refresco.release()
+
+    def obtener_estatus(self, prefactura):
+        """
+        Estatus remoto de una prefactura (solo memoria: el refresco lo hace refrescar())
+
+        Returns:
+            str: 'facturado', 'pendiente' o None si no está en prefacturarobot
+        """
+        if not self.config['habilitado']:
+            return None
+        with self._lock:
+            return self._estatus.get(str(prefactura))
+
+    def prefactura_facturada(self, prefactura):
+        """True si prefacturarobot ya tiene la prefactura como facturada"""
+        return self.obtener_estatus(prefactura) == 'facturado'
+
+    def registrar_confirmados(self, estados):
+        """
+        Write-through desde el sync: actualiza el cache con lo que se acaba de subir
+
+        Args:
+            estados: Lista de tuplas (prefactura, estatusr)
+        """
+        with self._lock:
+            self._aplicar_confirmados(self._estatus, estados)
+            if self._confirmados_en_refresco is not None:
+                self._confirmados_en_refresco.extend(estados)
+
+    @staticmethod
+    def _aplicar_confirmados(estatus, estados):
+        for prefactura, estatusr in estados:
+            # Un fallo reintentado nunca degrada un viaje ya facturado (igual que el upsert)
+            if estatus.get(prefactura) != 'facturado':
+                estatus[prefactura] = estatusr
+
+    def obtener_estadisticas(self):
+        with self._lock:
+            return {
+                'habilitado': self.config['habilitado'],
+                'prefacturas': len(self._estatus),
+                'facturadas': sum(1 for e in self._estatus.values() if e == 'facturado'),
+                'max_numero': self._max_numero,
+                'carga_completa': datetime.fromtimestamp(self._carga_completa).isoformat() if self._carga_completa else None,
+                'ultimo_error': self._ultimo_error
+            }
+
+
+# Instancia global para uso en todo el proyecto
+cache_estatus = CacheEstatusRemoto()
+agregar_observador_confirmados(cache_estatus.registrar_confirmados)
+
+
+# Funciones de conveniencia para importación directa
+def prefactura_facturada(prefactura):
+    """True si la prefactura ya está facturada en prefacturarobot (wrapper)"""
+    return cache_estatus.prefactura_facturada(prefactura)
+
+
+def refrescar_dedup_remoto():
+    """Refresca el cache desde prefacturarobot si venció el TTL (wrapper, hace I/O)"""
+    cache_estatus.refrescar()
+
+
+def obtener_estadisticas_dedup():
+    """Estadísticas del cache de dedup remoto (wrapper)"""
+    return cache_estatus.obtener_estadisticas()
@@ -0,0 +1,168 @@
+"""
+Estado Runtime - Estado del robot que debe sobrevivir reinicios
+
+Funcionalidades:
+- Almacén clave-valor en SQLite (estado_runtime.db) separado por espacios
+- TTL por entrada: lo vencido no se lee y se purga solo (memoria y archivo acotados)
+- Escritura incremental: cada cambio es un UPSERT de una sola clave, sin reescribir todo
+- VistaPersistente: acceso tipo dict a un espacio (emails fallidos, historial de
+  procesamiento) para que el código que usaba dicts en memoria casi no cambie
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_ESTADO_RUNTIME = "estado_runtime.db"
+
+ESTADO_RUNTIME_CONFIG = {
+    'ttl_emails_fallidos_dias': 7,
+    'purgar_cada_escrituras': 500
+}
+
+
+class EstadoRuntime:
+    """Almacén clave-valor persistente con TTL"""
+
+    def __init__(self, archivo=ARCHIVO_ESTADO_RUNTIME, config=None):
+        """
+        Inicializa el almacén (purga lo vencido al abrir)
+
+        Args:
+            archivo: Archivo SQLite del estado
+            config: Dict con las claves de ESTADO_RUNTIME_CONFIG
+        """
+        self.archivo = os.path.abspath(archivo)
+        self.config = dict(ESTADO_RUNTIME_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._escrituras = 0
+
+    def _conectar(self):
+        if self._conexion is None:
+            self._conexion = sqlite3.connect(self.archivo, timeout=10, check_same_thread=False)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS estado (
+                    espacio TEXT NOT NULL,
+                    clave TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    expira REAL,
+                    PRIMARY KEY (espacio, clave)
+                ) WITHOUT ROWID
+            """)
+            self._conexion.commit()
+            self._purgar_vencidos()
+        return self._conexion
+
+    def _purgar_vencidos(self):
+        eliminados = self._conexion.execute(
+            "DELETE FROM estado WHERE expira IS NOT NULL AND expira < ?", (time.time(),)
+        ).rowcount
+        self._conexion.commit()
+        if eliminados:
+            logger.info(f"Estado runtime: {eliminados} entradas vencidas purgadas")
+
+    def obtener(self, espacio, clave, default=None):
+        try:
+            with self._lock:
+                fila = self._conectar().execute(
+                    "SELECT valor FROM estado WHERE espacio = ? AND clave = ? AND (expira IS NULL OR expira >= ?)",
+                    (espacio, str(clave), time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error leyendo estado runtime ({espacio}/{clave}): {e}")
+            return default
+        return json.loads(fila[0]) if fila else default
+
+    def guardar(self, espacio, clave, valor, ttl_segundos=None):
+        """
+        Guarda un valor serializable a JSON
+
+        Args:
+            ttl_segundos: Vigencia de la entrada (None = sin vencimiento)
+        """
+        expira = time.time() + ttl_segundos if ttl_segundos else None
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                conexion.execute(
+                    "INSERT OR REPLACE INTO estado (espacio, clave, valor, expira) VALUES (?, ?, ?, ?)",
+                    (espacio, str(clave), json.dumps(valor, ensure_ascii=False), expira)
+                )
+                conexion.commit()
+                self._escrituras += 1
+                if self._escrituras % self.config['purgar_cada_escrituras'] == 0:
+                    self._purgar_vencidos()
+        except sqlite3.Error as e:
+            logger.warning(f"Error guardando estado runtime ({espacio}/{clave}): {e}")
+
+    def eliminar(self, espacio, clave):
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                conexion.execute("DELETE FROM estado WHERE espacio = ? AND clave = ?", (espacio, str(clave)))
+                conexion.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error eliminando estado runtime ({espacio}/{clave}): {e}")
+
+    def contar(self, espacio):
+        with self._lock:
+            return self._conectar().execute(
+                "SELECT COUNT(*) FROM estado WHERE espacio = ? AND (expira IS NULL OR expira >= ?)",
+                (espacio, time.time())
+            ).fetchone()[0]
+
+    def vista(self, espacio, ttl_segundos=None):
+        """Acceso tipo dict a un espacio"""
+        return VistaPersistente(self, espacio, ttl_segundos)
+
+    def cerrar(self):
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+class VistaPersistente:
+    """
+    Dict persistente sobre un espacio de EstadoRuntime (get, in, [], []=, del)
+
+    Cada asignación renueva el TTL de la clave. Los valores mutables se deben
+    reasignar para persistir el cambio (vista[k] = lista, no vista[k].append()).
+    """
+
+    def __init__(self, estado, espacio, ttl_segundos=None):
+        self._estado = estado
+        self.espacio = espacio
+        self.ttl_segundos = ttl_segundos
+
+    def get(self, clave, default=None):
+        return self._estado.obtener(self.espacio, clave, default)
+
+    def __contains__(self, clave):
+        return self.get(clave) is not None
+
+    def __getitem__(self, clave):
+        valor = self.get(clave)
+        if valor is None:
+            raise KeyError(clave)
+        return valor
+
+    def __setitem__(self, clave, valor):
+        self._estado.guardar(self.espacio, clave, valor, self.ttl_segundos)
+
+    def __delitem__(self, clave):
+        self._estado.eliminar(self.espacio, clave)
+
+    def __len__(self):
+        return self._estado.contar(self.espacio)
+
+
+# Instancia global para uso en todo el proyecto
+estado_runtime = EstadoRuntime()
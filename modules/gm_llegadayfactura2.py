@@ -1,7 +1,5 @@
 import logging
 import traceback
-import csv
-import os
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait, Select
@@ -15,6 +13,8 @@ from viajes_log import registrar_viaje_exitoso as log_viaje_exitoso, registrar_v
 # Importar nuevos módulos de mejora
 from modules.screenshot_manager import ScreenshotManager
 from modules.debug_logger import debug_logger
+from modules import robot_state_manager
+from modules.clave_ruta_base import buscar_determinante
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,34 +34,23 @@ def obtener_tipo_documento_cfdi(clave_determinante):
     Returns:
         str: Nombre del tipo de documento CFDI (ej: "FACTURA CFDI - W")
     """
-    csv_path = os.path.join(os.path.dirname(__file__), 'clave_ruta_base.csv')
     tipo_default = "FACTURA CFDI - W"
 
-    try:
-        if not os.path.exists(csv_path):
-            logger.warning(f"CSV no encontrado: {csv_path} - usando tipo default")
-            return tipo_default
-
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-
-            for row in reader:
-                if row.get('determinante') == str(clave_determinante):
-                    tipo_doc = row.get('tipo_documento', '').strip()
-                    if tipo_doc:
-                        logger.info(f"Tipo documento para clave {clave_determinante}: '{tipo_doc}'")
-                        return tipo_doc
-                    else:
-                        logger.warning(f"Clave {clave_determinante} encontrada pero sin tipo_documento - usando default")
-                        return tipo_default
+    fila, estado = buscar_determinante(clave_determinante)
 
-        # Clave no encontrada en CSV
-        logger.warning(f"Clave {clave_determinante} no encontrada en CSV - usando default '{tipo_default}'")
+    if fila:
+        tipo_doc = (fila.get('tipo_documento') or '').strip()
+        if tipo_doc:
+            logger.info(f"Tipo documento para clave {clave_determinante}: '{tipo_doc}'")
+            return tipo_doc
+        logger.warning(f"Clave {clave_determinante} encontrada pero sin tipo_documento - usando default")
         return tipo_default
 
-    except Exception as e:
-        logger.error(f"Error al leer CSV de claves: {e} - usando default")
-        return tipo_default
+    if estado == "DETERMINANTE_NO_ENCONTRADA":
+        logger.warning(f"Clave {clave_determinante} no encontrada en CSV - usando default '{tipo_default}'")
+    else:
+        logger.warning(f"No se pudo leer el CSV de claves ({estado}) - usando tipo default")
+    return tipo_default
 
 class ProcesadorLlegadaFactura:
     def __init__(self, driver, datos_viaje):
@@ -102,6 +91,7 @@ class ProcesadorLlegadaFactura:
             # Paso 1: Hacer clic en "Llegada"
             paso_actual = "Clic en link 'Llegada'"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Llegada")
             if not self._hacer_clic_llegada():
                 return False
 
@@ -114,12 +104,14 @@ class ProcesadorLlegadaFactura:
             # Paso 3: Autorizar
             paso_actual = "Autorización del viaje"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Autorización")
             if not self._autorizar():
                 return False
 
             # Paso 4: Facturar
             paso_actual = "Proceso de facturación"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Facturación")
             if not self._procesar_facturacion():
                 return False
 
@@ -507,6 +499,7 @@ class ProcesadorLlegadaFactura:
                 imprimir_btn = self.wait.until(EC.element_to_be_clickable((By.ID, "BTN_IMPRIMIR")))
                 
                 logger.info(" INICIANDO EXTRACCIÓN AUTOMÁTICA DE DATOS")
+                robot_state_manager.actualizar_fase_viaje("Extracción PDF")
                 
                 # Configurar descarga automática antes de hacer clic
                 from .pdf_extractor import PDFExtractor
@@ -552,6 +545,8 @@ class ProcesadorLlegadaFactura:
                 logger.error(f" Error al hacer clic en 'Imprimir' o extraer datos: {e}")
                 return False
             
+            robot_state_manager.actualizar_fase_viaje("Llegada")
+
             # Cerrar ventana de impresión
             try:
                 # Buscar botón de cerrar
@@ -4,7 +4,6 @@ from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import time
-import csv
 import os
 import logging
 import traceback
@@ -14,6 +13,7 @@ from viajes_log import registrar_viaje_fallido as log_viaje_fallido
 # Importar nuevos módulos de mejora
 from modules.screenshot_manager import ScreenshotManager
 from modules.debug_logger import debug_logger
+from modules.clave_ruta_base import buscar_determinante
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -52,29 +52,20 @@ class GMSalidaAutomation:
 
     def obtener_sucursal_por_determinante(self, clave_determinante):
         """Obtiene la sucursal correspondiente a la clave determinante"""
-        csv_path = 'modules/clave_ruta_base.csv'
-        
         # Mapeo de base_origen a valores del select (solo las que usamos)
         mapeo_sucursales = {
             'HERMOSILLO': '6',    # BASE HERMOSILLO
             'OBREGON': '7'        # BASE OBREGON
         }
         
-        try:
-            if os.path.exists(csv_path):
-                with open(csv_path, newline='', encoding='utf-8') as csvfile:
-                    reader = csv.DictReader(csvfile)
-                    for row in reader:
-                        if row['determinante'] == str(clave_determinante):
-                            base_origen = row['base_origen'].upper()
-                            valor_select = mapeo_sucursales.get(base_origen, '1')  # Default: TODAS
-                            logger.info(f" Determinante {clave_determinante} -> Base: {base_origen} -> Valor: {valor_select}")
-                            return valor_select
-            else:
-                logger.warning(f" No se encontró archivo: {csv_path}")
-                
-        except Exception as e:
-            logger.error(f" Error al obtener sucursal: {e}")
+        fila, estado = buscar_determinante(clave_determinante)
+        if fila:
+            base_origen = fila['base_origen'].upper()
+            valor_select = mapeo_sucursales.get(base_origen, '1')  # Default: TODAS
+            logger.info(f" Determinante {clave_determinante} -> Base: {base_origen} -> Valor: {valor_select}")
+            return valor_select
+        if estado == "ARCHIVO_CSV_NO_EXISTE":
+            logger.warning(" No se encontró archivo: clave_ruta_base.csv")
             
         return '1'  # Default: TODAS
     
@@ -4,18 +4,18 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import time
-import csv
 import os
 import logging
 from datetime import datetime
 from .gm_facturacion1 import ir_a_facturacion
 from .gm_salida import procesar_salida_viaje
 from .gm_llegadayfactura2 import procesar_llegada_factura
-from .parser import parse_xls
+from .clave_ruta_base import buscar_determinante
 from viajes_log import registrar_viaje_fallido as log_viaje_fallido
 # Importar módulos de mejora
 from .screenshot_manager import ScreenshotManager
 from .debug_logger import debug_logger
+from . import robot_state_manager
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -158,36 +158,22 @@ class GMTransportAutomation:
 
     def obtener_ruta_y_base(self, determinante):
         """Obtiene la ruta GM y base origen desde el CSV"""
-        csv_path = 'modules/clave_ruta_base.csv'
-
         logger.info(f"Buscando ruta para determinante: {determinante}")
-        
-        try:
-            if not os.path.exists(csv_path):
-                logger.error(f"No existe el archivo: {csv_path}")
-                return None, None, "ARCHIVO_CSV_NO_EXISTE"
-                
-            with open(csv_path, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                
-                determinantes_disponibles = []
-                
-                for i, row in enumerate(reader):
-                    determinantes_disponibles.append(row['determinante'])
-                    
-                    if row['determinante'] == str(determinante):
-                        logger.info(f"Determinante {determinante} -> ruta {row['ruta_gm']}, base {row['base_origen']}")
-                        return row['ruta_gm'], row['base_origen'], "ENCONTRADO"
-                
-                logger.error("DETERMINANTE NO ENCONTRADA")
-                logger.error(f"Determinante buscada: {determinante}")
-                logger.error("Esta determinante debe agregarse al archivo clave_ruta_base.csv")
-                
-                return None, None, "DETERMINANTE_NO_ENCONTRADA"
-                        
-        except Exception as e:
-            logger.error(f"Error al leer CSV: {e}")
-            return None, None, "ERROR_LECTURA_CSV"
+
+        fila, estado = buscar_determinante(determinante)
+
+        if estado == "ENCONTRADO":
+            logger.info(f"Determinante {determinante} -> ruta {fila['ruta_gm']}, base {fila['base_origen']}")
+            return fila['ruta_gm'], fila['base_origen'], estado
+
+        if estado == "DETERMINANTE_NO_ENCONTRADA":
+            logger.error("DETERMINANTE NO ENCONTRADA")
+            logger.error(f"Determinante buscada: {determinante}")
+            logger.error("Esta determinante debe agregarse al archivo clave_ruta_base.csv")
+        else:
+            logger.error(f"No se pudo leer clave_ruta_base.csv: {estado}")
+
+        return None, None, estado
     
     def llenar_fecha(self, id_input, fecha_valor, incluir_hora=True):
         try:
@@ -617,6 +603,7 @@ class GMTransportAutomation:
             
             paso_actual = "Navegación a crear viaje"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Navegación")
 
             from .navigate_to_create_viaje import navigate_to_create_viaje
             if not navigate_to_create_viaje(self.driver):
@@ -641,6 +628,7 @@ class GMTransportAutomation:
             clave_determinante = self.datos_viaje['clave_determinante']
             
             logger.info(f"Procesando viaje REAL: Prefactura {prefactura_valor}")
+            robot_state_manager.actualizar_fase_viaje("Fechas")
             
             self.llenar_campo_texto("EDT_NOVIAJECLIENTE", prefactura_valor, "Prefactura")
             self.llenar_campo_texto("EDT_NUMEROCLIENTE", cliente_codigo, "Cliente")
@@ -699,6 +687,7 @@ class GMTransportAutomation:
 
             paso_actual = "Llenado de fechas del viaje"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Ruta")
 
             try:
                 campo_ruta = self.wait.until(EC.element_to_be_clickable((By.ID, "EDT_FOLIORUTA")))
@@ -755,6 +744,7 @@ class GMTransportAutomation:
 
             paso_actual = "Selección de remolque"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Remolque")
 
             self.cerrar_todos_los_alerts()
             self.cerrar_calendarios_abiertos()
@@ -779,6 +769,7 @@ class GMTransportAutomation:
             
             paso_actual = "Selección de tractor y operador"
             debug_logger.debug(f"Paso actual: {paso_actual}")
+            robot_state_manager.actualizar_fase_viaje("Tractor y operador")
 
             self.cerrar_todos_los_alerts()
             self.cerrar_calendarios_abiertos()
@@ -830,6 +821,7 @@ class GMTransportAutomation:
                         pass
                     return False
 
+            robot_state_manager.actualizar_fase_viaje("Conceptos facturación")
             try:
                 resultado_facturacion = ir_a_facturacion(self.driver, total_factura_valor, self.datos_viaje)
                 if not resultado_facturacion:
@@ -837,6 +829,7 @@ class GMTransportAutomation:
             except Exception as e:
                 logger.warning(f"Error en facturación inicial: {e} - continuando...")
 
+            robot_state_manager.actualizar_fase_viaje("Salida")
             try:
                 resultado_salida = procesar_salida_viaje(self.driver, self.datos_viaje, configurar_filtros=True)
                 if resultado_salida == "OPERADOR_OCUPADO":
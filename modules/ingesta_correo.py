@@ -0,0 +1,247 @@
+"""
+Ingesta de Correo - Hilo que agrega viajes a la cola en cuanto llega el correo
+
+Funcionalidades:
+- Corre independiente del procesamiento de viajes: los correos nuevos se descubren
+  aunque la cola tenga un backlog largo
+- Despierta por evento de la fuente (NewMailEx en Outlook, cambios en la carpeta Maildir)
+- Revisión de respaldo cada INTERVALO_REVISION_RESPALDO por si se pierde un evento
+- Avisa al bucle principal cuando agrega viajes (esperar_viajes) para que no haga polling
+- La sesión de correo vive en este hilo (COM es por hilo) y se cierra al detenerlo
+- ControladorIngesta: tamaño de lote por ciclo según cola, throughput y backlog del correo
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ESPERA_EVENTO_SEGUNDOS = 5              # Tramo máximo de espera (para responder a detener())
+INTERVALO_REVISION_RESPALDO = 300       # Revisión aunque no llegue evento (cada 5 min)
+ESPERA_TRAS_ERROR_SEGUNDOS = 30
+
+CONTROL_INGESTA_CONFIG = {
+    'buffer_minimo': 3,                     # Viajes listos en cola que siempre se buscan tener
+    'horizonte_minutos': 30,                # Trabajo en cola a mantener según el throughput medido
+    'lote_maximo': 50,                      # Tope por ciclo (la cola es un JSON que se reescribe completo)
+    'ventana_throughput_minutos': 60,
+    'throughput_inicial_por_minuto': 0.3    # Sin historial: ~1 viaje cada 3 min
+}
+
+
+class ControladorIngesta:
+    """
+    Decide cuántos correos extraer por ciclo
+
+    objetivo = max(buffer_minimo, throughput * horizonte); lote = objetivo - pendientes,
+    limitado por el backlog del correo y lote_maximo. Con la cola vacía nunca regresa
+    menos de buffer_minimo (los workers no se quedan sin trabajo).
+    """
+
+    def __init__(self, config=None):
+        self.config = dict(CONTROL_INGESTA_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._terminados = deque()
+        self._ultima_decision = None
+        self._decisiones = 0
+        self._correos_dejados = 0
+
+    def registrar_viaje_procesado(self):
+        """Lo llama el bucle de proceso al terminar cada viaje (exitoso, fallido o reintento)"""
+        with self._lock:
+            self._terminados.append(time.monotonic())
+            self._recortar_ventana()
+
+    def _recortar_ventana(self):
+        limite = time.monotonic() - self.config['ventana_throughput_minutos'] * 60
+        while self._terminados and self._terminados[0] < limite:
+            self._terminados.popleft()
+
+    def throughput_por_minuto(self):
+        with self._lock:
+            self._recortar_ventana()
+            if len(self._terminados) < 2:
+                return self.config['throughput_inicial_por_minuto']
+            minutos = max((time.monotonic() - self._terminados[0]) / 60, 1.0)
+            return len(self._terminados) / minutos
+
+    def objetivo_buffer(self):
+        return max(self.config['buffer_minimo'],
+                   round(self.throughput_por_minuto() * self.config['horizonte_minutos']))
+
+    def necesita_viajes(self, pendientes_cola):
+        """True si la cola bajó del objetivo (para pedir una revisión de correo)"""
+        return pendientes_cola < self.objetivo_buffer()
+
+    def calcular_lote(self, pendientes_cola, backlog_correo):
+        """
+        Tamaño del lote del ciclo
+
+        Args:
+            pendientes_cola: Viajes 'pendiente' en la cola
+            backlog_correo: Correos de prefactura no leídos
+
+        Returns:
+            int: Correos a extraer (0 = la cola ya tiene suficiente)
+        """
+        objetivo = self.objetivo_buffer()
+        lote = objetivo - pendientes_cola
+        if pendientes_cola == 0:
+            lote = max(lote, self.config['buffer_minimo'])
+        lote = max(0, min(lote, backlog_correo, self.config['lote_maximo']))
+
+        with self._lock:
+            self._decisiones += 1
+            self._correos_dejados = backlog_correo - lote
+            self._ultima_decision = {
+                'fecha': datetime.now().isoformat(),
+                'pendientes_cola': pendientes_cola,
+                'backlog_correo': backlog_correo,
+                'objetivo_buffer': objetivo,
+                'lote': lote
+            }
+        return lote
+
+    def obtener_metricas(self):
+        throughput = self.throughput_por_minuto()
+        with self._lock:
+            return {
+                'throughput_por_hora': round(throughput * 60, 1),
+                'viajes_en_ventana': len(self._terminados),
+                'objetivo_buffer': max(self.config['buffer_minimo'],
+                                       round(throughput * self.config['horizonte_minutos'])),
+                'decisiones': self._decisiones,
+                'correos_en_espera': self._correos_dejados,
+                'ultima_decision': self._ultima_decision
+            }
+
+
+class IngestorCorreo:
+    """Hilo de ingesta de correo dirigido por eventos"""
+
+    def __init__(self, fuente_correo, revisar_correos, intervalo_respaldo=INTERVALO_REVISION_RESPALDO,
+                 controlador=None):
+        """
+        Inicializa el ingestor (el hilo arranca con iniciar())
+
+        Args:
+            fuente_correo: MailSource que avisa de correo nuevo (esperar_correo_nuevo)
+            revisar_correos: Función que lee los correos pendientes y los agrega a la cola;
+                regresa True si agregó viajes
+            intervalo_respaldo: Segundos entre revisiones aunque no llegue evento
+            controlador: ControladorIngesta (solo para reportar sus métricas)
+        """
+        self.fuente_correo = fuente_correo
+        self.revisar_correos = revisar_correos
+        self.intervalo_respaldo = intervalo_respaldo
+        self.controlador = controlador
+        self._detener = threading.Event()
+        self._solicitud = threading.Event()
+        self._viajes_nuevos = threading.Event()
+        self._hilo = None
+
+        self._ciclos = 0
+        self._ciclos_por_evento = 0
+        self._ultimo_ciclo = None
+        self._ultimo_viaje_agregado = None
+        self._ultimo_error = None
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="ingesta-correo", daemon=True)
+        self._hilo.start()
+        logger.info("Ingesta de correo iniciada")
+
+    def detener(self, timeout=30):
+        if not self._hilo or not self._hilo.is_alive():
+            return
+        self._detener.set()
+        self._hilo.join(timeout)
+        if self._hilo.is_alive():
+            logger.warning(f"Ingesta de correo no terminó en {timeout}s")
+        else:
+            logger.info("Ingesta de correo detenida")
+
+    def ejecutar_ciclo(self, por_evento=False):
+        """
+        Una revisión de correo (también usable sin hilo, ej. en modo prueba)
+
+        Returns:
+            bool: True si se agregaron viajes a la cola
+        """
+        self._ciclos += 1
+        self._ciclos_por_evento += 1 if por_evento else 0
+        self._ultimo_ciclo = datetime.now().isoformat()
+        try:
+            agregados = bool(self.revisar_correos())
+        except Exception as e:
+            self._ultimo_error = str(e)
+            logger.error(f"Error en ciclo de ingesta: {e}")
+            return False
+
+        self._ultimo_error = None
+        if agregados:
+            self._ultimo_viaje_agregado = datetime.now().isoformat()
+            self._viajes_nuevos.set()
+        return agregados
+
+    def solicitar_revision(self):
+        """Pide un ciclo aunque no llegue correo (ej. la cola bajó del objetivo)"""
+        self._solicitud.set()
+
+    def esperar_viajes(self, timeout):
+        """
+        Para el bucle principal: espera a que la ingesta agregue viajes
+
+        Returns:
+            bool: True si llegaron viajes nuevos antes del timeout
+        """
+        if self._viajes_nuevos.wait(timeout):
+            self._viajes_nuevos.clear()
+            return True
+        return False
+
+    def _bucle(self):
+        try:
+            # Lo que quedó pendiente mientras el robot estaba detenido
+            self.ejecutar_ciclo()
+            proxima_revision = time.monotonic() + self.intervalo_respaldo
+
+            while not self._detener.is_set():
+                espera = max(0.1, min(ESPERA_EVENTO_SEGUNDOS, proxima_revision - time.monotonic()))
+                try:
+                    hay_correo = self.fuente_correo.esperar_correo_nuevo(espera)
+                except Exception as e:
+                    logger.warning(f"Error esperando correo nuevo: {e}")
+                    self.fuente_correo.registrar_error(e)
+                    self._detener.wait(ESPERA_TRAS_ERROR_SEGUNDOS)
+                    continue
+
+                if self._detener.is_set():
+                    break
+                solicitado = self._solicitud.is_set()
+                if not (hay_correo or solicitado) and time.monotonic() < proxima_revision:
+                    continue
+                self._solicitud.clear()
+
+                self.ejecutar_ciclo(por_evento=hay_correo)
+                proxima_revision = time.monotonic() + self.intervalo_respaldo
+        finally:
+            # La sesión COM pertenece a este hilo: se cierra aquí
+            self.fuente_correo.desconectar()
+
+    def obtener_estado(self):
+        return {
+            'activo': bool(self._hilo and self._hilo.is_alive() and not self._detener.is_set()),
+            'ciclos': self._ciclos,
+            'ciclos_por_evento': self._ciclos_por_evento,
+            'ultimo_ciclo': self._ultimo_ciclo,
+            'ultimo_viaje_agregado': self._ultimo_viaje_agregado,
+            'ultimo_error': self._ultimo_error,
+            'controlador': self.controlador.obtener_metricas() if self.controlador else None
+        }
@@ -0,0 +1,651 @@
+"""
+Mail Source - Fuentes de correo intercambiables para la ingesta de viajes
+
+Funcionalidades:
+- Interfaz MailSource: iterar no leídos, adjuntos como bytes, marcar leído, mover a carpeta
+- FiltroCorreo: remitente/asunto/adjuntos; en Outlook se resuelve con una consulta DASL
+  y una Table con solo las columnas necesarias (una llamada COM para todas las filas)
+- OutlookMailSource: bandeja de entrada de Outlook vía COM (Windows); sesión persistente
+  entre ciclos, carpetas en cache, reconexión tras errores COM y métricas de conexión
+- MaildirMailSource: Maildir local o carpeta de archivos .eml (Linux, pruebas, benchmarks)
+- esperar_correo_nuevo(): NewMailEx en Outlook, vigilancia de la carpeta en Maildir
+- crear_fuente_correo(): elige la fuente según la configuración
+"""
+
+import os
+import shutil
+import threading
+import time
+import logging
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser, BytesHeaderParser
+from email.utils import parseaddr, parsedate_to_datetime
+
+try:
+    import win32com.client
+    import pythoncom
+except ImportError:
+    # Fuera de Windows solo está disponible MaildirMailSource
+    win32com = None
+    pythoncom = None
+
+logger = logging.getLogger(__name__)
+
+FUENTE_CORREO_CONFIG = {
+    'tipo': 'outlook',          # 'outlook' o 'maildir'
+    'ruta_maildir': 'correos'   # Maildir o carpeta con archivos .eml
+}
+
+# Sesión de Outlook: se mantiene abierta entre ciclos y se reconecta ante errores COM
+SESION_OUTLOOK_CONFIG = {
+    'intentos_conexion': 3,
+    'espera_reintento_segundos': 2
+}
+
+
+class FiltroCorreo:
+    """Filtro de mensajes no leídos (en Outlook se resuelve del lado del servidor)"""
+
+    def __init__(self, remitente=None, asunto_contiene=None, asunto_excluye=None, con_adjuntos=False):
+        """
+        Args:
+            remitente: Texto que debe contener la dirección del remitente
+            asunto_contiene: Texto que debe contener el asunto
+            asunto_excluye: Texto que NO debe contener el asunto
+            con_adjuntos: Solo mensajes con adjuntos
+        """
+        self.remitente = remitente
+        self.asunto_contiene = asunto_contiene
+        self.asunto_excluye = asunto_excluye
+        self.con_adjuntos = con_adjuntos
+
+    def coincide(self, remitente, asunto, tiene_adjuntos=True):
+        """Evaluación local del filtro (sin distinguir mayúsculas)"""
+        remitente = (remitente or "").lower()
+        asunto = (asunto or "").lower()
+        if self.remitente and self.remitente.lower() not in remitente:
+            return False
+        if self.asunto_contiene and self.asunto_contiene.lower() not in asunto:
+            return False
+        if self.asunto_excluye and self.asunto_excluye.lower() in asunto:
+            return False
+        if self.con_adjuntos and not tiene_adjuntos:
+            return False
+        return True
+
+
+class AdjuntoCorreo:
+    """Adjunto de un correo"""
+
+    def __init__(self, nombre, contenido=None):
+        self.nombre = nombre or ""
+        self._contenido = contenido
+
+    def obtener_bytes(self):
+        return self._contenido
+
+    def guardar(self, ruta):
+        """Guarda el adjunto en disco"""
+        with open(ruta, 'wb') as f:
+            f.write(self.obtener_bytes())
+
+
+class MensajeCorreo:
+    """Mensaje de una fuente de correo"""
+
+    id = None
+    message_id = ""     # Message-ID de internet (estable aunque el mensaje se mueva)
+    asunto = ""
+    remitente = ""
+    fecha = None
+
+    @property
+    def clave(self):
+        """Identificador persistente del mensaje (Message-ID, o el id de la fuente si no tiene)"""
+        return self.message_id or self.id
+
+    def adjuntos(self):
+        """Lista de AdjuntoCorreo"""
+        raise NotImplementedError
+
+    def marcar_leido(self):
+        raise NotImplementedError
+
+    def mover_a(self, carpeta):
+        """Mueve el mensaje a una subcarpeta de la bandeja (se crea si no existe)"""
+        raise NotImplementedError
+
+
+class MailSource:
+    """Interfaz de una fuente de correo"""
+
+    nombre = "base"
+
+    def conectar(self):
+        """Abre la fuente; regresa False si no está disponible"""
+        raise NotImplementedError
+
+    def cerrar(self):
+        """Fin de un ciclo de lectura (la sesión puede quedar abierta para el siguiente)"""
+        pass
+
+    def desconectar(self):
+        """Cierra la sesión por completo (al detener el robot)"""
+        self.cerrar()
+
+    def registrar_error(self, error):
+        """Avisa a la fuente de un error de lectura (puede invalidar la sesión)"""
+        pass
+
+    def esperar_correo_nuevo(self, timeout):
+        """
+        Bloquea hasta que llegue correo nuevo o pase el timeout
+
+        Returns:
+            bool: True si puede haber correo nuevo. Sin soporte de eventos siempre
+            regresa True al vencer el timeout (equivale a revisar periódicamente)
+        """
+        time.sleep(timeout)
+        return True
+
+    def obtener_metricas(self):
+        """Métricas de conexión de la fuente"""
+        return {'fuente': self.nombre}
+
+    def contar_no_leidos(self, filtro=None):
+        raise NotImplementedError
+
+    def mensajes_no_leidos(self, filtro=None):
+        """Itera los mensajes no leídos que cumplen el filtro, del más reciente al más antiguo"""
+        raise NotImplementedError
+
+
+# ---------------------------------------------------------------------------
+# Outlook (COM)
+# ---------------------------------------------------------------------------
+
+# Propiedades DASL usadas en el filtro del lado del servidor
+PROP_LEIDO = "urn:schemas:httpmail:read"
+PROP_ASUNTO = "urn:schemas:httpmail:subject"
+PROP_CON_ADJUNTOS = "urn:schemas:httpmail:hasattachment"
+PROP_REMITENTE = "http://schemas.microsoft.com/mapi/proptag/0x0C1F001F"  # PR_SENDER_EMAIL_ADDRESS
+PROP_MESSAGE_ID = "http://schemas.microsoft.com/mapi/proptag/0x1035001F"  # PR_INTERNET_MESSAGE_ID
+PROP_DATOS_ADJUNTO = "http://schemas.microsoft.com/mapi/proptag/0x37010102"  # PR_ATTACH_DATA_BIN
+
+# Columnas que se piden a la Table (en este orden)
+COLUMNAS_TABLA = ["EntryID", "Subject", "SenderEmailAddress", "ReceivedTime", PROP_MESSAGE_ID]
+
+
+class AdjuntoOutlook(AdjuntoCorreo):
+    def __init__(self, adjunto_com, carpeta_temporal):
+        super().__init__(adjunto_com.FileName)
+        self._adjunto = adjunto_com
+        self._carpeta_temporal = carpeta_temporal
+
+    def guardar(self, ruta):
+        # SaveAsFile escribe directo a disco sin pasar el contenido por Python
+        self._adjunto.SaveAsFile(ruta)
+
+    def obtener_bytes(self):
+        if self._contenido is None:
+            try:
+                # PR_ATTACH_DATA_BIN: el contenido en una llamada COM, sin pasar por disco
+                self._contenido = bytes(self._adjunto.PropertyAccessor.GetProperty(PROP_DATOS_ADJUNTO))
+                return self._contenido
+            except Exception:
+                # Adjuntos grandes o incrustados: se guardan a un temporal
+                pass
+            ruta = os.path.join(self._carpeta_temporal, f"adjunto_{os.getpid()}_{id(self)}.tmp")
+            try:
+                self.guardar(ruta)
+                with open(ruta, 'rb') as f:
+                    self._contenido = f.read()
+            finally:
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+        return self._contenido
+
+
+class MensajeOutlook(MensajeCorreo):
+    """
+    Mensaje de Outlook; las propiedades vienen de la fila de la Table y el MailItem
+    solo se abre (GetItemFromID) cuando se necesitan adjuntos o modificarlo
+    """
+
+    def __init__(self, fuente, entry_id, asunto, remitente, fecha, message_id=None, item=None):
+        self._fuente = fuente
+        self._item_com = item
+        self.id = entry_id
+        self.message_id = message_id or ""
+        self.asunto = asunto or ""
+        self.remitente = remitente or ""
+        self.fecha = fecha
+
+    @classmethod
+    def desde_item(cls, item, fuente):
+        try:
+            message_id = item.PropertyAccessor.GetProperty(PROP_MESSAGE_ID)
+        except Exception:
+            message_id = None
+        return cls(fuente, item.EntryID, item.Subject, item.SenderEmailAddress, item.ReceivedTime,
+                   message_id, item)
+
+    @property
+    def _item(self):
+        if self._item_com is None:
+            self._item_com = self._fuente.obtener_item(self.id)
+        return self._item_com
+
+    def adjuntos(self):
+        adjuntos = self._item.Attachments
+        return [AdjuntoOutlook(adjuntos.Item(i), self._fuente.carpeta_temporal)
+                for i in range(1, adjuntos.Count + 1)]
+
+    def marcar_leido(self):
+        self._item.UnRead = False
+
+    def mover_a(self, carpeta):
+        self._item.Move(self._fuente.obtener_carpeta(carpeta))
+
+
+class OutlookMailSource(MailSource):
+    """
+    Bandeja de entrada de Outlook vía COM
+
+    La sesión (CoInitialize + Dispatch + bandeja) se abre una vez y se reutiliza entre
+    ciclos; cerrar() no la destruye. Si una llamada COM falla, la sesión se invalida y
+    el siguiente conectar() reconecta. Los objetos COM pertenecen al hilo que los creó:
+    si se llama desde otro hilo se abre una sesión nueva en ese hilo.
+    """
+
+    nombre = "outlook"
+
+    def __init__(self, carpeta_temporal=None):
+        self.carpeta_temporal = carpeta_temporal or os.path.abspath("archivos_descargados")
+        self._com_inicializado = False
+        self._hilo_sesion = None
+        self._namespace = None
+        self._inbox = None
+        self._carpetas = {}
+        self._eventos = None
+        self._senal_correo = threading.Event()
+        self._metricas = {
+            'conexiones': 0,
+            'reconexiones': 0,
+            'errores_com': 0,
+            'ultima_conexion': None,
+            'ultimo_tiempo_conexion_ms': None,
+            'tiempo_total_conexion_ms': 0.0,
+            'ultimo_error': None
+        }
+
+    def _sesion_viva(self):
+        if self._inbox is None or self._hilo_sesion != threading.get_ident():
+            return False
+        try:
+            # Llamada COM barata para confirmar que Outlook sigue respondiendo
+            self._inbox.Name
+            return True
+        except Exception as e:
+            self.registrar_error(e)
+            return False
+
+    def conectar(self):
+        if win32com is None:
+            logger.error("pywin32 no está instalado - Outlook no disponible")
+            return False
+        if self._sesion_viva():
+            return True
+
+        reconexion = self._metricas['conexiones'] > 0
+        self._liberar_sesion()
+
+        for intento in range(1, SESION_OUTLOOK_CONFIG['intentos_conexion'] + 1):
+            inicio = time.perf_counter()
+            try:
+                pythoncom.CoInitialize()
+                self._com_inicializado = True
+                self._hilo_sesion = threading.get_ident()
+                self._namespace = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
+                self._inbox = self._namespace.GetDefaultFolder(6)
+            except Exception as e:
+                self._metricas['ultimo_error'] = str(e)
+                logger.error(f"Error conectando a Outlook (intento {intento}): {e}")
+                self._liberar_sesion()
+                if intento < SESION_OUTLOOK_CONFIG['intentos_conexion']:
+                    time.sleep(SESION_OUTLOOK_CONFIG['espera_reintento_segundos'] * intento)
+                continue
+
+            milisegundos = (time.perf_counter() - inicio) * 1000
+            self._metricas['conexiones'] += 1
+            self._metricas['reconexiones'] += 1 if reconexion else 0
+            self._metricas['ultima_conexion'] = datetime.now().isoformat()
+            self._metricas['ultimo_tiempo_conexion_ms'] = round(milisegundos, 1)
+            self._metricas['tiempo_total_conexion_ms'] += milisegundos
+            logger.info(f"Conexión a Outlook {'restablecida' if reconexion else 'establecida'} "
+                        f"en {milisegundos:.0f}ms")
+            return True
+
+        return False
+
+    def registrar_error(self, error):
+        """Invalida la sesión tras un error COM (se reconecta en el siguiente conectar())"""
+        self._metricas['errores_com'] += 1
+        self._metricas['ultimo_error'] = str(error)
+        logger.warning(f"Error COM en sesión de Outlook ({error}) - se reconectará")
+        self._inbox = None
+        self._namespace = None
+        self._carpetas = {}
+        self._eventos = None
+
+    def _liberar_sesion(self):
+        self._inbox = None
+        self._namespace = None
+        self._carpetas = {}
+        self._eventos = None
+        try:
+            # CoUninitialize solo es válido en el hilo que inicializó COM
+            if self._com_inicializado and self._hilo_sesion == threading.get_ident():
+                pythoncom.CoUninitialize()
+        except Exception as e:
+            logger.warning(f"Error limpiando COM: {e}")
+        self._com_inicializado = False
+        self._hilo_sesion = None
+
+    def cerrar(self):
+        # La sesión queda abierta para el siguiente ciclo
+        pass
+
+    def desconectar(self):
+        self._liberar_sesion()
+
+    def _suscribir_correo_nuevo(self):
+        """Suscribe NewMailEx de Outlook (el evento solo levanta la señal; la lectura es del ciclo)"""
+        senal = self._senal_correo
+
+        class EventosOutlook:
+            def OnNewMailEx(self, entry_ids):
+                senal.set()
+
+        try:
+            self._eventos = win32com.client.DispatchWithEvents("Outlook.Application", EventosOutlook)
+            logger.info("Suscrito a NewMailEx de Outlook")
+        except Exception as e:
+            # Sin eventos se sigue revisando periódicamente
+            self._eventos = False
+            logger.warning(f"No se pudo suscribir a NewMailEx ({e}) - revisión periódica")
+
+    def esperar_correo_nuevo(self, timeout):
+        if not self.conectar():
+            time.sleep(timeout)
+            return False
+        if self._eventos is None:
+            self._suscribir_correo_nuevo()
+        if not self._eventos:
+            return super().esperar_correo_nuevo(timeout)
+
+        limite = time.monotonic() + timeout
+        while True:
+            # Los eventos COM se entregan al bombear mensajes en el hilo de la sesión
+            pythoncom.PumpWaitingMessages()
+            if self._senal_correo.is_set():
+                self._senal_correo.clear()
+                return True
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+            time.sleep(min(0.5, restante))
+
+    def obtener_metricas(self):
+        metricas = dict(self._metricas, fuente=self.nombre, conectado=self._inbox is not None)
+        if metricas['conexiones']:
+            metricas['promedio_conexion_ms'] = round(metricas['tiempo_total_conexion_ms'] / metricas['conexiones'], 1)
+        return metricas
+
+    def _consulta_dasl(self, filtro):
+        """Filtro DASL equivalente a FiltroCorreo (no leídos + criterios del filtro)"""
+        def literal(texto):
+            return texto.replace("'", "''")
+
+        condiciones = [f'"{PROP_LEIDO}" = 0']
+        if filtro:
+            if filtro.remitente:
+                condiciones.append(f"\"{PROP_REMITENTE}\" LIKE '%{literal(filtro.remitente)}%'")
+            if filtro.asunto_contiene:
+                condiciones.append(f"\"{PROP_ASUNTO}\" LIKE '%{literal(filtro.asunto_contiene)}%'")
+            if filtro.asunto_excluye:
+                condiciones.append(f"NOT (\"{PROP_ASUNTO}\" LIKE '%{literal(filtro.asunto_excluye)}%')")
+            if filtro.con_adjuntos:
+                condiciones.append(f'"{PROP_CON_ADJUNTOS}" = 1')
+        return "@SQL=" + " AND ".join(f"({c})" for c in condiciones)
+
+    def _tabla(self, filtro):
+        """Table de Outlook con solo las columnas necesarias, ya filtrada y ordenada"""
+        tabla = self._inbox.GetTable(self._consulta_dasl(filtro), 0)
+        tabla.Columns.RemoveAll()
+        for columna in COLUMNAS_TABLA:
+            tabla.Columns.Add(columna)
+        tabla.Sort("[ReceivedTime]", True)
+        return tabla
+
+    def _items_restringidos(self, filtro):
+        mensajes = self._inbox.Items.Restrict(self._consulta_dasl(filtro))
+        mensajes.Sort("[ReceivedTime]", True)
+        return mensajes
+
+    def contar_no_leidos(self, filtro=None):
+        try:
+            return self._tabla(filtro).GetRowCount()
+        except Exception:
+            try:
+                return self._items_restringidos(filtro).Count
+            except Exception as e:
+                self.registrar_error(e)
+                raise
+
+    def mensajes_no_leidos(self, filtro=None):
+        try:
+            tabla = self._tabla(filtro)
+            total = tabla.GetRowCount()
+            # Una sola llamada COM trae todas las filas con sus columnas
+            filas = tabla.GetArray(total) if total else []
+        except Exception as e:
+            logger.warning(f"GetTable no disponible ({e}) - usando Items.Restrict")
+            try:
+                items = self._items_restringidos(filtro)
+            except Exception as e:
+                self.registrar_error(e)
+                raise
+            for item in items:
+                yield MensajeOutlook.desde_item(item, self)
+            return
+
+        for entry_id, asunto, remitente, fecha, message_id in filas:
+            yield MensajeOutlook(self, entry_id, asunto, remitente, fecha, message_id)
+
+    def obtener_item(self, entry_id):
+        return self._namespace.GetItemFromID(entry_id)
+
+    def obtener_carpeta(self, nombre):
+        """Subcarpeta de la bandeja (se crea si no existe); se resuelve una vez por sesión"""
+        if nombre not in self._carpetas:
+            try:
+                carpeta = self._inbox.Folders(nombre)
+            except Exception:
+                carpeta = self._inbox.Folders.Add(nombre)
+            self._carpetas[nombre] = carpeta
+        return self._carpetas[nombre]
+
+
+# ---------------------------------------------------------------------------
+# Maildir / carpeta de .eml
+# ---------------------------------------------------------------------------
+
+def _leer_encabezados(ruta):
+    with open(ruta, 'rb') as f:
+        return BytesHeaderParser(policy=policy.default).parse(f)
+
+
+def _fecha_de(encabezados, ruta):
+    try:
+        return parsedate_to_datetime(encabezados['Date'])
+    except Exception:
+        return datetime.fromtimestamp(os.path.getmtime(ruta))
+
+
+def _adjuntos_de_archivo(ruta):
+    """Parsea el mensaje completo (solo cuando se piden los adjuntos)"""
+    with open(ruta, 'rb') as f:
+        mensaje = BytesParser(policy=policy.default).parse(f)
+    return [AdjuntoCorreo(parte.get_filename(), parte.get_payload(decode=True) or b"")
+            for parte in mensaje.iter_attachments()]
+
+
+class MensajeArchivo(MensajeCorreo):
+    """Mensaje guardado en un archivo (.eml o entrada de Maildir)"""
+
+    def __init__(self, ruta, fuente):
+        self._ruta = ruta
+        self._fuente = fuente
+        encabezados = _leer_encabezados(ruta)
+        self.id = os.path.basename(ruta).split(':', 1)[0]
+        self.message_id = str(encabezados['Message-ID'] or "").strip()
+        self.asunto = str(encabezados['Subject'] or "")
+        self.remitente = parseaddr(str(encabezados['From'] or ""))[1]
+        self.fecha = _fecha_de(encabezados, ruta)
+        # Sin adjuntos posibles si el mensaje no es multipart
+        self.puede_tener_adjuntos = encabezados.get_content_maintype() == 'multipart'
+
+    def adjuntos(self):
+        return _adjuntos_de_archivo(self._ruta)
+
+    def marcar_leido(self):
+        self._fuente.marcar_leido(self)
+
+    def mover_a(self, carpeta):
+        self._fuente.mover_a(self, carpeta)
+
+
+class MaildirMailSource(MailSource):
+    """
+    Maildir local (new/ + cur/, flag 'S' = leído) o carpeta plana de archivos .eml
+
+    En Maildir, mover_a() usa subcarpetas Maildir++ ('.Problemas/cur'). En una
+    carpeta plana, leído = movido a 'leidos/' y mover_a() mueve a esa subcarpeta.
+    """
+
+    nombre = "maildir"
+
+    def __init__(self, ruta=None):
+        self.ruta = os.path.abspath(ruta or FUENTE_CORREO_CONFIG['ruta_maildir'])
+        self._es_maildir = False
+        self._firma_entrada = None
+
+    def conectar(self):
+        if not os.path.isdir(self.ruta):
+            logger.error(f"Carpeta de correo no existe: {self.ruta}")
+            return False
+        self._es_maildir = all(os.path.isdir(os.path.join(self.ruta, sub)) for sub in ('new', 'cur', 'tmp'))
+        logger.info(f"Fuente de correo local: {self.ruta} ({'Maildir' if self._es_maildir else 'carpeta .eml'})")
+        return True
+
+    def _firma_carpeta_entrada(self):
+        """mtime de la carpeta donde llega el correo (cambia al agregar/quitar archivos)"""
+        carpeta = os.path.join(self.ruta, 'new') if self._es_maildir else self.ruta
+        try:
+            return os.stat(carpeta).st_mtime_ns
+        except OSError:
+            return None
+
+    def esperar_correo_nuevo(self, timeout):
+        # Vigila la carpeta de entrada con stat() (sin dependencias tipo inotify)
+        if self._firma_entrada is None:
+            self._firma_entrada = self._firma_carpeta_entrada()
+        limite = time.monotonic() + timeout
+        while True:
+            firma = self._firma_carpeta_entrada()
+            if firma != self._firma_entrada:
+                self._firma_entrada = firma
+                return True
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+            time.sleep(min(1.0, restante))
+
+    def _entradas_no_leidas(self):
+        """Rutas de los mensajes no leídos, más recientes primero"""
+        entradas = []
+        if self._es_maildir:
+            for sub in ('new', 'cur'):
+                with os.scandir(os.path.join(self.ruta, sub)) as it:
+                    for entrada in it:
+                        if not entrada.is_file() or entrada.name.startswith('.'):
+                            continue
+                        flags = entrada.name.split(':2,', 1)[1] if ':2,' in entrada.name else ""
+                        if 'S' not in flags:
+                            entradas.append((entrada.stat().st_mtime, entrada.path))
+        else:
+            with os.scandir(self.ruta) as it:
+                for entrada in it:
+                    if entrada.is_file() and entrada.name.lower().endswith('.eml'):
+                        entradas.append((entrada.stat().st_mtime, entrada.path))
+        entradas.sort(reverse=True)
+        return [ruta for _, ruta in entradas]
+
+    def contar_no_leidos(self, filtro=None):
+        if filtro is None:
+            return len(self._entradas_no_leidas())
+        return sum(1 for _ in self.mensajes_no_leidos(filtro))
+
+    def mensajes_no_leidos(self, filtro=None):
+        for ruta in self._entradas_no_leidas():
+            try:
+                mensaje = MensajeArchivo(ruta, self)
+            except FileNotFoundError:
+                # Movido o leído por otro proceso mientras se iteraba
+                continue
+            if filtro and not filtro.coincide(mensaje.remitente, mensaje.asunto, mensaje.puede_tener_adjuntos):
+                continue
+            yield mensaje
+
+    def marcar_leido(self, mensaje):
+        if self._es_maildir:
+            nombre = os.path.basename(mensaje._ruta)
+            base, _, flags = nombre.partition(':2,')
+            flags = "".join(sorted(set(flags) | {'S'}))
+            self._mover_archivo(mensaje, os.path.join(self.ruta, 'cur'), f"{base}:2,{flags}")
+        else:
+            self._mover_archivo(mensaje, os.path.join(self.ruta, 'leidos'))
+
+    def mover_a(self, mensaje, carpeta):
+        if self._es_maildir:
+            carpeta_maildir = os.path.join(self.ruta, f".{carpeta}")
+            for sub in ('new', 'cur', 'tmp'):
+                os.makedirs(os.path.join(carpeta_maildir, sub), exist_ok=True)
+            self._mover_archivo(mensaje, os.path.join(carpeta_maildir, 'cur'))
+        else:
+            self._mover_archivo(mensaje, os.path.join(self.ruta, carpeta))
+
+    def _mover_archivo(self, mensaje, destino, nombre=None):
+        os.makedirs(destino, exist_ok=True)
+        nueva_ruta = os.path.join(destino, nombre or os.path.basename(mensaje._ruta))
+        shutil.move(mensaje._ruta, nueva_ruta)
+        mensaje._ruta = nueva_ruta
+
+
+def crear_fuente_correo(tipo=None, ruta=None):
+    """
+    Crea la fuente de correo configurada
+
+    Args:
+        tipo: 'outlook' o 'maildir' (default: FUENTE_CORREO_CONFIG['tipo'])
+        ruta: Ruta del Maildir/carpeta .eml (solo para 'maildir')
+
+    Returns:
+        MailSource
+    """
+    tipo = tipo or FUENTE_CORREO_CONFIG['tipo']
+    if tipo == 'maildir':
+        return MaildirMailSource(ruta)
+    return OutlookMailSource()
@@ -0,0 +1,196 @@
+"""
+Mensajes Procesados - Registro persistente de correos ya manejados por la ingesta
+
+Funcionalidades:
+- Guarda un hash de 64 bits del Message-ID (o EntryID) de cada correo ya manejado:
+  ingresado a la cola, descartado (no VACIO, duplicado) o movido a Problemas
+- Consulta O(1) antes de tocar asunto o adjuntos: los correos conocidos se rechazan de inmediato
+- Filtro Bloom opcional en memoria como primera capa (un "no" nunca consulta SQLite)
+- Persiste en SQLite (mensajes_procesados.db): sobrevive reinicios del robot
+- Purga de registros antiguos para mantener el archivo compacto
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_MENSAJES_PROCESADOS = "mensajes_procesados.db"
+
+MENSAJES_PROCESADOS_CONFIG = {
+    'usar_bloom': True,
+    'capacidad_bloom': 200000,         # Mensajes esperados antes de reconstruir el filtro
+    'falsos_positivos_bloom': 0.001,
+    'dias_retencion': 180
+}
+
+
+def hash_mensaje(clave):
+    """Hash de 64 bits (con signo, cabe en INTEGER de SQLite) de la clave del mensaje"""
+    digest = hashlib.blake2b(str(clave).strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class FiltroBloom:
+    """Filtro Bloom sobre hashes de 64 bits (doble hashing, sin dependencias)"""
+
+    def __init__(self, capacidad, falsos_positivos):
+        self.bits = max(64, int(-capacidad * math.log(falsos_positivos) / math.log(2) ** 2))
+        self.funciones = max(1, round(self.bits / capacidad * math.log(2)))
+        self._arreglo = bytearray((self.bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, valor):
+        valor &= 0xFFFFFFFFFFFFFFFF
+        h1 = valor & 0xFFFFFFFF
+        h2 = (valor >> 32) | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.funciones))
+
+    def agregar(self, valor):
+        for posicion in self._posiciones(valor):
+            self._arreglo[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += 1
+
+    def __contains__(self, valor):
+        return all(self._arreglo[p >> 3] & (1 << (p & 7)) for p in self._posiciones(valor))
+
+
+class RegistroMensajesProcesados:
+    """Conjunto persistente de correos ya manejados"""
+
+    def __init__(self, archivo=ARCHIVO_MENSAJES_PROCESADOS, config=None):
+        """
+        Inicializa el registro (la carga desde disco es diferida al primer uso)
+
+        Args:
+            archivo: Archivo SQLite del registro
+            config: Dict con las claves de MENSAJES_PROCESADOS_CONFIG
+        """
+        self.archivo = os.path.abspath(archivo)
+        self.config = dict(MENSAJES_PROCESADOS_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._bloom = None
+
+    def _conectar(self):
+        if self._conexion is None:
+            self._conexion = sqlite3.connect(self.archivo, timeout=10, check_same_thread=False)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS procesados (
+                    hash INTEGER PRIMARY KEY,
+                    resultado TEXT,
+                    prefactura TEXT,
+                    fecha TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self._conexion.commit()
+            if self.config['usar_bloom']:
+                self._reconstruir_bloom()
+        return self._conexion
+
+    def _reconstruir_bloom(self):
+        total = self._conexion.execute("SELECT COUNT(*) FROM procesados").fetchone()[0]
+        capacidad = max(self.config['capacidad_bloom'], total * 2)
+        self._bloom = FiltroBloom(capacidad, self.config['falsos_positivos_bloom'])
+        for (valor,) in self._conexion.execute("SELECT hash FROM procesados"):
+            self._bloom.agregar(valor)
+        logger.info(f"Registro de mensajes procesados cargado: {total} mensajes")
+
+    def contiene(self, clave):
+        """
+        True si el correo ya fue manejado
+
+        Args:
+            clave: Message-ID o EntryID del correo (MensajeCorreo.clave)
+        """
+        if not clave:
+            return False
+        valor = hash_mensaje(clave)
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                if self._bloom is not None and valor not in self._bloom:
+                    return False
+                return conexion.execute(
+                    "SELECT 1 FROM procesados WHERE hash = ?", (valor,)
+                ).fetchone() is not None
+        except sqlite3.Error as e:
+            logger.warning(f"Error consultando mensajes procesados: {e}")
+            return False
+
+    def registrar(self, clave, resultado, prefactura=None):
+        """
+        Marca un correo como manejado
+
+        Args:
+            clave: Message-ID o EntryID del correo
+            resultado: 'ingresado', 'no_vacio', 'duplicado', 'problemas', ...
+            prefactura: Prefactura del correo (informativo)
+        """
+        if not clave:
+            return
+        valor = hash_mensaje(clave)
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                conexion.execute(
+                    "INSERT OR REPLACE INTO procesados (hash, resultado, prefactura, fecha) VALUES (?, ?, ?, ?)",
+                    (valor, resultado, prefactura, datetime.now().isoformat())
+                )
+                conexion.commit()
+                if self._bloom is not None:
+                    self._bloom.agregar(valor)
+        except sqlite3.Error as e:
+            logger.warning(f"Error registrando mensaje procesado: {e}")
+
+    def purgar(self, dias=None):
+        """Elimina registros más antiguos que la retención (reconstruye el filtro Bloom)"""
+        dias = dias or self.config['dias_retencion']
+        corte = (datetime.now() - timedelta(days=dias)).isoformat()
+        with self._lock:
+            conexion = self._conectar()
+            eliminados = conexion.execute("DELETE FROM procesados WHERE fecha < ?", (corte,)).rowcount
+            conexion.commit()
+            if eliminados and self._bloom is not None:
+                self._reconstruir_bloom()
+        return eliminados
+
+    def obtener_estadisticas(self):
+        with self._lock:
+            conexion = self._conectar()
+            filas = conexion.execute(
+                "SELECT resultado, COUNT(*) FROM procesados GROUP BY resultado"
+            ).fetchall()
+        return {
+            'total': sum(cantidad for _, cantidad in filas),
+            'por_resultado': dict(filas),
+            'bloom_bits': self._bloom.bits if self._bloom else None
+        }
+
+    def cerrar(self):
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+                self._bloom = None
+
+
+# Instancia global para uso en todo el proyecto
+mensajes_procesados = RegistroMensajesProcesados()
+
+
+# Funciones de conveniencia para importación directa
+def mensaje_ya_procesado(clave):
+    """True si el correo ya fue manejado (wrapper)"""
+    return mensajes_procesados.contiene(clave)
+
+
+def registrar_mensaje_procesado(clave, resultado, prefactura=None):
+    """Marca un correo como manejado (wrapper)"""
+    mensajes_procesados.registrar(clave, resultado, prefactura)
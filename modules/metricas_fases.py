@@ -0,0 +1,292 @@
+"""
+Métricas de Fases - Histogramas de duración por fase de viaje
+
+Funcionalidades:
+- Registra cada transición de fase del viaje actual con timestamp
+- Acumula el tiempo de cada fase (si una fase se repite en el mismo viaje se suma)
+- Guarda las duraciones en histogramas compactos de buckets fijos
+- Buckets rodantes por día: solo se conservan los últimos N días
+- Persiste en metricas_fases.json al terminar cada viaje
+- Resumen por fase (conteo, promedio, percentiles aproximados) para el API
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_METRICAS = "metricas_fases.json"
+
+# Límites superiores (segundos) de cada bucket; el último bucket es "más de 600s"
+LIMITES_BUCKETS = [2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600]
+
+DIAS_RETENCION = 14
+
+
+class MetricasFases:
+    """Acumula la duración de cada fase de los viajes en histogramas diarios"""
+
+    def __init__(self, archivo=ARCHIVO_METRICAS, dias_retencion=DIAS_RETENCION):
+        """
+        Inicializa el acumulador de métricas
+
+        Args:
+            archivo: Archivo JSON donde se persisten los histogramas
+            dias_retencion: Días de histogramas que se conservan (default: 14)
+        """
+        self.archivo = os.path.abspath(archivo)
+        self.dias_retencion = dias_retencion
+        self._lock = threading.Lock()
+        self._dias = self._cargar()
+
+        # Viaje en curso
+        self._prefactura = None
+        self._fase_actual = None
+        self._inicio_fase = None
+        self._inicio_viaje = None
+        self._acumulado = {}
+        self._transiciones = []
+
+    def _cargar(self):
+        """Carga los histogramas persistidos (descarta el archivo si tiene otros buckets)"""
+        try:
+            if not os.path.exists(self.archivo):
+                return {}
+            with open(self.archivo, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            if datos.get('limites_segundos') != LIMITES_BUCKETS:
+                logger.warning("Buckets de métricas cambiaron - reiniciando histogramas")
+                return {}
+            return datos.get('dias', {})
+        except Exception as e:
+            logger.warning(f"Error cargando métricas de fases: {e}")
+            return {}
+
+    def _guardar(self):
+        """Escribe los histogramas de forma atómica (archivo temporal + replace)"""
+        try:
+            datos = {
+                'limites_segundos': LIMITES_BUCKETS,
+                'dias': self._dias,
+                'ultima_actualizacion': datetime.now().isoformat()
+            }
+            temporal = f"{self.archivo}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(datos, f, ensure_ascii=False)
+            os.replace(temporal, self.archivo)
+        except Exception as e:
+            logger.warning(f"Error guardando métricas de fases: {e}")
+
+    def _podar_dias(self):
+        """Elimina los días fuera de la ventana de retención"""
+        corte = (datetime.now() - timedelta(days=self.dias_retencion)).strftime('%Y-%m-%d')
+        for dia in [d for d in self._dias if d < corte]:
+            del self._dias[dia]
+
+    def _indice_bucket(self, segundos):
+        for i, limite in enumerate(LIMITES_BUCKETS):
+            if segundos <= limite:
+                return i
+        return len(LIMITES_BUCKETS)
+
+    def _agregar_muestra(self, dia, fase, segundos):
+        fases_dia = self._dias.setdefault(dia, {})
+        hist = fases_dia.get(fase)
+        if hist is None:
+            hist = {
+                'conteo': 0,
+                'suma': 0.0,
+                'min': None,
+                'max': None,
+                'buckets': [0] * (len(LIMITES_BUCKETS) + 1)
+            }
+            fases_dia[fase] = hist
+
+        hist['conteo'] += 1
+        hist['suma'] = round(hist['suma'] + segundos, 3)
+        hist['min'] = segundos if hist['min'] is None else min(hist['min'], segundos)
+        hist['max'] = segundos if hist['max'] is None else max(hist['max'], segundos)
+        hist['buckets'][self._indice_bucket(segundos)] += 1
+
+    def _cerrar_fase_actual(self, ahora):
+        if self._fase_actual is None or self._inicio_fase is None:
+            return
+        duracion = max(0.0, ahora - self._inicio_fase)
+        self._acumulado[self._fase_actual] = self._acumulado.get(self._fase_actual, 0.0) + duracion
+
+    def iniciar_viaje(self, prefactura, fase_inicial="Inicializando"):
+        """
+        Inicia la medición de un viaje nuevo
+
+        Args:
+            prefactura: Número de prefactura
+            fase_inicial: Nombre de la primera fase
+        """
+        with self._lock:
+            if self._prefactura is not None:
+                # Viaje anterior no finalizado (ej: robot reiniciado a mitad de viaje)
+                self._finalizar(resultado="abandonado")
+
+            ahora = time.monotonic()
+            self._prefactura = prefactura
+            self._fase_actual = fase_inicial
+            self._inicio_fase = ahora
+            self._inicio_viaje = ahora
+            self._acumulado = {}
+            self._transiciones = [(fase_inicial, datetime.now().isoformat())]
+
+    def registrar_fase(self, nueva_fase):
+        """
+        Registra una transición de fase en el viaje actual
+
+        Args:
+            nueva_fase: Nombre de la fase que inicia
+        """
+        with self._lock:
+            if self._prefactura is None or nueva_fase == self._fase_actual:
+                return
+            ahora = time.monotonic()
+            self._cerrar_fase_actual(ahora)
+            self._fase_actual = nueva_fase
+            self._inicio_fase = ahora
+            self._transiciones.append((nueva_fase, datetime.now().isoformat()))
+
+    def finalizar_viaje(self, resultado=""):
+        """
+        Cierra la fase actual y acumula las duraciones del viaje en los histogramas
+
+        Args:
+            resultado: 'exitoso', 'fallido' o vacío (solo para logging)
+        """
+        with self._lock:
+            self._finalizar(resultado)
+
+    def _finalizar(self, resultado):
+        if self._prefactura is None:
+            return
+
+        ahora = time.monotonic()
+        self._cerrar_fase_actual(ahora)
+        total = max(0.0, ahora - self._inicio_viaje)
+        dia = datetime.now().strftime('%Y-%m-%d')
+
+        for fase, segundos in self._acumulado.items():
+            self._agregar_muestra(dia, fase, round(segundos, 3))
+        self._agregar_muestra(dia, "Total viaje", round(total, 3))
+
+        resumen = ", ".join(f"{fase}={segundos:.0f}s" for fase, segundos in self._acumulado.items())
+        logger.info(f"Tiempos viaje {self._prefactura} ({resultado or 'terminado'}, {total:.0f}s): {resumen}")
+
+        self._prefactura = None
+        self._fase_actual = None
+        self._inicio_fase = None
+        self._inicio_viaje = None
+        self._acumulado = {}
+        self._transiciones = []
+
+        self._podar_dias()
+        self._guardar()
+
+    def _percentil(self, buckets, conteo, p):
+        """Percentil aproximado: límite superior del bucket que contiene la posición p"""
+        if conteo == 0:
+            return None
+        objetivo = conteo * p
+        acumulado = 0
+        for i, cantidad in enumerate(buckets):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return LIMITES_BUCKETS[i] if i < len(LIMITES_BUCKETS) else None
+        return None
+
+    def obtener_resumen(self, dias=7):
+        """
+        Combina los histogramas de los últimos N días por fase
+
+        Args:
+            dias: Ventana de días a combinar (default: 7)
+
+        Returns:
+            dict: Resumen con histograma, promedio y percentiles por fase
+        """
+        with self._lock:
+            corte = (datetime.now() - timedelta(days=max(dias, 1) - 1)).strftime('%Y-%m-%d')
+            combinado = {}
+            for dia, fases_dia in self._dias.items():
+                if dia < corte:
+                    continue
+                for fase, hist in fases_dia.items():
+                    destino = combinado.setdefault(fase, {
+                        'conteo': 0,
+                        'suma': 0.0,
+                        'min': None,
+                        'max': None,
+                        'buckets': [0] * (len(LIMITES_BUCKETS) + 1)
+                    })
+                    destino['conteo'] += hist['conteo']
+                    destino['suma'] += hist['suma']
+                    if hist['min'] is not None:
+                        destino['min'] = hist['min'] if destino['min'] is None else min(destino['min'], hist['min'])
+                    if hist['max'] is not None:
+                        destino['max'] = hist['max'] if destino['max'] is None else max(destino['max'], hist['max'])
+                    destino['buckets'] = [a + b for a, b in zip(destino['buckets'], hist['buckets'])]
+
+            viaje_actual = None
+            if self._prefactura is not None:
+                viaje_actual = {
+                    'prefactura': self._prefactura,
+                    'fase': self._fase_actual,
+                    'segundos_en_fase': round(time.monotonic() - self._inicio_fase, 1),
+                    'transiciones': list(self._transiciones)
+                }
+
+        tiempo_fases = sum(h['suma'] for fase, h in combinado.items() if fase != "Total viaje")
+        fases = {}
+        for fase, hist in combinado.items():
+            conteo = hist['conteo']
+            fases[fase] = {
+                'conteo': conteo,
+                'promedio_segundos': round(hist['suma'] / conteo, 1) if conteo else None,
+                'min_segundos': hist['min'],
+                'max_segundos': hist['max'],
+                'p50_segundos': self._percentil(hist['buckets'], conteo, 0.5),
+                'p90_segundos': self._percentil(hist['buckets'], conteo, 0.9),
+                'porcentaje_tiempo': round(100 * hist['suma'] / tiempo_fases, 1) if tiempo_fases and fase != "Total viaje" else None,
+                'buckets': hist['buckets']
+            }
+
+        return {
+            'dias': dias,
+            'limites_segundos': LIMITES_BUCKETS,
+            'fases': fases,
+            'viaje_actual': viaje_actual
+        }
+
+
+# Instancia global para uso en todo el proyecto
+metricas_fases = MetricasFases()
+
+
+# Funciones de conveniencia para importación directa
+def iniciar_viaje(prefactura, fase_inicial="Inicializando"):
+    """Inicia medición de un viaje (wrapper)"""
+    metricas_fases.iniciar_viaje(prefactura, fase_inicial)
+
+
+def registrar_fase(nueva_fase):
+    """Registra transición de fase (wrapper)"""
+    metricas_fases.registrar_fase(nueva_fase)
+
+
+def finalizar_viaje(resultado=""):
+    """Finaliza medición del viaje actual (wrapper)"""
+    metricas_fases.finalizar_viaje(resultado)
+
+
+def obtener_resumen_fases(dias=7):
+    """Resumen de histogramas por fase (wrapper)"""
+    return metricas_fases.obtener_resumen(dias)
@@ -0,0 +1,302 @@
+"""
+Outbox MySQL - Bandeja local (SQLite) de registros pendientes de subir a prefacturarobot
+
+Funcionalidades:
+- Cada escritura de viajes_log inserta su fila en el outbox dentro de una transacción
+  que solo se confirma si la escritura al CSV tuvo éxito
+- Clave de idempotencia determinista (hash del contenido del registro): reinsertar
+  el mismo registro (ej: al recuperar filas del CSV tras un crash) no lo duplica
+- El shipper toma lotes no entregados y los marca como entregados al confirmarse en MySQL
+- Entrega en orden de inserción: un registro que falla detiene solo a los posteriores
+  de su misma prefactura (un FALLIDO viejo nunca llega después de su EXITOSO)
+- Tras MAX_INTENTOS_OUTBOX rechazos el registro pasa a "rechazado" (no se reintenta
+  y se reporta en el dashboard)
+- reencolar() vuelve a dejar pendiente un registro ya entregado (reconciliación)
+- Purga de registros entregados antiguos
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_OUTBOX = "mysql_outbox.db"
+
+# Campos que identifican un registro del log (el timestamp distingue reintentos)
+CAMPOS_CLAVE = ['timestamp', 'prefactura', 'estatus', 'motivo_fallo', 'uuid', 'viajegm', 'numero_factura']
+
+DIAS_RETENCION_ENTREGADOS = 30
+MAX_INTENTOS_OUTBOX = 5         # Rechazos de MySQL antes de pasar el registro a "rechazado"
+
+
+def clave_idempotencia(registro):
+    """
+    Clave determinista de un registro del log
+
+    Args:
+        registro: Dict con los campos del CSV
+
+    Returns:
+        str: sha256 hex de los campos clave
+    """
+    contenido = "\x1f".join(str(registro.get(campo) or '') for campo in CAMPOS_CLAVE)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+class OutboxMySQL:
+    """Bandeja de salida local con entrega exactamente-una-vez a MySQL"""
+
+    def __init__(self, archivo=ARCHIVO_OUTBOX):
+        """
+        Inicializa el outbox (crea la tabla si no existe)
+
+        Args:
+            archivo: Archivo SQLite del outbox
+        """
+        self.archivo = os.path.abspath(archivo)
+        self._inicializado = False
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.archivo, timeout=10, isolation_level=None)
+        if not self._inicializado:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clave TEXT NOT NULL UNIQUE,
+                    prefactura TEXT,
+                    estatus TEXT,
+                    datos TEXT NOT NULL,
+                    creado TEXT NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    ultimo_error TEXT,
+                    entregado TEXT,
+                    rechazado TEXT
+                )
+            """)
+            columnas = {fila[1] for fila in conexion.execute("PRAGMA table_info(outbox)")}
+            if 'rechazado' not in columnas:
+                # Outbox creado antes del estado "rechazado"
+                conexion.execute("ALTER TABLE outbox ADD COLUMN rechazado TEXT")
+            conexion.execute("DROP INDEX IF EXISTS idx_outbox_pendientes")
+            conexion.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_por_entregar ON outbox (id) "
+                "WHERE entregado IS NULL AND rechazado IS NULL"
+            )
+            self._inicializado = True
+        return conexion
+
+    def _insertar(self, conexion, registro):
+        cursor = conexion.execute(
+            "INSERT OR IGNORE INTO outbox (clave, prefactura, estatus, datos, creado) VALUES (?, ?, ?, ?, ?)",
+            (
+                clave_idempotencia(registro),
+                registro.get('prefactura'),
+                registro.get('estatus'),
+                json.dumps(registro, ensure_ascii=False),
+                datetime.now().isoformat()
+            )
+        )
+        return cursor.rowcount
+
+    @contextmanager
+    def registrar(self, registro):
+        """
+        Inserta el registro en el outbox y confirma solo si el bloque termina sin error
+
+        Uso:
+            with outbox.registrar(registro):
+                escribir_al_csv(registro)
+
+        Si el outbox no está disponible, el bloque se ejecuta igual: el registro se
+        recupera después desde el CSV con la misma clave de idempotencia.
+        """
+        conexion = None
+        try:
+            conexion = self._conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            self._insertar(conexion, registro)
+        except sqlite3.Error as e:
+            logger.warning(f"Outbox no disponible ({e}) - el registro se recuperará del CSV")
+            if conexion:
+                conexion.close()
+            conexion = None
+
+        try:
+            yield
+        except Exception:
+            if conexion:
+                conexion.rollback()
+            raise
+        else:
+            if conexion:
+                try:
+                    conexion.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error confirmando registro en outbox: {e}")
+        finally:
+            if conexion:
+                conexion.close()
+
+    def agregar_lote(self, registros):
+        """
+        Inserta registros ignorando los que ya existen (misma clave de idempotencia)
+
+        Returns:
+            int: Registros realmente nuevos
+        """
+        if not registros:
+            return 0
+        conexion = self._conectar()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            nuevos = sum(self._insertar(conexion, registro) for registro in registros)
+            conexion.commit()
+            return nuevos
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            conexion.close()
+
+    def reencolar(self, registros):
+        """
+        Inserta registros o vuelve a dejar pendientes los que ya se habían entregado,
+        para reenviar un estado que MySQL perdió (los rechazados siguen rechazados)
+
+        Returns:
+            int: Registros insertados o reencolados
+        """
+        if not registros:
+            return 0
+        conexion = self._conectar()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            total = 0
+            for registro in registros:
+                if self._insertar(conexion, registro):
+                    total += 1
+                    continue
+                cursor = conexion.execute(
+                    "UPDATE outbox SET entregado = NULL, intentos = 0, ultimo_error = NULL "
+                    "WHERE clave = ? AND rechazado IS NULL",
+                    (clave_idempotencia(registro),)
+                )
+                total += cursor.rowcount
+            conexion.commit()
+            return total
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            conexion.close()
+
+    def obtener_pendientes(self, limite, despues_de=0):
+        """
+        Lote de registros por entregar en orden de inserción
+
+        Args:
+            limite: Máximo de registros
+            despues_de: Solo ids mayores (para recorrer la bandeja en un mismo sync)
+
+        Returns:
+            list: Tuplas (id, registro)
+        """
+        conexion = self._conectar()
+        try:
+            filas = conexion.execute(
+                "SELECT id, datos FROM outbox WHERE entregado IS NULL AND rechazado IS NULL AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (despues_de, limite)
+            ).fetchall()
+        finally:
+            conexion.close()
+        return [(id_fila, json.loads(datos)) for id_fila, datos in filas]
+
+    def marcar_entregados(self, ids):
+        if not ids:
+            return
+        conexion = self._conectar()
+        try:
+            # Una sola transacción para todo el lote
+            conexion.execute("BEGIN IMMEDIATE")
+            conexion.executemany(
+                "UPDATE outbox SET entregado = ? WHERE id = ?",
+                [(datetime.now().isoformat(), id_fila) for id_fila in ids]
+            )
+            conexion.commit()
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            conexion.close()
+
+    def marcar_fallidos(self, ids, error, max_intentos=MAX_INTENTOS_OUTBOX):
+        """
+        Suma un intento; al llegar a max_intentos el registro queda rechazado
+
+        Returns:
+            int: Registros que pasaron a rechazado
+        """
+        if not ids:
+            return 0
+        conexion = self._conectar()
+        try:
+            # Una sola transacción para todo el lote
+            conexion.execute("BEGIN IMMEDIATE")
+            conexion.executemany(
+                "UPDATE outbox SET intentos = intentos + 1, ultimo_error = ?, "
+                "rechazado = CASE WHEN intentos + 1 >= ? THEN ? ELSE NULL END WHERE id = ?",
+                [(error, max_intentos, datetime.now().isoformat(), id_fila) for id_fila in ids]
+            )
+            marcadores = ", ".join("?" * len(ids))
+            rechazados = conexion.execute(
+                f"SELECT prefactura FROM outbox WHERE rechazado IS NOT NULL AND id IN ({marcadores})", list(ids)
+            ).fetchall()
+            conexion.commit()
+            for (prefactura,) in rechazados:
+                logger.error(f"Outbox: registro de {prefactura} rechazado tras {max_intentos} intentos - "
+                             f"no se reintentará ({error})")
+            return len(rechazados)
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            conexion.close()
+
+    def contar_pendientes(self):
+        conexion = self._conectar()
+        try:
+            return conexion.execute(
+                "SELECT COUNT(*) FROM outbox WHERE entregado IS NULL AND rechazado IS NULL"
+            ).fetchone()[0]
+        finally:
+            conexion.close()
+
+    def contar_rechazados(self):
+        conexion = self._conectar()
+        try:
+            return conexion.execute("SELECT COUNT(*) FROM outbox WHERE rechazado IS NOT NULL").fetchone()[0]
+        finally:
+            conexion.close()
+
+    def purgar_entregados(self, dias=DIAS_RETENCION_ENTREGADOS):
+        """Elimina registros entregados hace más de N días"""
+        corte = (datetime.now() - timedelta(days=dias)).isoformat()
+        conexion = self._conectar()
+        try:
+            cursor = conexion.execute(
+                "DELETE FROM outbox WHERE entregado IS NOT NULL AND entregado < ?", (corte,)
+            )
+            return cursor.rowcount
+        finally:
+            conexion.close()
+
+
+# Instancia global para uso en todo el proyecto
+outbox = OutboxMySQL()
@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 """
 Handler MySQL para sincronización desde viajes_log.csv
-Flujo: CSV → MySQL con INSERT directo a tabla prefacturarobot
+Flujo: CSV → outbox local (SQLite) → MySQL con upserts a tabla prefacturarobot
 """
 
-import mysql.connector
-from mysql.connector import Error
 import logging
 import csv
+import hashlib
+import json
 import os
+import sqlite3
+import threading
+import time
 from datetime import datetime
-from viajes_log import viajes_log
+from modules.mysql_outbox import outbox as outbox_global
+
+try:
+    import mysql.connector
+    from mysql.connector import Error, pooling
+except ImportError:
+    # Sin el conector solo está disponible DestinoSQLite (pruebas y benchmarks)
+    mysql = None
+    pooling = None
+
+    class Error(Exception):
+        pass
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -26,136 +40,536 @@ MYSQL_CONFIG = {
     'collation': 'utf8mb4_unicode_ci'
 }
 
+# Pool compartido por todas las instancias: las conexiones quedan abiertas entre syncs
+MYSQL_POOL_CONFIG = {
+    'pool_name': 'alsua_sync',
+    'pool_size': 2,
+    'connection_timeout': 10,
+    'intentos_reconexion': 2,
+    'espera_reconexion': 1
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_metricas_pool = {
+    'conexiones_creadas': 0,
+    'conexiones_obtenidas': 0,
+    'reconexiones': 0,
+    'errores': 0,
+    'ms_obtener_total': 0.0,
+    'ultimo_error': None
+}
+
+
+def obtener_pool():
+    """Crea el pool la primera vez que se necesita y lo reutiliza después"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            logger.info(f"Creando pool MySQL ({MYSQL_POOL_CONFIG['pool_size']} conexiones)...")
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=MYSQL_POOL_CONFIG['pool_name'],
+                pool_size=MYSQL_POOL_CONFIG['pool_size'],
+                pool_reset_session=True,
+                connection_timeout=MYSQL_POOL_CONFIG['connection_timeout'],
+                **MYSQL_CONFIG
+            )
+            _metricas_pool['conexiones_creadas'] += MYSQL_POOL_CONFIG['pool_size']
+        return _pool
+
+
+def obtener_metricas_pool():
+    """Métricas del pool de conexiones para el dashboard/estadísticas"""
+    with _pool_lock:
+        metricas = dict(_metricas_pool)
+        metricas['pool_creado'] = _pool is not None
+    obtenidas = metricas.pop('ms_obtener_total')
+    metricas['ms_obtener_promedio'] = round(obtenidas / metricas['conexiones_obtenidas'], 1) if metricas['conexiones_obtenidas'] else None
+    metricas['pool_size'] = MYSQL_POOL_CONFIG['pool_size']
+    return metricas
+
+
+def _registrar_metrica_pool(clave, valor=1):
+    with _pool_lock:
+        _metricas_pool[clave] += valor
+
+
+# Callbacks que reciben [(prefactura, estatusr), ...] de cada lote confirmado en el destino
+_observadores_confirmados = []
+
+
+def agregar_observador_confirmados(callback):
+    """Registra un callback para los registros confirmados (ej: cache de dedup remoto)"""
+    if callback not in _observadores_confirmados:
+        _observadores_confirmados.append(callback)
+
+
+# Registros por lote en la sincronización (un executemany + un commit por lote)
+TAMANO_LOTE_SYNC = 200
+
+COLUMNAS_PREFACTURAROBOT = "(NOPREFACTURA, VIAJEGM, FACTURAGM, UUID, USUARIO, erroresrobot, estatusr)"
+
+
+class DestinoMySQL:
+    """Destino del sync: tabla prefacturarobot en el servidor MySQL (pool compartido)"""
+
+    nombre = "mysql"
+    marcador = "%s"
+    numero_prefactura = "CAST(NOPREFACTURA AS UNSIGNED)"
+    errores = (Error,)
+
+    # INSERT o UPDATE si ya existe (para viajes reprocesados)
+    upsert_exitoso = f"""
+        INSERT INTO prefacturarobot
+        {COLUMNAS_PREFACTURAROBOT}
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            VIAJEGM = VALUES(VIAJEGM),
+            FACTURAGM = VALUES(FACTURAGM),
+            UUID = VALUES(UUID),
+            erroresrobot = '',
+            estatusr = VALUES(estatusr)
+    """
+
+    # Un fallo reintentado actualiza el motivo, pero nunca toca un viaje ya facturado
+    upsert_fallido = f"""
+        INSERT INTO prefacturarobot
+        {COLUMNAS_PREFACTURAROBOT}
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            erroresrobot = IF(estatusr = 'facturado', erroresrobot, VALUES(erroresrobot))
+    """
+
+    def verificar(self, conexion):
+        """Health check: ping y reconexión si el servidor cerró la conexión"""
+        if conexion.is_connected():
+            return True
+        logger.info("Conexión MySQL inactiva - reconectando...")
+        _registrar_metrica_pool('reconexiones')
+        conexion.reconnect(
+            attempts=MYSQL_POOL_CONFIG['intentos_reconexion'],
+            delay=MYSQL_POOL_CONFIG['espera_reconexion']
+        )
+        return conexion.is_connected()
+
+    def conectar(self):
+        """Toma una conexión del pool y la verifica; None si no hay conexión"""
+        if pooling is None:
+            raise Error("mysql-connector-python no está instalado")
+        inicio = time.perf_counter()
+        conexion = obtener_pool().get_connection()
+        _registrar_metrica_pool('conexiones_obtenidas')
+        _registrar_metrica_pool('ms_obtener_total', (time.perf_counter() - inicio) * 1000)
+
+        if not self.verificar(conexion):
+            conexion.close()
+            return None
+        return conexion
+
+    def liberar(self, conexion):
+        """Devuelve la conexión al pool (queda abierta para el siguiente sync)"""
+        conexion.close()
+
+    def registrar_error(self, error):
+        _registrar_metrica_pool('errores')
+        with _pool_lock:
+            _metricas_pool['ultimo_error'] = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {error}"
+
+    def metricas(self):
+        return obtener_metricas_pool()
+
+
+class DestinoSQLite:
+    """
+    Destino local equivalente a prefacturarobot (mismo esquema y semántica de upsert)
+    para probar y medir el sync sin acceso al servidor
+    """
+
+    nombre = "sqlite"
+    marcador = "?"
+    numero_prefactura = "CAST(NOPREFACTURA AS INTEGER)"
+    errores = (sqlite3.Error,)
+
+    upsert_exitoso = f"""
+        INSERT INTO prefacturarobot
+        {COLUMNAS_PREFACTURAROBOT}
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(NOPREFACTURA) DO UPDATE SET
+            VIAJEGM = excluded.VIAJEGM,
+            FACTURAGM = excluded.FACTURAGM,
+            UUID = excluded.UUID,
+            erroresrobot = '',
+            estatusr = excluded.estatusr
+    """
+
+    upsert_fallido = f"""
+        INSERT INTO prefacturarobot
+        {COLUMNAS_PREFACTURAROBOT}
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(NOPREFACTURA) DO UPDATE SET
+            erroresrobot = CASE WHEN prefacturarobot.estatusr = 'facturado'
+                                THEN prefacturarobot.erroresrobot
+                                ELSE excluded.erroresrobot END
+    """
+
+    def __init__(self, archivo=":memory:"):
+        """
+        Args:
+            archivo: Archivo SQLite destino (default: en memoria)
+        """
+        self.archivo = archivo
+        self._conexion = None
+
+    def conectar(self):
+        # Una sola conexión persistente (una base en memoria se pierde al cerrarla)
+        if self._conexion is None:
+            self._conexion = sqlite3.connect(self.archivo, check_same_thread=False)
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS prefacturarobot (
+                    NOPREFACTURA TEXT PRIMARY KEY,
+                    VIAJEGM TEXT,
+                    FACTURAGM TEXT,
+                    UUID TEXT,
+                    USUARIO TEXT,
+                    erroresrobot TEXT,
+                    estatusr TEXT
+                )
+            """)
+            self._conexion.commit()
+        return self._conexion
+
+    def verificar(self, conexion):
+        return True
+
+    def liberar(self, conexion):
+        pass
+
+    def registrar_error(self, error):
+        pass
+
+    def metricas(self):
+        return {'destino': self.nombre, 'archivo': self.archivo}
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+
 class MySQLSimple:
-    def __init__(self, archivo_csv="viajes_log.csv"):
+    def __init__(self, archivo_csv="viajes_log.csv", outbox=None, destino=None):
         self.connection = None
+        self.destino = destino or DestinoMySQL()
+        self.outbox = outbox or outbox_global
         self.archivo_csv = os.path.abspath(archivo_csv)
+        self.archivo_watermark = "mysql_sync_watermark.json"
+        # Archivo de IDs anterior al watermark; se migra y elimina en el primer sync
         self.archivo_procesados = "mysql_sync_procesados.txt"
+        # Durante un sync: True si se perdió la conexión (distinto de una fila rechazada)
+        self._conexion_perdida = False
         
     def conectar(self):
         try:
-            if self.connection and self.connection.is_connected():
-                return True
-                
-            logger.info("Conectando a MySQL...")
-                
-            self.connection = mysql.connector.connect(**MYSQL_CONFIG)
-            
-            if self.connection.is_connected():
-                db_info = self.connection.get_server_info()
-                logger.info("Conexión MySQL establecida")
-                return True
-            else:
+            if self.connection is not None:
+                if self.destino.verificar(self.connection):
+                    return True
+                self.desconectar()
+
+            conexion = self.destino.conectar()
+            if conexion is None:
                 logger.error("No se pudo conectar a MySQL")
+                self.destino.registrar_error("Conexión no disponible")
                 return False
-                
-        except Error as e:
+
+            self.connection = conexion
+            return True
+
+        except self.destino.errores as e:
             logger.error(f"Error conectando a MySQL: {e}")
+            self.destino.registrar_error(e)
             self.connection = None
             return False
         except Exception as e:
             logger.error(f"Error general conectando a MySQL: {e}")
+            self.destino.registrar_error(e)
             self.connection = None
             return False
-    
+
     def desconectar(self):
+        """Libera la conexión (en MySQL vuelve al pool y queda abierta para el siguiente sync)"""
         try:
-            if self.connection and self.connection.is_connected():
-                self.connection.close()
-                logger.info("Conexión MySQL cerrada")
+            if self.connection is not None:
+                self.destino.liberar(self.connection)
         except Exception as e:
-            logger.warning(f"Error cerrando conexión MySQL: {e}")
+            logger.warning(f"Error devolviendo conexión MySQL al pool: {e}")
+        finally:
+            self.connection = None
     
-    def cargar_registros_procesados(self):
+    def _cargar_watermark(self):
         try:
-            if os.path.exists(self.archivo_procesados):
-                with open(self.archivo_procesados, 'r', encoding='utf-8') as f:
-                    procesados = set(line.strip() for line in f.readlines())
-                logger.info(f"Cargados {len(procesados)} registros procesados")
-                return procesados
-            else:
-                logger.info("No hay archivo de procesados - primer sync")
-                return set()
+            if not os.path.exists(self.archivo_watermark):
+                return None
+            with open(self.archivo_watermark, 'r', encoding='utf-8') as f:
+                return json.load(f)
         except Exception as e:
-            logger.warning(f"Error cargando procesados: {e}")
-            return set()
-    
-    def marcar_como_procesado(self, registro_id):
+            logger.warning(f"Error cargando watermark de sync: {e}")
+            return None
+
+    def _guardar_watermark(self, offset, fila_bytes):
+        """Guarda offset + hash de la última fila sincronizada (escritura atómica)"""
         try:
-            with open(self.archivo_procesados, 'a', encoding='utf-8') as f:
-                f.write(f"{registro_id}\n")
+            datos = {
+                'offset': offset,
+                'longitud_ultima_fila': len(fila_bytes),
+                'hash_ultima_fila': hashlib.sha256(fila_bytes).hexdigest(),
+                'actualizado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            temporal = f"{self.archivo_watermark}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(datos, f)
+            os.replace(temporal, self.archivo_watermark)
         except Exception as e:
-            logger.warning(f"Error marcando como procesado: {e}")
-    
+            logger.warning(f"Error guardando watermark de sync: {e}")
+
+    def _csv_fue_reescrito(self, watermark):
+        """
+        Detecta si el CSV se reescribió desde el último sync (limpieza, edición manual,
+        headers recreados): el archivo es más chico que el offset o la última fila
+        sincronizada ya no está en la misma posición
+        """
+        offset = watermark.get('offset', 0)
+        longitud = watermark.get('longitud_ultima_fila', 0)
+        if offset == 0:
+            return False
+        if os.path.getsize(self.archivo_csv) < offset:
+            return True
+        with open(self.archivo_csv, 'rb') as f:
+            f.seek(offset - longitud)
+            datos = f.read(longitud)
+        return hashlib.sha256(datos).hexdigest() != watermark.get('hash_ultima_fila')
+
+    def _leer_filas_desde(self, offset):
+        """
+        Lee las filas completas del CSV a partir de un offset en bytes
+
+        Una fila a medio escribir al final del archivo se deja para el siguiente sync.
+
+        Returns:
+            list: Tuplas (registro, offset_fin, bytes_fila); registro es None en filas vacías
+        """
+        filas = []
+        with open(self.archivo_csv, 'rb') as f:
+            encabezados = next(csv.reader([f.readline().decode('utf-8')]), [])
+            posicion = max(offset, f.tell())
+            f.seek(posicion)
+
+            consumido = [posicion]
+            pendientes = []
+
+            def lineas():
+                for linea in f:
+                    if not linea.endswith(b"\n"):
+                        return
+                    consumido[0] += len(linea)
+                    pendientes.append(linea)
+                    yield linea.decode('utf-8')
+
+            for valores in csv.reader(lineas()):
+                fila_bytes = b"".join(pendientes)
+                pendientes.clear()
+                registro = dict(zip(encabezados, valores)) if valores else None
+                filas.append((registro, consumido[0], fila_bytes))
+        return filas
+
+    def _cargar_ids_legacy(self):
+        """IDs del archivo de procesados anterior al watermark (solo para migrar)"""
+        try:
+            with open(self.archivo_procesados, 'r', encoding='utf-8') as f:
+                procesados = set(line.strip() for line in f)
+            logger.info(f"Migrando {len(procesados)} registros procesados al watermark")
+            return procesados
+        except Exception as e:
+            logger.warning(f"Error cargando procesados legacy: {e}")
+            return set()
+
     def generar_id_registro(self, row):
         prefactura = row.get('prefactura', '')
         timestamp = row.get('timestamp', '')
         estatus = row.get('estatus', '')
         return f"{prefactura}_{timestamp}_{estatus}".replace(' ', '_').replace(':', '-')
-    
-    def leer_registros_nuevos_del_csv(self):
+
+    def _es_sincronizable(self, registro, estadisticas):
+        """Filtra filas vacías, sin prefactura o con estatus desconocido (se omiten)"""
+        if registro is None:
+            return False
+        estatus = (registro.get('estatus') or '').upper()
+        prefactura = registro.get('prefactura')
+        if not prefactura:
+            logger.warning("Registro sin prefactura en CSV, omitiendo")
+            estadisticas['omitidos'] += 1
+            return False
+        if estatus not in ('EXITOSO', 'FALLIDO'):
+            logger.warning(f"Estatus desconocido '{estatus}' para prefactura {prefactura}, omitiendo")
+            estadisticas['omitidos'] += 1
+            return False
+        return True
+
+    def _notificar_confirmados(self, confirmados):
+        if not confirmados or not _observadores_confirmados:
+            return
+        estados = []
+        for registro in confirmados:
+            if registro.get('estatus', '').upper() == 'EXITOSO':
+                estados.append((str(registro.get('prefactura')), self._valores_exitoso(registro)[6]))
+            else:
+                estados.append((str(registro.get('prefactura')), 'pendiente'))
+        for callback in _observadores_confirmados:
+            try:
+                callback(estados)
+            except Exception as e:
+                logger.warning(f"Error notificando registros confirmados: {e}")
+
+    def _subir_en_lotes(self, registros, estadisticas):
+        """
+        Sube los registros en lotes y acumula estadísticas
+
+        Returns:
+            set: id() de los registros confirmados en MySQL
+        """
+        confirmados_ids = set()
+        for inicio in range(0, len(registros), TAMANO_LOTE_SYNC):
+            lote = registros[inicio:inicio + TAMANO_LOTE_SYNC]
+            confirmados = self.procesar_lote(lote)
+            self._notificar_confirmados(confirmados)
+
+            for registro in confirmados:
+                confirmados_ids.add(id(registro))
+                if registro.get('estatus', '').upper() == 'EXITOSO':
+                    estadisticas['exitosos'] += 1
+                else:
+                    estadisticas['fallidos'] += 1
+            estadisticas['errores'] += len(lote) - len(confirmados)
+            estadisticas['procesados'] += len(confirmados)
+            logger.info(f"Lote sincronizado: {len(confirmados)}/{len(lote)} registros confirmados")
+            if self._conexion_perdida:
+                # Los lotes restantes se intentan en el siguiente sync
+                break
+            estadisticas['rechazados'] += len(lote) - len(confirmados)
+        return confirmados_ids
+
+    def _valores_exitoso(self, registro):
+        uuid = registro.get('uuid')
+        viajegm = registro.get('viajegm')
+        numero_factura = registro.get('numero_factura')
+        # Determinar estatusr basado en datos completos
+        estatusr = "facturado" if (uuid and viajegm and numero_factura) else "pendiente"
+        return (registro.get('prefactura'), viajegm, numero_factura, uuid, 'ROBOT', '', estatusr)
+
+    def _valores_fallido(self, registro):
+        return (registro.get('prefactura'), '0', '0', '0', 'ROBOT', registro.get('motivo_fallo'), 'pendiente')
+
+    def procesar_lote(self, registros):
+        """
+        Sube un lote de registros con executemany: un commit y una verificación por lote
+
+        Args:
+            registros: Registros del CSV (EXITOSO o FALLIDO, con prefactura)
+
+        Returns:
+            list: Registros confirmados en MySQL
+        """
+        exitosos = [r for r in registros if r.get('estatus', '').upper() == 'EXITOSO']
+        fallidos = [r for r in registros if r.get('estatus', '').upper() == 'FALLIDO']
+        cursor = None
         try:
-            if not os.path.exists(self.archivo_csv):
-                logger.warning(f"Archivo CSV no existe: {self.archivo_csv}")
-                return []
-            
-            procesados = self.cargar_registros_procesados()
-            registros_nuevos = []
-            total_registros = 0
-            
-            with open(self.archivo_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                
-                for row in reader:
-                    total_registros += 1
-                    registro_id = self.generar_id_registro(row)
-                    
-                    if registro_id not in procesados:
-                        registros_nuevos.append(row)
-                        logger.info(f"Nuevo registro: {row['prefactura']} - {row['estatus']}")
-            
-            logger.info(f"CSV leído: {total_registros} total, {len(registros_nuevos)} nuevos")
-            return registros_nuevos
-            
+            cursor = self.connection.cursor()
+
+            # Fallidos primero: si una prefactura aparece como fallida y luego exitosa
+            # en el mismo lote, el upsert exitoso queda como estado final
+            if fallidos:
+                cursor.executemany(self.destino.upsert_fallido, [self._valores_fallido(r) for r in fallidos])
+            if exitosos:
+                cursor.executemany(self.destino.upsert_exitoso, [self._valores_exitoso(r) for r in exitosos])
+            self.connection.commit()
+
+            prefacturas = list({r.get('prefactura') for r in registros})
+            marcadores = ", ".join([self.destino.marcador] * len(prefacturas))
+            cursor.execute(
+                f"SELECT NOPREFACTURA FROM prefacturarobot WHERE NOPREFACTURA IN ({marcadores})",
+                prefacturas
+            )
+            existentes = {str(fila[0]) for fila in cursor.fetchall()}
+
+            confirmados = []
+            for registro in registros:
+                if str(registro.get('prefactura')) in existentes:
+                    confirmados.append(registro)
+                else:
+                    logger.error(f"ERROR CRÍTICO: {registro.get('prefactura')} no se insertó en MySQL")
+            return confirmados
+
+        except self.destino.errores as e:
+            logger.error(f"Error MySQL procesando lote de {len(registros)} registros: {e}")
+            return self._procesar_lote_por_registro(registros)
         except Exception as e:
-            logger.error(f"Error leyendo CSV: {e}")
+            logger.error(f"Error general procesando lote: {e}")
+            return self._procesar_lote_por_registro(registros)
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def _procesar_lote_por_registro(self, registros):
+        """Fallback registro por registro para aislar la fila que hizo fallar el lote"""
+        try:
+            self.connection.rollback()
+        except Exception:
+            pass
+        if not self.conectar():
+            self._conexion_perdida = True
             return []
-    
+
+        confirmados = []
+        for registro in registros:
+            if registro.get('estatus', '').upper() == 'EXITOSO':
+                exito = self.procesar_registro_exitoso(registro)
+            else:
+                exito = self.procesar_registro_fallido(registro)
+            if exito:
+                confirmados.append(registro)
+
+        # Una fila rechazada con la conexión viva es un problema de datos, no de MySQL
+        if len(confirmados) < len(registros) and not self._conexion_viva():
+            self._conexion_perdida = True
+        return confirmados
+
+    def _conexion_viva(self):
+        try:
+            return self.connection is not None and self.destino.verificar(self.connection)
+        except Exception:
+            return False
+
     def procesar_registro_exitoso(self, registro):
         try:
             prefactura = registro.get('prefactura')
-            uuid = registro.get('uuid')
-            viajegm = registro.get('viajegm')
-            numero_factura = registro.get('numero_factura')
-            
+
             if not prefactura:
                 logger.error("Registro sin prefactura, saltando")
                 return False
-            
-            # Determinar estatusr basado en datos completos
-            estatusr = "facturado" if (uuid and viajegm and numero_factura) else "pendiente"
-                
-            cursor = self.connection.cursor()
 
-            # INSERT o UPDATE si ya existe (para viajes reprocesados)
-            upsert_query = """
-                INSERT INTO prefacturarobot
-                (NOPREFACTURA, VIAJEGM, FACTURAGM, UUID, USUARIO, erroresrobot, estatusr)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    VIAJEGM = VALUES(VIAJEGM),
-                    FACTURAGM = VALUES(FACTURAGM),
-                    UUID = VALUES(UUID),
-                    erroresrobot = '',
-                    estatusr = VALUES(estatusr)
-            """
+            valores = self._valores_exitoso(registro)
+            _, viajegm, numero_factura, uuid, _, _, estatusr = valores
+
+            cursor = self.connection.cursor()
 
             logger.info(f"Procesando viaje exitoso: {prefactura}")
-            cursor.execute(upsert_query, (prefactura, viajegm, numero_factura, uuid, 'ROBOT', '', estatusr))
+            cursor.execute(self.destino.upsert_exitoso, valores)
             self.connection.commit()
             
             # Verificar que se insertó realmente
-            cursor.execute("SELECT COUNT(*) FROM prefacturarobot WHERE NOPREFACTURA = %s", (prefactura,))
+            cursor.execute(f"SELECT COUNT(*) FROM prefacturarobot WHERE NOPREFACTURA = {self.destino.marcador}", (prefactura,))
             count = cursor.fetchone()[0]
             
             if count == 0:
@@ -169,7 +583,7 @@ class MySQLSimple:
             cursor.close()
             return True
                 
-        except Error as e:
+        except self.destino.errores as e:
             logger.error(f"Error MySQL procesando exitoso: {e}")
             return False
         except Exception as e:
@@ -186,20 +600,13 @@ class MySQLSimple:
                 return False
                 
             cursor = self.connection.cursor()
-            
-            # INSERT directo a tabla prefacturarobot (incluyendo estatusr = "pendiente")
-            insert_query = """
-                INSERT INTO prefacturarobot 
-                (NOPREFACTURA, VIAJEGM, FACTURAGM, UUID, USUARIO, erroresrobot, estatusr) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            
+
             logger.info(f"Procesando viaje fallido: {prefactura}")
-            cursor.execute(insert_query, (prefactura, '0', '0', '0', 'ROBOT', motivo_fallo, 'pendiente'))
+            cursor.execute(self.destino.upsert_fallido, self._valores_fallido(registro))
             self.connection.commit()
             
             # Verificar que se insertó realmente
-            cursor.execute("SELECT COUNT(*) FROM prefacturarobot WHERE NOPREFACTURA = %s", (prefactura,))
+            cursor.execute(f"SELECT COUNT(*) FROM prefacturarobot WHERE NOPREFACTURA = {self.destino.marcador}", (prefactura,))
             count = cursor.fetchone()[0]
             
             if count == 0:
@@ -213,95 +620,195 @@ class MySQLSimple:
             cursor.close()
             return True
                 
-        except Error as e:
+        except self.destino.errores as e:
             logger.error(f"Error MySQL procesando fallido: {e}")
             return False
         except Exception as e:
             logger.error(f"Error general procesando fallido: {e}")
             return False
     
+    def _recuperar_del_csv(self, offset, ids_legacy=None):
+        """
+        Pasa al outbox las filas del CSV agregadas después del watermark
+
+        Normalmente ya están en el outbox (viajes_log las inserta al escribirlas); esto
+        recupera las que faltan tras un crash o si el outbox no estaba disponible. La
+        clave de idempotencia evita duplicados.
+        """
+        estadisticas = {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 0, 'omitidos': 0, 'rechazados': 0, 'conexion_fallida': False}
+        filas = self._leer_filas_desde(offset)
+        if not filas:
+            return estadisticas
+
+        registros = []
+        for registro, _, _ in filas:
+            if not self._es_sincronizable(registro, estadisticas):
+                continue
+            if ids_legacy and self.generar_id_registro(registro) in ids_legacy:
+                continue
+            registros.append(registro)
+
+        nuevos = self.outbox.agregar_lote(registros)
+        if nuevos:
+            logger.info(f"Recuperados {nuevos} registros del CSV al outbox")
+        logger.debug(f"CSV leído desde byte {offset}: {len(filas)} filas, {len(registros)} sincronizables")
+
+        _, offset_fin, fila_bytes = filas[-1]
+        self._guardar_watermark(offset_fin, fila_bytes)
+        return estadisticas
+
+    def _enviar_outbox(self, estadisticas):
+        """
+        Shipper: sube los registros no entregados del outbox en lotes, en orden de inserción
+
+        Si un registro de una prefactura falla, los posteriores de esa prefactura esperan
+        al siguiente sync (un estado viejo nunca se aplica después de uno nuevo).
+        """
+        ultimo_id = 0
+        bloqueadas = set()
+        while True:
+            lote = self.outbox.obtener_pendientes(TAMANO_LOTE_SYNC, despues_de=ultimo_id)
+            if not lote:
+                break
+            ultimo_id = lote[-1][0]
+            pendientes = [(i, r) for i, r in lote if str(r.get('prefactura')) not in bloqueadas]
+            if not pendientes:
+                continue
+
+            confirmados_ids = self._subir_en_lotes([r for _, r in pendientes], estadisticas)
+            # Un registro que falla pero tiene uno posterior confirmado de su misma prefactura
+            # ya fue superado: reenviarlo aplicaría un estado viejo sobre uno nuevo
+            ultimo_confirmado = {str(r.get('prefactura')): i for i, r in pendientes if id(r) in confirmados_ids}
+            entregados = {i for i, r in pendientes
+                          if id(r) in confirmados_ids or i < ultimo_confirmado.get(str(r.get('prefactura')), 0)}
+            fallidos = [i for i, _ in pendientes if i not in entregados]
+            self.outbox.marcar_entregados(entregados)
+            if self._conexion_perdida:
+                # MySQL caído: nada cuenta como intento; todo se reintenta en el siguiente sync
+                break
+            # Filas rechazadas con MySQL disponible: cuentan como intento y el resto sigue
+            self.outbox.marcar_fallidos(fallidos, "Rechazado por MySQL")
+            bloqueadas.update(str(r.get('prefactura')) for i, r in pendientes if i in fallidos)
+        return estadisticas
+
+    def _consultar_estado_remoto(self, prefacturas):
+        """Estado actual en MySQL de cada prefactura: {prefactura: (estatusr, UUID, erroresrobot)}"""
+        estado = {}
+        cursor = self.connection.cursor()
+        try:
+            for inicio in range(0, len(prefacturas), TAMANO_LOTE_SYNC):
+                lote = prefacturas[inicio:inicio + TAMANO_LOTE_SYNC]
+                marcadores = ", ".join([self.destino.marcador] * len(lote))
+                cursor.execute(
+                    f"SELECT NOPREFACTURA, estatusr, UUID, erroresrobot FROM prefacturarobot "
+                    f"WHERE NOPREFACTURA IN ({marcadores})",
+                    lote
+                )
+                for nopref, estatusr, uuid, errores in cursor.fetchall():
+                    estado[str(nopref)] = (estatusr, uuid, errores)
+        finally:
+            cursor.close()
+        return estado
+
+    def _difiere_de_remoto(self, registro, remoto):
+        if remoto is None:
+            return True
+        estatusr, uuid, errores = remoto
+        if registro.get('estatus', '').upper() == 'EXITOSO':
+            valores = self._valores_exitoso(registro)
+            return (estatusr, str(uuid or '')) != (valores[6], str(valores[3] or ''))
+        # El upsert de fallidos no toca viajes facturados
+        return estatusr != 'facturado' and (errores or '') != (registro.get('motivo_fallo') or '')
+
+    def _reconciliar_por_prefactura(self):
+        """
+        Reconciliación tras una reescritura del CSV: toma la última fila de cada
+        prefactura y reencola en el outbox solo las que faltan o difieren en MySQL
+
+        La subida la hace el shipper como cualquier otro registro (mismo orden, reintentos
+        y estado rechazado); una fila ya entregada que MySQL perdió vuelve a pendiente.
+        """
+        estadisticas = {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 0, 'omitidos': 0, 'rechazados': 0, 'conexion_fallida': False}
+        filas = self._leer_filas_desde(0)
+
+        ultimas = {}
+        for registro, _, _ in filas:
+            if self._es_sincronizable(registro, estadisticas):
+                prefactura = str(registro['prefactura'])
+                ultimas.pop(prefactura, None)
+                ultimas[prefactura] = registro
+
+        remoto = self._consultar_estado_remoto(list(ultimas))
+        diferentes = [r for p, r in ultimas.items() if self._difiere_de_remoto(r, remoto.get(p))]
+        logger.info(f"Reconciliación: {len(ultimas)} prefacturas en CSV, {len(diferentes)} difieren de MySQL")
+
+        self.outbox.reencolar(diferentes)
+        # Lo que falta ya está en el outbox: el watermark puede avanzar
+        if filas:
+            _, offset_fin, fila_bytes = filas[-1]
+            self._guardar_watermark(offset_fin, fila_bytes)
+        return estadisticas
+
     def sincronizar_desde_csv(self):
         try:
             logger.info("Iniciando sincronización CSV → MySQL")
+            self._conexion_perdida = False
             
             if not os.path.exists(self.archivo_csv):
                 logger.warning(f"CSV no existe: {self.archivo_csv}")
-                return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 0}
+                return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 0, 'omitidos': 0, 'rechazados': 0, 'conexion_fallida': False}
             
             if not self.conectar():
                 logger.error("No se pudo conectar a MySQL")
-                return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 1}
-            
-            registros_nuevos = self.leer_registros_nuevos_del_csv()
-            
-            if not registros_nuevos:
-                logger.info("No hay registros nuevos para sincronizar")
-                return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 0}
-            
-            estadisticas = {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 0}
-            
-            for registro in registros_nuevos:
-                try:
-                    estatus = registro.get('estatus', '').upper()
-                    prefactura = registro.get('prefactura', 'DESCONOCIDA')
-                    
-                    if estatus == 'EXITOSO':
-                        exito = self.procesar_registro_exitoso(registro)
-                        if exito:
-                            estadisticas['exitosos'] += 1
-                        else:
-                            estadisticas['errores'] += 1
-                            
-                    elif estatus == 'FALLIDO':
-                        exito = self.procesar_registro_fallido(registro)
-                        if exito:
-                            estadisticas['fallidos'] += 1
-                        else:
-                            estadisticas['errores'] += 1
-                    else:
-                        logger.warning(f"Estatus desconocido '{estatus}' para prefactura {prefactura}")
-                        estadisticas['errores'] += 1
-                        continue
-                    
-                    registro_id = self.generar_id_registro(registro)
-                    self.marcar_como_procesado(registro_id)
-                    estadisticas['procesados'] += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error procesando registro {registro.get('prefactura', 'DESCONOCIDA')}: {e}")
-                    estadisticas['errores'] += 1
+                return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 1, 'omitidos': 0, 'rechazados': 0, 'conexion_fallida': True}
+
+            watermark = self._cargar_watermark()
+            if watermark is None and os.path.exists(self.archivo_procesados):
+                # Migración única: el archivo de IDs se reemplaza por el watermark
+                estadisticas = self._recuperar_del_csv(0, self._cargar_ids_legacy())
+                if self._cargar_watermark() is not None:
+                    os.remove(self.archivo_procesados)
+                    logger.info("Archivo de procesados legacy eliminado (migrado a watermark)")
+            elif watermark is not None and self._csv_fue_reescrito(watermark):
+                logger.warning("CSV reescrito desde el último sync - reconciliando por prefactura")
+                estadisticas = self._reconciliar_por_prefactura()
+            else:
+                offset = watermark.get('offset', 0) if watermark else 0
+                estadisticas = self._recuperar_del_csv(offset)
+
+            self._enviar_outbox(estadisticas)
+            self.outbox.purgar_entregados()
+            estadisticas['conexion_fallida'] = self._conexion_perdida
             
             logger.info("Sincronización completada:")
             logger.info(f"  Procesados: {estadisticas['procesados']}")
             logger.info(f"  Exitosos: {estadisticas['exitosos']}")
             logger.info(f"  Fallidos: {estadisticas['fallidos']}")
-            logger.info(f"  Errores: {estadisticas['errores']}")
+            logger.info(f"  Errores: {estadisticas['errores']} (rechazados por MySQL: {estadisticas['rechazados']})")
+            logger.info(f"  Omitidos: {estadisticas['omitidos']}")
             
             return estadisticas
             
         except Exception as e:
             logger.error(f"Error general en sincronización: {e}")
-            return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 1}
+            return {'procesados': 0, 'exitosos': 0, 'fallidos': 0, 'errores': 1, 'omitidos': 0, 'rechazados': 0, 'conexion_fallida': True}
         finally:
             self.desconectar()
     
     def obtener_estadisticas_sync(self):
         try:
+            watermark = self._cargar_watermark() or {}
+            csv_existe = os.path.exists(self.archivo_csv)
+            offset = watermark.get('offset', 0)
             stats = {
-                'registros_procesados': 0,
-                'archivo_csv_existe': os.path.exists(self.archivo_csv),
-                'archivo_procesados_existe': os.path.exists(self.archivo_procesados),
-                'ultimo_sync': 'Nunca'
+                'archivo_csv_existe': csv_existe,
+                'offset_sincronizado': offset,
+                'bytes_pendientes': max(0, os.path.getsize(self.archivo_csv) - offset) if csv_existe else 0,
+                'pendientes_outbox': self.outbox.contar_pendientes(),
+                'rechazados_outbox': self.outbox.contar_rechazados(),
+                'ultimo_sync': watermark.get('actualizado', 'Nunca'),
+                'pool': self.destino.metricas()
             }
-            
-            if stats['archivo_procesados_existe']:
-                with open(self.archivo_procesados, 'r', encoding='utf-8') as f:
-                    stats['registros_procesados'] = len(f.readlines())
-            
-            if stats['archivo_procesados_existe']:
-                timestamp = os.path.getmtime(self.archivo_procesados)
-                stats['ultimo_sync'] = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-            
             return stats
             
         except Exception as e:
@@ -0,0 +1,290 @@
+"""
+MySQL Sync Worker - Sincronización CSV → MySQL en segundo plano
+
+Funcionalidades:
+- Hilo dedicado: los viajes nunca esperan a la red ni a un timeout de MySQL
+- Se alimenta de una cola en memoria con cada registro nuevo de viajes_log
+- Agrupa los registros que llegan juntos en un solo sync (el watermark de
+  MySQLSimple garantiza que nada se pierde aunque el proceso se reinicie)
+- Reintentos con backoff exponencial
+- Circuit breaker: tras varios fallos de conexión seguidos deja de intentar por un tiempo
+  (las filas que MySQL rechaza no cuentan: se reportan aparte)
+- Publica su estado (lag, último éxito, circuito, rechazados) en estado_sync_mysql.json
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+
+from modules.mysql_simple import MySQLSimple
+from modules.mysql_outbox import MAX_INTENTOS_OUTBOX
+import viajes_log
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_ESTADO_SYNC = "estado_sync_mysql.json"
+
+ESPERA_AGRUPAR_SEGUNDOS = 2         # Junta registros que llegan casi al mismo tiempo
+INTERVALO_SYNC_PERIODICO = 600      # Sync aunque no lleguen registros (cada 10 min)
+BACKOFF_BASE_SEGUNDOS = 5
+BACKOFF_MAX_SEGUNDOS = 300
+FALLOS_PARA_ABRIR_CIRCUITO = 5
+ENFRIAMIENTO_CIRCUITO_SEGUNDOS = 600
+
+# Marcador en la cola para pedir un sync sin registro nuevo (o despertar al hilo)
+_SOLICITUD_SYNC = object()
+
+
+class SyncWorkerMySQL:
+    """Hilo que sincroniza viajes_log.csv con MySQL fuera del camino crítico"""
+
+    def __init__(self, mysql_sync=None, archivo_estado=ARCHIVO_ESTADO_SYNC):
+        """
+        Inicializa el worker (el hilo arranca con iniciar())
+
+        Args:
+            mysql_sync: Instancia de MySQLSimple (default: una nueva, exclusiva del hilo)
+            archivo_estado: Archivo JSON donde se publica el estado para el dashboard
+        """
+        self.mysql_sync = mysql_sync or MySQLSimple()
+        self.archivo_estado = os.path.abspath(archivo_estado)
+        self._cola = queue.Queue()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._observador_registrado = False
+
+        self._pendientes = 0
+        self._fallos_consecutivos = 0
+        self._circuito = "cerrado"
+        self._proximo_intento = 0.0
+        self._ultimo_exito = None
+        self._ultimo_intento = None
+        self._ultimo_error = None
+        self._rechazados = 0
+        self._rechazados_outbox = 0
+
+    def iniciar(self):
+        """Arranca el hilo y se suscribe a los registros nuevos de viajes_log"""
+        if not self._observador_registrado:
+            viajes_log.agregar_observador(self.encolar_registro)
+            self._observador_registrado = True
+
+        if self._hilo and self._hilo.is_alive():
+            return
+
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="mysql-sync", daemon=True)
+        self._hilo.start()
+        logger.info("Sync worker MySQL iniciado")
+
+        # Sync inicial para alcanzar lo que quedó pendiente de ejecuciones anteriores
+        self.solicitar_sync()
+
+    def detener(self, timeout=30):
+        """
+        Detiene el hilo después de un último intento de sync
+
+        Args:
+            timeout: Segundos máximos a esperar al hilo
+        """
+        if not self._hilo or not self._hilo.is_alive():
+            return
+        self._detener.set()
+        self._cola.put(_SOLICITUD_SYNC)
+        self._hilo.join(timeout)
+        if self._hilo.is_alive():
+            logger.warning(f"Sync worker MySQL no terminó en {timeout}s")
+        else:
+            logger.info("Sync worker MySQL detenido")
+
+    def encolar_registro(self, registro):
+        """Recibe un registro recién escrito al CSV (observador de viajes_log)"""
+        self._cola.put(registro)
+
+    def solicitar_sync(self):
+        """Pide un sync aunque no haya registros nuevos"""
+        self._cola.put(_SOLICITUD_SYNC)
+
+    def _drenar(self, primero):
+        """Saca de la cola todo lo disponible; regresa (registros, hubo_solicitud)"""
+        elementos = [primero]
+        while True:
+            try:
+                elementos.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        registros = sum(1 for e in elementos if e is not _SOLICITUD_SYNC)
+        return registros, len(elementos) != registros
+
+    def _bucle(self):
+        proximo_periodico = time.monotonic() + INTERVALO_SYNC_PERIODICO
+        solicitado = False
+
+        while True:
+            ahora = time.monotonic()
+            objetivo = ahora if (self._pendientes or solicitado) else proximo_periodico
+            # Durante backoff / circuito abierto solo se acumulan registros
+            objetivo = max(objetivo, self._proximo_intento)
+            espera = max(0.1, objetivo - ahora)
+
+            try:
+                primero = self._cola.get(timeout=espera)
+                if not self._detener.is_set():
+                    # Dar oportunidad a que lleguen registros relacionados
+                    self._detener.wait(ESPERA_AGRUPAR_SEGUNDOS)
+                registros, hubo_solicitud = self._drenar(primero)
+                self._pendientes += registros
+                solicitado = solicitado or hubo_solicitud
+                self._publicar_estado()
+            except queue.Empty:
+                pass
+
+            if self._detener.is_set():
+                self._intentar_sync()
+                break
+
+            ahora = time.monotonic()
+            if ahora < self._proximo_intento:
+                continue
+            if not (self._pendientes or solicitado) and ahora < proximo_periodico:
+                continue
+
+            self._intentar_sync()
+            solicitado = False
+            proximo_periodico = time.monotonic() + INTERVALO_SYNC_PERIODICO
+
+    def _intentar_sync(self):
+        en_vuelo = self._pendientes
+        if self._circuito == "abierto":
+            self._circuito = "semiabierto"
+            logger.info("Circuito MySQL semiabierto - probando conexión")
+
+        self._ultimo_intento = datetime.now().isoformat()
+        try:
+            stats = self.mysql_sync.sincronizar_desde_csv()
+            # Solo una falla de conexión cuenta para el backoff y el circuito: las filas
+            # rechazadas por MySQL se reintentan en el outbox y se reportan aparte
+            exito = not stats.get('conexion_fallida')
+            error = None if exito else f"{stats.get('errores')} error(es) en sync"
+            self._rechazados = stats.get('rechazados', 0)
+            if self._rechazados:
+                logger.warning(f"Sync MySQL: {self._rechazados} registro(s) rechazados por MySQL")
+        except Exception as e:
+            exito = False
+            error = str(e)
+
+        try:
+            self._rechazados_outbox = self.mysql_sync.outbox.contar_rechazados()
+        except Exception as e:
+            logger.warning(f"Error contando rechazados del outbox: {e}")
+
+        if exito:
+            self._pendientes = max(0, self._pendientes - en_vuelo)
+            self._fallos_consecutivos = 0
+            self._proximo_intento = 0.0
+            self._ultimo_exito = datetime.now().isoformat()
+            self._ultimo_error = None
+            if self._circuito != "cerrado":
+                logger.info("Circuito MySQL cerrado - sync recuperado")
+            self._circuito = "cerrado"
+        else:
+            self._fallos_consecutivos += 1
+            self._ultimo_error = error
+            if self._fallos_consecutivos >= FALLOS_PARA_ABRIR_CIRCUITO:
+                self._circuito = "abierto"
+                espera = ENFRIAMIENTO_CIRCUITO_SEGUNDOS
+                logger.warning(f"Circuito MySQL abierto tras {self._fallos_consecutivos} fallos - "
+                               f"reintento en {espera}s")
+            else:
+                espera = min(BACKOFF_BASE_SEGUNDOS * 2 ** (self._fallos_consecutivos - 1), BACKOFF_MAX_SEGUNDOS)
+                logger.warning(f"Sync MySQL falló ({error}) - reintento en {espera}s")
+            self._proximo_intento = time.monotonic() + espera
+
+        self._publicar_estado()
+
+    def obtener_estado(self):
+        """
+        Estado actual del worker
+
+        Returns:
+            dict: Circuito, lag en registros, rechazados, último éxito/error y próximo intento
+        """
+        proximo = None
+        if self._proximo_intento:
+            segundos = max(0.0, self._proximo_intento - time.monotonic())
+            proximo = datetime.fromtimestamp(time.time() + segundos).isoformat()
+        return {
+            'activo': bool(self._hilo and self._hilo.is_alive() and not self._detener.is_set()),
+            'circuito': self._circuito,
+            'lag_registros': self._pendientes + self._cola.qsize(),
+            'ultimo_exito': self._ultimo_exito,
+            'ultimo_intento': self._ultimo_intento,
+            'ultimo_error': self._ultimo_error,
+            'fallos_consecutivos': self._fallos_consecutivos,
+            'registros_rechazados': self._rechazados,
+            'rechazados_outbox': self._rechazados_outbox,
+            'proximo_intento': proximo,
+            'actualizado': datetime.now().isoformat()
+        }
+
+    def _publicar_estado(self):
+        """Escribe el estado de forma atómica para el dashboard (puede correr en otro proceso)"""
+        try:
+            temporal = f"{self.archivo_estado}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(self.obtener_estado(), f, ensure_ascii=False)
+            os.replace(temporal, self.archivo_estado)
+        except Exception as e:
+            logger.warning(f"Error publicando estado de sync MySQL: {e}")
+
+
+def leer_estado_sync(archivo=ARCHIVO_ESTADO_SYNC):
+    """
+    Lee el estado publicado por el worker (para el dashboard)
+
+    Returns:
+        dict: Estado del sync con un mensaje legible, o None si nunca ha corrido
+    """
+    try:
+        if not os.path.exists(archivo):
+            return None
+        with open(archivo, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+    except Exception as e:
+        logger.warning(f"Error leyendo estado de sync MySQL: {e}")
+        return None
+
+    ultimo_exito = estado.get('ultimo_exito')
+    texto_exito = datetime.fromisoformat(ultimo_exito).strftime('%Y-%m-%d %H:%M:%S') if ultimo_exito else 'nunca'
+    estado['mensaje'] = f"lag {estado.get('lag_registros', 0)} registros, último éxito {texto_exito}"
+    if estado.get('circuito') != 'cerrado':
+        estado['mensaje'] += f" (MySQL no disponible: {estado.get('ultimo_error') or 'sin detalle'})"
+    if estado.get('registros_rechazados'):
+        estado['mensaje'] += f", {estado['registros_rechazados']} rechazados en el último sync"
+    if estado.get('rechazados_outbox'):
+        estado['mensaje'] += f", {estado['rechazados_outbox']} descartados tras {MAX_INTENTOS_OUTBOX} intentos"
+    return estado
+
+
+# Instancia global para uso en todo el proyecto
+sync_worker = SyncWorkerMySQL()
+
+
+# Funciones de conveniencia para importación directa
+def iniciar_sync_worker():
+    """Arranca el worker de sync (wrapper)"""
+    sync_worker.iniciar()
+
+
+def detener_sync_worker(timeout=30):
+    """Detiene el worker con un último sync (wrapper)"""
+    sync_worker.detener(timeout)
+
+
+def solicitar_sync_mysql():
+    """Pide un sync inmediato (wrapper)"""
+    sync_worker.solicitar_sync()
@@ -0,0 +1,228 @@
+"""
+Orquestador - Tareas del robot como tareas independientes con intervalo y timeout propios
+
+Funcionalidades:
+- Un event loop asyncio coordina; el trabajo bloqueante (Selenium, COM, CSV, MySQL)
+  corre en hilos (run_in_executor) y no frena a las demás tareas
+- Tareas periódicas (watchdogs, alertas, limpieza, estadísticas) con intervalo y timeout
+- Una tarea periódica que excede su timeout se reporta y no se relanza hasta que termine
+  (no se apilan hilos detrás de una llamada bloqueada)
+- Tareas continuas (procesamiento de viajes) en un hilo dedicado: el driver de Selenium
+  siempre se usa desde el mismo hilo
+- Servicios con hilo propio (ingesta de correo, sync MySQL) que se arrancan y detienen
+  con el orquestador
+- Al detener, la tarea continua termina su paso actual (no se corta un viaje a la mitad)
+- Estado por tarea (ejecuciones, errores, timeouts, duración) para el API
+"""
+
+import asyncio
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_VIGILANCIA_SEGUNDOS = 1       # Cada cuánto se consulta continuar() (detener desde Flask)
+ESPERA_TRAS_ERROR_SEGUNDOS = 30         # Pausa de una tarea continua tras una excepción
+
+
+class TareaOrquestada:
+    """Definición y métricas de una tarea del orquestador"""
+
+    def __init__(self, nombre, funcion, intervalo=None, timeout=None, retraso_inicial=0, continua=False):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.intervalo = intervalo
+        self.timeout = timeout
+        self.retraso_inicial = retraso_inicial
+        self.continua = continua
+
+        self.ejecuciones = 0
+        self.errores = 0
+        self.timeouts = 0
+        self.omitidas = 0
+        self.ultima_duracion = None
+        self.ultimo_inicio = None
+        self.ultimo_error = None
+        self.futuro = None
+
+    def ejecutar(self):
+        """Corre la función una vez (en el hilo del executor) y registra el resultado"""
+        self.ultimo_inicio = datetime.now()
+        inicio = time.monotonic()
+        try:
+            self.funcion()
+        except Exception as e:
+            self.errores += 1
+            self.ultimo_error = f"{datetime.now().isoformat()} - {e}"
+            raise
+        finally:
+            self.ejecuciones += 1
+            self.ultima_duracion = time.monotonic() - inicio
+
+    def en_curso(self):
+        return self.futuro is not None and not self.futuro.done()
+
+    def obtener_estado(self):
+        return {
+            'tipo': 'continua' if self.continua else 'periodica',
+            'intervalo_segundos': self.intervalo,
+            'timeout_segundos': self.timeout,
+            'en_curso': self.en_curso(),
+            'ejecuciones': self.ejecuciones,
+            'errores': self.errores,
+            'timeouts': self.timeouts,
+            'omitidas': self.omitidas,
+            'ultima_duracion_segundos': round(self.ultima_duracion, 2) if self.ultima_duracion is not None else None,
+            'ultimo_inicio': self.ultimo_inicio.isoformat() if self.ultimo_inicio else None,
+            'ultimo_error': self.ultimo_error
+        }
+
+
+class Orquestador:
+    """
+    Corre servicios, tareas continuas y tareas periódicas hasta que continuar() regrese
+    False o se llame detener()
+
+    ejecutar() bloquea: usa asyncio.run en el hilo que lo llama (el hilo del robot).
+    """
+
+    def __init__(self, continuar=None):
+        self.continuar = continuar
+        self._tareas = {}
+        self._servicios = []
+        self._loop = None
+        self._detener = None
+        self._ejecutor = None
+        self._activo = False
+        self._inicio = None
+
+    def agregar_periodica(self, nombre, funcion, intervalo, timeout, retraso_inicial=0):
+        """
+        Args:
+            intervalo: Segundos entre el fin de una ejecución y el inicio de la siguiente
+            timeout: Segundos tras los que la ejecución se reporta como colgada
+            retraso_inicial: Segundos antes de la primera ejecución
+        """
+        self._tareas[nombre] = TareaOrquestada(nombre, funcion, intervalo, timeout, retraso_inicial)
+
+    def agregar_continua(self, nombre, funcion):
+        """La función se llama en bucle en un hilo dedicado; debe regresar cada pocos segundos"""
+        self._tareas[nombre] = TareaOrquestada(nombre, funcion, continua=True)
+
+    def agregar_servicio(self, nombre, iniciar, detener):
+        """Servicio con hilo propio: iniciar() al arrancar, detener() al terminar (orden inverso)"""
+        self._servicios.append((nombre, iniciar, detener))
+
+    def ejecutar(self):
+        asyncio.run(self._principal())
+
+    def detener(self):
+        """Pide detener el orquestador (se puede llamar desde cualquier hilo)"""
+        if self._loop and self._detener and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._detener.set)
+
+    def _debe_continuar(self):
+        return self.continuar is None or self.continuar()
+
+    async def _principal(self):
+        self._loop = asyncio.get_running_loop()
+        self._detener = asyncio.Event()
+        periodicas = [tarea for tarea in self._tareas.values() if not tarea.continua]
+        self._ejecutor = ThreadPoolExecutor(max_workers=max(1, len(periodicas)),
+                                            thread_name_prefix="orquestador")
+        self._activo = True
+        self._inicio = datetime.now()
+
+        servicios_iniciados = []
+        tareas_periodicas = []
+        tareas_continuas = []
+        try:
+            for nombre, iniciar, detener in self._servicios:
+                await self._loop.run_in_executor(self._ejecutor, iniciar)
+                servicios_iniciados.append((nombre, detener))
+                logger.info(f"Orquestador: servicio '{nombre}' iniciado")
+
+            tareas_continuas = [asyncio.create_task(self._correr_continua(tarea))
+                                for tarea in self._tareas.values() if tarea.continua]
+            tareas_periodicas = [asyncio.create_task(self._correr_periodica(tarea)) for tarea in periodicas]
+            logger.info(f"Orquestador: {len(tareas_continuas)} tarea(s) continua(s), "
+                        f"{len(tareas_periodicas)} periódica(s)")
+
+            while self._debe_continuar() and not self._detener.is_set():
+                try:
+                    await asyncio.wait_for(self._detener.wait(), INTERVALO_VIGILANCIA_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._detener.set()
+            for tarea in tareas_periodicas:
+                tarea.cancel()
+            await asyncio.gather(*tareas_periodicas, return_exceptions=True)
+            # Las continuas terminan su paso actual (ej. el viaje en proceso)
+            await asyncio.gather(*tareas_continuas, return_exceptions=True)
+
+            for nombre, detener in reversed(servicios_iniciados):
+                try:
+                    await self._loop.run_in_executor(None, detener)
+                    logger.info(f"Orquestador: servicio '{nombre}' detenido")
+                except Exception as e:
+                    logger.warning(f"Orquestador: error deteniendo servicio '{nombre}': {e}")
+
+            # Una tarea periódica colgada no bloquea el cierre
+            self._ejecutor.shutdown(wait=False)
+            self._activo = False
+            logger.info("Orquestador detenido")
+
+    async def _correr_periodica(self, tarea):
+        if tarea.retraso_inicial:
+            await asyncio.sleep(tarea.retraso_inicial)
+
+        while not self._detener.is_set():
+            if tarea.en_curso():
+                # Sigue colgada desde un timeout anterior
+                tarea.omitidas += 1
+            else:
+                tarea.futuro = self._loop.run_in_executor(self._ejecutor, tarea.ejecutar)
+                try:
+                    # shield: al vencer el timeout se deja de esperar, pero el futuro sigue
+                    # vivo para saber cuándo termina el hilo
+                    await asyncio.wait_for(asyncio.shield(tarea.futuro), tarea.timeout)
+                except asyncio.TimeoutError:
+                    tarea.timeouts += 1
+                    logger.warning(f"Orquestador: '{tarea.nombre}' excedió {tarea.timeout}s - sigue en su hilo")
+                except Exception as e:
+                    logger.warning(f"Orquestador: error en '{tarea.nombre}': {e}")
+
+            await asyncio.sleep(tarea.intervalo)
+
+    async def _correr_continua(self, tarea):
+        ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=tarea.nombre)
+        try:
+            while not self._detener.is_set() and self._debe_continuar():
+                tarea.futuro = self._loop.run_in_executor(ejecutor, tarea.ejecutar)
+                try:
+                    await tarea.futuro
+                except Exception as e:
+                    logger.error(f"Orquestador: error en '{tarea.nombre}': {e}")
+                    logger.info(f"Continuando '{tarea.nombre}' en {ESPERA_TRAS_ERROR_SEGUNDOS} segundos...")
+                    try:
+                        await asyncio.wait_for(self._detener.wait(), ESPERA_TRAS_ERROR_SEGUNDOS)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            ejecutor.shutdown(wait=False)
+
+    def tarea_en_curso(self, nombre):
+        """True si la tarea está corriendo en este momento (ej. un viaje en proceso)"""
+        tarea = self._tareas.get(nombre)
+        return tarea is not None and tarea.en_curso()
+
+    def obtener_estado(self):
+        return {
+            'activo': self._activo,
+            'inicio': self._inicio.isoformat() if self._inicio else None,
+            'servicios': [nombre for nombre, _, _ in self._servicios],
+            'tareas': {nombre: tarea.obtener_estado() for nombre, tarea in self._tareas.items()}
+        }
@@ -1,104 +1,326 @@
-import pandas as pd
 import re
 import logging
+from datetime import datetime
+
+import xlrd
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def parse_xls(ruta_archivo, determinante_from_asunto=None):
+# Layout de la prefactura de Walmart: 6 filas de título, encabezados en la fila 7
+FILA_ENCABEZADOS = 6
+COLUMNAS_PREFACTURA = (
+    "Tipo de Viaje", "Fecha de Embarque", "Placa Remolque", "Placa Tractor",
+    "Entrega1", "$Total de Viaje a Facturar"
+)
+
+
+class LayoutNoSoportado(Exception):
+    """El XLS no tiene el layout esperado; se lee con pandas"""
+
+
+def _valor_celda(celda, datemode):
+    """Valor de una celda xlrd con las mismas conversiones que pd.read_excel"""
+    tipo = celda.ctype
+    if tipo in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return float("nan")
+    if tipo == xlrd.XL_CELL_DATE:
+        try:
+            return xlrd.xldate_as_datetime(celda.value, datemode)
+        except Exception:
+            return celda.value
+    if tipo == xlrd.XL_CELL_NUMBER and celda.value == int(celda.value):
+        return int(celda.value)
+    if tipo == xlrd.XL_CELL_BOOLEAN:
+        return bool(celda.value)
+    if tipo == xlrd.XL_CELL_ERROR:
+        return float("nan")
+    return celda.value
+
+
+def _celda_vacia(valor):
+    """True para celdas en blanco (None, '', NaN o NaT según el motor)"""
+    return valor is None or valor != valor or not str(valor).strip()
+
+
+def _leer_filas_directa(ruta_archivo):
+    """
+    Filas de datos leyendo solo las celdas necesarias (xlrd on_demand)
+
+    Yields:
+        (número de fila en Excel, {columna: valor} de COLUMNAS_PREFACTURA presentes)
+    """
+    libro = xlrd.open_workbook(ruta_archivo, on_demand=True)
     try:
-        logger.info(f"Leyendo archivo: {ruta_archivo}")
+        hoja = libro.sheet_by_index(0)
+        if hoja.nrows <= FILA_ENCABEZADOS:
+            raise LayoutNoSoportado("sin fila de encabezados")
 
-        df = pd.read_excel(ruta_archivo, skiprows=6, header=0, engine="xlrd")
+        # Encabezado -> índice de columna (la primera aparición gana, igual que en pandas)
+        indices = {}
+        for columna, celda in enumerate(hoja.row_slice(FILA_ENCABEZADOS)):
+            nombre = celda.value if celda.ctype == xlrd.XL_CELL_TEXT else None
+            if nombre in COLUMNAS_PREFACTURA and nombre not in indices:
+                indices[nombre] = columna
+        if "Tipo de Viaje" not in indices:
+            raise LayoutNoSoportado("sin columna 'Tipo de Viaje'")
 
-        if df.empty:
-            return {"error": "Archivo vacío"}
+        # Igual que el DataFrame: todas las filas tras el encabezado, aunque vengan vacías
+        for numero_fila in range(FILA_ENCABEZADOS + 1, hoja.nrows):
+            ancho = hoja.row_len(numero_fila)
+            yield numero_fila + 1, {
+                nombre: _valor_celda(hoja.cell(numero_fila, columna), libro.datemode) if columna < ancho else float("nan")
+                for nombre, columna in indices.items()
+            }
+    finally:
+        libro.release_resources()
 
-        fila = df.iloc[0]
 
-        tipo_viaje = str(fila.get("Tipo de Viaje", "")).strip().upper()
-        if tipo_viaje != "VACIO":
-            return {"error": "El viaje no es tipo VACIO"}
+def _leer_filas_pandas(ruta_archivo):
+    """Filas de datos vía DataFrame completo (layouts no esperados)"""
+    import pandas as pd
 
-        fecha = str(fila.get("Fecha de Embarque", "")).split(" ")[0]
-        placa_remolque = str(fila.get("Placa Remolque", "")).strip()
-        placa_tractor = str(fila.get("Placa Tractor", "")).strip()
-        entrega = str(fila.get("Entrega1", "")).strip()
+    df = pd.read_excel(ruta_archivo, skiprows=FILA_ENCABEZADOS, header=0, engine="xlrd")
+    for posicion, (_, fila) in enumerate(df.iterrows()):
+        yield FILA_ENCABEZADOS + 2 + posicion, fila
 
-        determinante = None
-        fuente_determinante = ""
-        
-        determinante_asunto_valida = False
-        if determinante_from_asunto:
-            numeros_asunto = re.findall(r'\d+', str(determinante_from_asunto))
-            if numeros_asunto:
-                numero_asunto = numeros_asunto[0]
-                
-                if len(numero_asunto) == 4 and numero_asunto.isdigit():
-                    determinante = numero_asunto
-                    fuente_determinante = "ASUNTO"
-                    determinante_asunto_valida = True
+
+def leer_filas_xls(ruta_archivo, motor="auto"):
+    """
+    Filas de datos de la prefactura, una a la vez
+
+    Args:
+        motor: 'auto' (directo con respaldo en pandas), 'directo' o 'pandas'
+
+    Yields:
+        (número de fila en Excel, mapeo columna -> valor que soporta .get)
+    """
+    if motor == "pandas":
+        yield from _leer_filas_pandas(ruta_archivo)
+        return
+
+    filas = _leer_filas_directa(ruta_archivo)
+    try:
+        # El layout se valida antes de la primera fila: aquí se decide el respaldo
+        primera = next(filas, None)
+    except LayoutNoSoportado as e:
+        if motor == "directo":
+            raise
+        logger.info(f"Layout no estándar ({e}) - leyendo con pandas")
+        yield from _leer_filas_pandas(ruta_archivo)
+        return
+
+    if primera is not None:
+        yield primera
+        yield from filas
+
+
+def leer_fila_xls(ruta_archivo, motor="auto"):
+    """
+    Primera fila de datos de la prefactura
+
+    Returns:
+        Mapeo columna -> valor (soporta .get), o None si el archivo no tiene datos
+    """
+    filas = leer_filas_xls(ruta_archivo, motor)
+    try:
+        primera = next(filas, None)
+    finally:
+        filas.close()
+    return primera[1] if primera else None
+
+
+def _viaje_de_fila(fila, determinante_from_asunto=None):
+    """Valida una fila de la prefactura: datos del viaje o {'error': ...}"""
+    tipo_viaje = str(fila.get("Tipo de Viaje", "")).strip().upper()
+    if tipo_viaje != "VACIO":
+        return {"error": "El viaje no es tipo VACIO"}
+
+    fecha = str(fila.get("Fecha de Embarque", "")).split(" ")[0]
+    placa_remolque = str(fila.get("Placa Remolque", "")).strip()
+    placa_tractor = str(fila.get("Placa Tractor", "")).strip()
+    entrega = str(fila.get("Entrega1", "")).strip()
+
+    determinante = None
+    fuente_determinante = ""
+    
+    determinante_asunto_valida = False
+    if determinante_from_asunto:
+        numeros_asunto = re.findall(r'\d+', str(determinante_from_asunto))
+        if numeros_asunto:
+            numero_asunto = numeros_asunto[0]
+            
+            if len(numero_asunto) == 4 and numero_asunto.isdigit():
+                determinante = numero_asunto
+                fuente_determinante = "ASUNTO"
+                determinante_asunto_valida = True
+    
+    determinante_excel_valida = False
+    entrega_numero = ""
+    if entrega:
+        numeros_entrega = re.findall(r'\d+', entrega)
+        if numeros_entrega:
+            entrega_numero = numeros_entrega[0]
+            
+            if len(entrega_numero) == 4 and entrega_numero.isdigit():
+                determinante_excel_valida = True
+    
+    if determinante_asunto_valida and not determinante_excel_valida:
+        determinante = numero_asunto
+        fuente_determinante = "ASUNTO"
         
-        determinante_excel_valida = False
-        entrega_numero = ""
-        if entrega:
-            numeros_entrega = re.findall(r'\d+', entrega)
-            if numeros_entrega:
-                entrega_numero = numeros_entrega[0]
-                
-                if len(entrega_numero) == 4 and entrega_numero.isdigit():
-                    determinante_excel_valida = True
+    elif not determinante_asunto_valida and determinante_excel_valida:
+        determinante = entrega_numero
+        fuente_determinante = "EXCEL"
         
-        if determinante_asunto_valida and not determinante_excel_valida:
+    elif determinante_asunto_valida and determinante_excel_valida:
+        if numero_asunto == entrega_numero:
             determinante = numero_asunto
-            fuente_determinante = "ASUNTO"
-            
-        elif not determinante_asunto_valida and determinante_excel_valida:
-            determinante = entrega_numero
-            fuente_determinante = "EXCEL"
-            
-        elif determinante_asunto_valida and determinante_excel_valida:
-            if numero_asunto == entrega_numero:
-                determinante = numero_asunto
-                fuente_determinante = "AMBOS_COINCIDEN"
-            else:
-                determinante = numero_asunto
-                fuente_determinante = "ASUNTO_CON_DISCREPANCIA"
-                logger.warning(f"Discrepancia en determinantes - Asunto: {numero_asunto}, Excel: {entrega_numero}")
-                
+            fuente_determinante = "AMBOS_COINCIDEN"
         else:
-            logger.error(f"No se encontró determinante válida - Asunto: '{determinante_from_asunto}', Excel: '{entrega}'")
-            return {"error": f"No se encontró determinante válida (4 dígitos). Asunto: '{determinante_from_asunto}', Excel: '{entrega}'"}
+            determinante = numero_asunto
+            fuente_determinante = "ASUNTO_CON_DISCREPANCIA"
+            logger.warning(f"Discrepancia en determinantes - Asunto: {numero_asunto}, Excel: {entrega_numero}")
+            
+    else:
+        logger.error(f"No se encontró determinante válida - Asunto: '{determinante_from_asunto}', Excel: '{entrega}'")
+        return {"error": f"No se encontró determinante válida (4 dígitos). Asunto: '{determinante_from_asunto}', Excel: '{entrega}'"}
 
-        if not determinante or len(determinante) != 4 or not determinante.isdigit():
-            logger.error(f"Determinante final no válida: '{determinante}'")
-            return {"error": f"Determinante final no válida: '{determinante}'"}
+    if not determinante or len(determinante) != 4 or not determinante.isdigit():
+        logger.error(f"Determinante final no válida: '{determinante}'")
+        return {"error": f"Determinante final no válida: '{determinante}'"}
 
-        total_str = str(fila.get("$Total de Viaje a Facturar", "0")).replace("$", "").replace(",", "").strip()
+    total_str = str(fila.get("$Total de Viaje a Facturar", "0")).replace("$", "").replace(",", "").strip()
+    try:
+        importe = float(total_str)
+    except:
+        importe = 0.0
+
+    prefactura = ""
+    cliente_codigo = "040512"
+
+    logger.info(f"Determinante: {determinante} (Fuente: {fuente_determinante})")
+
+    return {
+        "prefactura": prefactura,
+        "fecha": fecha,
+        "tipo_viaje": tipo_viaje,
+        "placa_remolque": placa_remolque,
+        "placa_tractor": placa_tractor,
+        "clave_determinante": determinante,
+        "importe": importe,
+        "cliente_codigo": cliente_codigo,
+        "determinante_fuente": fuente_determinante,
+        "determinante_asunto_original": determinante_from_asunto,
+        "determinante_excel_original": entrega
+    }
+
+
+def parse_xls(ruta_archivo, determinante_from_asunto=None, motor="auto"):
+    try:
+        logger.info(f"Leyendo archivo: {ruta_archivo}")
+
+        fila = leer_fila_xls(ruta_archivo, motor)
+
+        if fila is None:
+            return {"error": "Archivo vacío"}
+
+        return _viaje_de_fila(fila, determinante_from_asunto)
+
+    except Exception as e:
+        logger.error(f"Error en parse_xls: {e}")
+        return {"error": str(e)}
+
+
+def iterar_viajes_xls(ruta_archivo, determinante_from_asunto=None, motor="auto"):
+    """
+    Todos los viajes de una prefactura de varias filas, uno por fila
+
+    Las filas sin "Tipo de Viaje" (en blanco, totales) se omiten. Cada registro lleva
+    'fila' (número de fila en Excel) y las filas inválidas traen su propio 'error'.
+    Un error al leer el archivo se regresa como un registro {'error'} sin 'fila'.
+
+    Yields:
+        dict: Datos del viaje (mismas claves que parse_xls) o error de la fila
+    """
+    logger.info(f"Leyendo archivo: {ruta_archivo}")
+    filas_con_viaje = 0
+    try:
+        for numero_fila, fila in leer_filas_xls(ruta_archivo, motor):
+            if _celda_vacia(fila.get("Tipo de Viaje")):
+                continue
+            filas_con_viaje += 1
+            try:
+                registro = _viaje_de_fila(fila, determinante_from_asunto)
+            except Exception as e:
+                registro = {"error": str(e)}
+            registro["fila"] = numero_fila
+            yield registro
+    except Exception as e:
+        logger.error(f"Error en iterar_viajes_xls: {e}")
+        yield {"error": str(e)}
+        return
+
+    if not filas_con_viaje:
+        yield {"error": "Archivo vacío"}
+
+
+def leer_viajes_xls(ruta_archivo, determinante_from_asunto=None, motor="auto"):
+    """Lista de iterar_viajes_xls (para pools de procesos, que no aceptan generadores)"""
+    return list(iterar_viajes_xls(ruta_archivo, determinante_from_asunto, motor))
+
+
+def viaje_de_prefactura(viajes, prefactura):
+    """
+    Viaje que se encola por una prefactura, a partir de los viajes válidos de su XLS
+
+    prefacturarobot, viajes_log y el outbox llevan una fila por prefactura
+    (NOPREFACTURA es la llave), así que una prefactura es un solo viaje: el de la
+    primera fila VACIO válida, igual que parse_xls. Si el XLS trae más viajes no se
+    encolan aparte (se pisarían en prefacturarobot); sus filas quedan en
+    'filas_adicionales' para capturarlos a mano.
+
+    Returns:
+        dict: Datos del viaje con la prefactura asignada, o None si no hay viajes
+    """
+    if not viajes:
+        return None
+    viaje = viajes[0]
+    viaje["prefactura"] = prefactura
+    adicionales = [otro.get("fila") for otro in viajes[1:]]
+    if adicionales:
+        viaje["filas_adicionales"] = adicionales
+        logger.warning(f"Prefactura {prefactura} trae {len(viajes)} viajes: se encola la fila "
+                       f"{viaje.get('fila')}, filas {adicionales} requieren captura manual")
+    return viaje
+
+
+def interpretar_fecha_viaje(fecha_str):
+    """Fecha del viaje (aaaa-mm-dd, dd/mm/aaaa o mm/dd/aaaa) como datetime, o None"""
+    if not fecha_str or fecha_str == "nan":
+        return None
+
+    formatos = ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y"]
+
+    for formato in formatos:
         try:
-            importe = float(total_str)
+            return datetime.strptime(str(fecha_str).split()[0], formato)
         except:
-            importe = 0.0
-
-        prefactura = ""
-        cliente_codigo = "040512"
-
-        logger.info(f"Determinante: {determinante} (Fuente: {fuente_determinante})")
-
-        return {
-            "prefactura": prefactura,
-            "fecha": fecha,
-            "tipo_viaje": tipo_viaje,
-            "placa_remolque": placa_remolque,
-            "placa_tractor": placa_tractor,
-            "clave_determinante": determinante,
-            "importe": importe,
-            "cliente_codigo": cliente_codigo,
-            "determinante_fuente": fuente_determinante,
-            "determinante_asunto_original": determinante_from_asunto,
-            "determinante_excel_original": entrega
-        }
+            continue
+    return None
+
+
+def formatear_fecha_viaje(fecha_str):
+    """Fecha del XLS a dd/mm/aaaa (la fecha actual si no se puede interpretar)"""
+    try:
+        fecha_obj = interpretar_fecha_viaje(fecha_str)
+        if fecha_obj:
+            return fecha_obj.strftime("%d/%m/%Y")
+
+        if fecha_str and fecha_str != "nan":
+            logger.warning(f"No se pudo convertir fecha: {fecha_str}, usando fecha actual")
+        return datetime.now().strftime("%d/%m/%Y")
 
     except Exception as e:
-        logger.error(f"Error en parse_xls: {e}")
-        return {"error": str(e)}
\ No newline at end of file
+        logger.error(f"Error al convertir fecha: {e}")
+        return datetime.now().strftime("%d/%m/%Y")
@@ -0,0 +1,206 @@
+"""
+Prevalidador de Viajes - Revisa los siguientes viajes de la cola mientras corre el actual
+
+Funcionalidades:
+- Mientras un viaje pasa minutos en Selenium, toma los siguientes K pendientes de la cola
+  (sin reclamarlos) y deja precalculado todo lo que no necesita el navegador:
+  determinante, ruta GM, base origen y tipo de CFDI (clave_ruta_base.csv),
+  duplicados en viajes_log.csv y en prefacturarobot, fecha e importe normalizados
+- Marca los viajes que van a fallar (determinante inexistente, igual que la
+  verificación en línea) para que el worker los cierre sin abrir GM; lo demás
+  (placas vacías, fecha o importe raros) solo se reporta como advertencia
+- El worker toma el resultado al reclamar el viaje; si no hay uno vigente (o los datos
+  del viaje cambiaron) se calcula en ese momento con la misma función
+- Los duplicados (viajes_log y prefacturarobot) se vuelven a revisar al reclamar:
+  el viaje pudo registrarse después de la prevalidación
+- Métricas de aprovechamiento para el API
+"""
+
+import hashlib
+import json
+import threading
+import time
+import logging
+from datetime import datetime
+
+from cola_viajes import obtener_proximos_viajes_cola
+from viajes_log import viajes_log
+from modules.clave_ruta_base import buscar_determinante
+from modules.parser import interpretar_fecha_viaje
+from modules import dedup_remoto
+
+logger = logging.getLogger(__name__)
+
+PREVALIDACION_CONFIG = {
+    'viajes_adelante': 3,           # K: pendientes a revisar por adelantado
+    'vigencia_segundos': 600        # Un resultado más viejo se recalcula al reclamar el viaje
+}
+
+
+def _huella_datos(datos_viaje):
+    """Identifica el contenido del viaje: si cambia, el resultado previo no sirve"""
+    contenido = json.dumps(datos_viaje, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def _normalizar_importe(importe):
+    """Importe como float ('$1,234.50' -> 1234.5), o None si no es interpretable"""
+    if isinstance(importe, (int, float)) and not isinstance(importe, bool):
+        return float(importe)
+    try:
+        return float(str(importe).replace("$", "").replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class PrevalidadorViajes:
+    """Look-ahead de la cola: resultados de prevalidación por id de viaje"""
+
+    def __init__(self, config=None):
+        self.config = dict(PREVALIDACION_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._resultados = {}       # viaje_id -> resultado
+        self._metricas = {
+            'prevalidados': 0,
+            'aprovechados': 0,
+            'calculados_al_reclamar': 0,
+            'marcados_para_fallar': 0
+        }
+
+    def prevalidar(self, viaje_registro):
+        """
+        Revisión del viaje sin navegador
+
+        Returns:
+            dict: huella, ruta_gm, base_origen, tipo_documento, registro_log, facturada,
+                  datos_normalizados, falla (modulo, motivo) o None y advertencias
+        """
+        datos_viaje = viaje_registro.get('datos_viaje', {})
+        prefactura = datos_viaje.get('prefactura', 'DESCONOCIDA')
+        determinante = datos_viaje.get('clave_determinante')
+        advertencias = []
+        falla = None
+
+        fila, estado_determinante = buscar_determinante(determinante) if determinante else (None, None)
+        if determinante and not fila:
+            # Igual que la verificación original: sin fila (o sin CSV) el viaje no puede crearse
+            falla = ('determinante_no_existe', f"Determinante {determinante} no existe en clave_ruta_base.csv")
+        elif fila and not (fila.get('tipo_documento') or '').strip():
+            advertencias.append("Determinante sin tipo_documento (se usará el default)")
+
+        registro_log, facturada = self._verificar_duplicados(datos_viaje, advertencias)
+
+        placas_vacias = [campo for campo in ('placa_tractor', 'placa_remolque')
+                         if not str(datos_viaje.get(campo) or '').strip()]
+        if placas_vacias:
+            advertencias.append(f"Viaje sin {' ni '.join(placas_vacias)}")
+
+        datos_normalizados = {}
+        fecha_obj = interpretar_fecha_viaje(datos_viaje.get('fecha'))
+        if fecha_obj:
+            datos_normalizados['fecha'] = fecha_obj.strftime("%d/%m/%Y")
+        else:
+            advertencias.append(f"Fecha no interpretable: '{datos_viaje.get('fecha')}'")
+        importe = _normalizar_importe(datos_viaje.get('importe'))
+        if importe is None:
+            advertencias.append(f"Importe no interpretable: '{datos_viaje.get('importe')}'")
+        elif importe <= 0:
+            advertencias.append(f"Importe {importe} (sin monto a facturar)")
+        else:
+            datos_normalizados['importe'] = importe
+
+        return {
+            'viaje_id': viaje_registro.get('id'),
+            'prefactura': prefactura,
+            'huella': _huella_datos(datos_viaje),
+            'momento': time.monotonic(),
+            'fecha_prevalidacion': datetime.now().isoformat(),
+            'estado_determinante': estado_determinante,
+            'ruta_gm': fila.get('ruta_gm') if fila else None,
+            'base_origen': fila.get('base_origen') if fila else None,
+            'tipo_documento': fila.get('tipo_documento') if fila else None,
+            'registro_log': registro_log,
+            'facturada': facturada,
+            'datos_normalizados': datos_normalizados,
+            'falla': falla,
+            'advertencias': advertencias
+        }
+
+    @staticmethod
+    def _verificar_duplicados(datos_viaje, advertencias):
+        """(registro en viajes_log, facturada en prefacturarobot); un error no detiene el viaje"""
+        registro_log = None
+        try:
+            registro_log = viajes_log.verificar_viaje_existe(datos_viaje.get('prefactura'))
+        except Exception as e:
+            advertencias.append(f"Error verificando duplicados: {e}")
+        facturada = False
+        try:
+            # Consulta en memoria: el cache se refresca en su propia tarea
+            facturada = dedup_remoto.prefactura_facturada(datos_viaje.get('prefactura'))
+        except Exception as e:
+            advertencias.append(f"Error consultando prefacturarobot: {e}")
+        return registro_log, facturada
+
+    def _vigente(self, resultado, datos_viaje):
+        return (resultado is not None
+                and time.monotonic() - resultado['momento'] <= self.config['vigencia_segundos']
+                and resultado['huella'] == _huella_datos(datos_viaje))
+
+    def adelantar(self):
+        """Prevalida los siguientes viajes pendientes (tarea periódica del orquestador)"""
+        proximos = obtener_proximos_viajes_cola(self.config['viajes_adelante'])
+        ids = {viaje.get('id') for viaje in proximos}
+
+        with self._lock:
+            # Los que ya no están pendientes (tomados, cancelados) se descartan
+            for viaje_id in [viaje_id for viaje_id in self._resultados if viaje_id not in ids]:
+                del self._resultados[viaje_id]
+            faltantes = [viaje for viaje in proximos
+                         if not self._vigente(self._resultados.get(viaje.get('id')), viaje.get('datos_viaje', {}))]
+
+        for viaje in faltantes:
+            resultado = self.prevalidar(viaje)
+            with self._lock:
+                self._resultados[resultado['viaje_id']] = resultado
+                self._metricas['prevalidados'] += 1
+                if resultado['falla']:
+                    self._metricas['marcados_para_fallar'] += 1
+            if resultado['falla']:
+                logger.warning(f"Prevalidación: {resultado['prefactura']} va a fallar - {resultado['falla'][1]}")
+
+    def tomar(self, viaje_registro):
+        """
+        Resultado para el viaje que el worker acaba de reclamar (lo calcula si no hay uno vigente)
+
+        De un resultado vigente se reutiliza la revisión de determinante y datos; los
+        duplicados se consultan de nuevo porque pudieron cambiar desde la prevalidación.
+        """
+        datos_viaje = viaje_registro.get('datos_viaje', {})
+        with self._lock:
+            resultado = self._resultados.pop(viaje_registro.get('id'), None)
+            vigente = self._vigente(resultado, datos_viaje)
+            if vigente:
+                self._metricas['aprovechados'] += 1
+
+        if vigente:
+            advertencias = list(resultado['advertencias'])
+            registro_log, facturada = self._verificar_duplicados(datos_viaje, advertencias)
+            return dict(resultado, registro_log=registro_log, facturada=facturada, advertencias=advertencias)
+
+        resultado = self.prevalidar(viaje_registro)
+        with self._lock:
+            self._metricas['calculados_al_reclamar'] += 1
+        return resultado
+
+    def obtener_metricas(self):
+        with self._lock:
+            return dict(self._metricas, en_espera=[
+                {
+                    'prefactura': resultado['prefactura'],
+                    'fecha_prevalidacion': resultado['fecha_prevalidacion'],
+                    'falla': resultado['falla'][1] if resultado['falla'] else None,
+                    'advertencias': resultado['advertencias']
+                }
+                for resultado in self._resultados.values()
+            ])
@@ -7,14 +7,16 @@ Funcionalidades:
 - Marca viaje actual en proceso con toda su información
 - Incrementa contadores de viajes exitosos/fallidos
 - Detecta si el robot está trabado (>15 min sin actividad)
-- Actualiza cola de viajes pendientes
+- Expone la cola de viajes pendientes derivada de cola_viajes.json (sin copiarla)
 - Mantiene listas de viajes recientes (últimos 10 exitosos/fallidos)
+- Alimenta los histogramas de duración por fase (metricas_fases)
 """
 
 import json
 import os
 from datetime import datetime
 from pathlib import Path
+from modules import metricas_fases
 
 
 ARCHIVO_ESTADO = "estado_robots.json"
@@ -45,10 +47,6 @@ def _leer_estado():
                     "viajes_exitosos_recientes": [],
                     "viajes_fallidos_recientes": []
                 }
-            },
-            "cola": {
-                "viajes": [],
-                "ultima_actualizacion": datetime.now().isoformat()
             }
         }
 
@@ -78,10 +76,6 @@ def _leer_estado():
                     "viajes_exitosos_recientes": [],
                     "viajes_fallidos_recientes": []
                 }
-            },
-            "cola": {
-                "viajes": [],
-                "ultima_actualizacion": datetime.now().isoformat()
             }
         }
         _guardar_estado(estado_inicial)
@@ -139,6 +133,8 @@ def marcar_viaje_actual(prefactura, fase, placa_tractor="", placa_remolque="", d
     estado['robots']['robot_1']['estado'] = 'procesando'
     _guardar_estado(estado)
 
+    metricas_fases.iniciar_viaje(prefactura, fase)
+
 
 def actualizar_fase_viaje(nueva_fase):
     """
@@ -153,6 +149,8 @@ def actualizar_fase_viaje(nueva_fase):
         estado['robots']['robot_1']['ultima_actividad'] = datetime.now().isoformat()
         _guardar_estado(estado)
 
+    metricas_fases.registrar_fase(nueva_fase)
+
 
 def limpiar_viaje_actual():
     """Limpia el viaje actual (cuando termina exitoso o fallido)"""
@@ -160,6 +158,8 @@ def limpiar_viaje_actual():
     estado['robots']['robot_1']['viaje_actual'] = None
     _guardar_estado(estado)
 
+    metricas_fases.finalizar_viaje()
+
 
 def incrementar_exitosos(prefactura):
     """
@@ -190,6 +190,8 @@ def incrementar_exitosos(prefactura):
 
     _guardar_estado(estado)
 
+    metricas_fases.finalizar_viaje("exitoso")
+
 
 def incrementar_fallidos(prefactura, motivo_error):
     """
@@ -223,19 +225,7 @@ def incrementar_fallidos(prefactura, motivo_error):
 
     _guardar_estado(estado)
 
-
-def actualizar_cola(lista_viajes):
-    """
-    Actualiza la cola de viajes pendientes
-
-    Args:
-        lista_viajes: Lista de dicts con información de viajes pendientes
-                      Cada dict debe tener: prefactura, fecha, placa_tractor, placa_remolque
-    """
-    estado = _leer_estado()
-    estado['cola']['viajes'] = lista_viajes
-    estado['cola']['ultima_actualizacion'] = datetime.now().isoformat()
-    _guardar_estado(estado)
+    metricas_fases.finalizar_viaje("fallido")
 
 
 def verificar_y_limpiar_viaje_stuck(timeout_minutos=10):
@@ -284,6 +274,26 @@ def verificar_y_limpiar_viaje_stuck(timeout_minutos=10):
     return False, None
 
 
+def obtener_avance_viaje():
+    """
+    Viaje en proceso y minutos desde su último avance (cambio de fase o actividad)
+
+    Returns:
+        tuple: (viaje_actual dict o None, minutos sin avance o None)
+    """
+    estado = _leer_estado()
+    robot = estado['robots']['robot_1']
+    viaje_actual = robot.get('viaje_actual')
+    if not viaje_actual:
+        return None, None
+
+    try:
+        ultimo_avance = datetime.fromisoformat(robot.get('ultima_actividad') or viaje_actual['inicio'])
+    except (KeyError, TypeError, ValueError):
+        return viaje_actual, None
+    return viaje_actual, (datetime.now() - ultimo_avance).total_seconds() / 60
+
+
 def verificar_si_trabado():
     """
     Verifica si el robot está trabado en dos escenarios:
@@ -320,8 +330,7 @@ def verificar_si_trabado():
 
         # ESCENARIO 2: Robot "buscando viajes" pero hay pendientes y no los procesa
         elif robot['estado'] == 'ejecutando':
-            cola = estado.get('cola', {})
-            viajes_pendientes = len(cola.get('viajes', []))
+            viajes_pendientes = obtener_cola().get('total', 0)
 
             # Si hay viajes pendientes pero lleva 20+ minutos sin actividad
             if viajes_pendientes > 0 and minutos_sin_actividad > 20:
@@ -361,13 +370,13 @@ def obtener_estadisticas():
 
 def obtener_cola():
     """
-    Obtiene solo la información de la cola
+    Obtiene la información de la cola, calculada desde cola_viajes.json
 
     Returns:
-        dict: Información de la cola de viajes pendientes
+        dict: Viajes pendientes/procesando, total y versión del snapshot
     """
-    estado = _leer_estado()
-    return estado['cola']
+    from cola_viajes import obtener_resumen_cola
+    return obtener_resumen_cola()
 
 
 if __name__ == "__main__":
@@ -380,7 +389,7 @@ if __name__ == "__main__":
     print("  - incrementar_exitosos(prefactura)")
     print("  - incrementar_fallidos(prefactura, motivo)")
     print("  - verificar_si_trabado()")
-    print("  - actualizar_cola(lista_viajes)")
+    print("  - obtener_cola()")
     print("=" * 60)
 
     # Test básico
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos del robot se importan desde la raíz del proyecto (igual que al correrlo)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+"""
+MaildirMailSource / FiltroCorreo sobre un Maildir temporal con archivos .eml
+"""
+
+import os
+from email.message import EmailMessage
+
+import pytest
+
+from modules.mail_source import FiltroCorreo, crear_fuente_correo
+
+REMITENTE_WALMART = "PreFacturacionTransportes@walmart.com"
+CONTENIDO_XLS = b"\xd0\xcf\x11\xe0 prefactura de prueba"
+
+
+def filtro_prefacturas():
+    # Mismo filtro que usa la ingesta (FILTRO_PREFACTURAS)
+    return FiltroCorreo(remitente=REMITENTE_WALMART, asunto_contiene="prefactura",
+                        asunto_excluye="cancelado", con_adjuntos=True)
+
+
+def escribir_correo(carpeta, nombre, asunto, remitente=REMITENTE_WALMART, adjunto=CONTENIDO_XLS):
+    mensaje = EmailMessage()
+    mensaje['From'] = remitente
+    mensaje['Subject'] = asunto
+    mensaje['Message-ID'] = f"<{nombre}@prueba>"
+    mensaje.set_content("Prefactura adjunta")
+    if adjunto is not None:
+        mensaje.add_attachment(adjunto, maintype='application', subtype='vnd.ms-excel',
+                               filename='prefactura.xls')
+    ruta = os.path.join(carpeta, nombre)
+    with open(ruta, 'wb') as f:
+        f.write(bytes(mensaje))
+    return ruta
+
+
+@pytest.fixture
+def maildir(tmp_path):
+    for sub in ('new', 'cur', 'tmp'):
+        (tmp_path / sub).mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def fuente(maildir):
+    fuente = crear_fuente_correo('maildir', str(maildir))
+    assert fuente.conectar()
+    return fuente
+
+
+def test_filtro_solo_deja_prefacturas_con_adjunto(maildir, fuente):
+    nueva = str(maildir / 'new')
+    escribir_correo(nueva, 'valido', "Prefactura 7400001 cedis origen 1234")
+    escribir_correo(nueva, 'otro_remitente', "Prefactura 7400002 cedis origen 1234",
+                    remitente="alguien@otro.com")
+    escribir_correo(nueva, 'cancelado', "Prefactura 7400003 CANCELADO")
+    escribir_correo(nueva, 'sin_adjunto', "Prefactura 7400004 cedis origen 1234", adjunto=None)
+    escribir_correo(nueva, 'sin_palabra', "Aviso de pago 7400005")
+
+    mensajes = list(fuente.mensajes_no_leidos(filtro_prefacturas()))
+
+    assert [mensaje.asunto for mensaje in mensajes] == ["Prefactura 7400001 cedis origen 1234"]
+    assert mensajes[0].remitente == REMITENTE_WALMART
+    assert fuente.contar_no_leidos(filtro_prefacturas()) == 1
+    assert fuente.contar_no_leidos() == 5
+
+
+def test_adjuntos_devuelven_los_bytes_del_xls(maildir, fuente):
+    escribir_correo(str(maildir / 'new'), 'valido', "Prefactura 7400001 cedis origen 1234")
+
+    mensaje, = fuente.mensajes_no_leidos(filtro_prefacturas())
+    adjuntos = mensaje.adjuntos()
+
+    assert [adjunto.nombre for adjunto in adjuntos] == ['prefactura.xls']
+    assert adjuntos[0].obtener_bytes() == CONTENIDO_XLS
+    assert mensaje.clave == "<valido@prueba>"
+
+
+def test_marcar_leido_pasa_a_cur_con_flag_s(maildir, fuente):
+    escribir_correo(str(maildir / 'new'), 'valido', "Prefactura 7400001 cedis origen 1234")
+    # Ya visto por otro cliente (en cur/, marcado pero sin leer)
+    escribir_correo(str(maildir / 'cur'), 'marcado:2,F', "Prefactura 7400002 cedis origen 1234")
+
+    for mensaje in fuente.mensajes_no_leidos(filtro_prefacturas()):
+        mensaje.marcar_leido()
+
+    assert os.listdir(maildir / 'new') == []
+    assert sorted(os.listdir(maildir / 'cur')) == ['marcado:2,FS', 'valido:2,S']
+    assert list(fuente.mensajes_no_leidos(filtro_prefacturas())) == []
+    assert fuente.contar_no_leidos() == 0
+
+
+def test_mover_a_crea_subcarpeta_maildir(maildir, fuente):
+    escribir_correo(str(maildir / 'new'), 'valido', "Prefactura 7400001 cedis origen 1234")
+
+    mensaje, = fuente.mensajes_no_leidos(filtro_prefacturas())
+    mensaje.mover_a("Problemas")
+
+    assert os.listdir(maildir / '.Problemas' / 'cur') == ['valido']
+    assert fuente.contar_no_leidos() == 0
+
+
+def test_carpeta_eml_marca_leido_moviendo_a_leidos(tmp_path):
+    escribir_correo(str(tmp_path), 'correo.eml', "Prefactura 7400001 cedis origen 1234")
+    fuente = crear_fuente_correo('maildir', str(tmp_path))
+    assert fuente.conectar()
+
+    mensaje, = fuente.mensajes_no_leidos(filtro_prefacturas())
+    mensaje.marcar_leido()
+
+    assert os.listdir(tmp_path / 'leidos') == ['correo.eml']
+    assert fuente.contar_no_leidos() == 0
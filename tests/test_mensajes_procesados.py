@@ -0,0 +1,74 @@
+"""
+RegistroMensajesProcesados: sin falsos negativos, persistencia entre reinicios y purga
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from modules.mensajes_procesados import RegistroMensajesProcesados, hash_mensaje
+
+
+@pytest.fixture(params=[True, False], ids=['bloom', 'sin_bloom'])
+def config(request):
+    # Capacidad chica: el filtro se satura y aun así no puede dar falsos negativos
+    return {'usar_bloom': request.param, 'capacidad_bloom': 500}
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    return str(tmp_path / "mensajes_procesados.db")
+
+
+def test_registrado_siempre_se_encuentra(archivo, config):
+    registro = RegistroMensajesProcesados(archivo, config)
+    claves = [f"<{numero}@walmart.com>" for numero in range(3000)]
+    for clave in claves:
+        registro.registrar(clave, 'ingresado', '7400000')
+
+    assert all(registro.contiene(clave) for clave in claves)
+    # Espacios alrededor del Message-ID no cambian la clave
+    assert registro.contiene("  <0@walmart.com>  ")
+    assert not any(registro.contiene(f"<nuevo{numero}@walmart.com>") for numero in range(1000))
+    assert not registro.contiene(None)
+    registro.cerrar()
+
+
+def test_reabrir_conserva_los_registros(archivo, config):
+    registro = RegistroMensajesProcesados(archivo, config)
+    registro.registrar("<a@walmart.com>", 'ingresado', '7400001')
+    registro.registrar("<b@walmart.com>", 'duplicado')
+    registro.cerrar()
+
+    reabierto = RegistroMensajesProcesados(archivo, config)
+
+    assert reabierto.contiene("<a@walmart.com>")
+    assert reabierto.contiene("<b@walmart.com>")
+    assert not reabierto.contiene("<c@walmart.com>")
+    assert reabierto.obtener_estadisticas()['por_resultado'] == {'ingresado': 1, 'duplicado': 1}
+    reabierto.cerrar()
+
+
+def test_purgar_elimina_solo_los_antiguos(archivo, config):
+    registro = RegistroMensajesProcesados(archivo, config)
+    registro.registrar("<viejo@walmart.com>", 'ingresado')
+    registro.registrar("<reciente@walmart.com>", 'ingresado')
+    registro.cerrar()
+
+    conexion = sqlite3.connect(archivo)
+    hace_un_anio = (datetime.now() - timedelta(days=365)).isoformat()
+    conexion.execute("UPDATE procesados SET fecha = ? WHERE hash = ?",
+                     (hace_un_anio, hash_mensaje("<viejo@walmart.com>")))
+    conexion.commit()
+    conexion.close()
+
+    registro = RegistroMensajesProcesados(archivo, config)
+    assert registro.purgar(dias=180) == 1
+
+    assert not registro.contiene("<viejo@walmart.com>")
+    assert registro.contiene("<reciente@walmart.com>")
+    assert registro.purgar(dias=180) == 0
+    registro.cerrar()
+
+    assert not RegistroMensajesProcesados(archivo, config).contiene("<viejo@walmart.com>")
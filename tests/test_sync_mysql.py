@@ -0,0 +1,176 @@
+"""
+Sync viajes_log.csv → outbox → prefacturarobot contra DestinoSQLite (sin servidor MySQL)
+"""
+
+import csv
+
+import pytest
+
+from modules.mysql_outbox import OutboxMySQL, MAX_INTENTOS_OUTBOX
+from modules.mysql_simple import DestinoSQLite, MySQLSimple
+from modules.parser import viaje_de_prefactura
+
+CAMPOS_LOG = [
+    'timestamp', 'prefactura', 'determinante', 'fecha_viaje', 'placa_tractor', 'placa_remolque',
+    'estatus', 'motivo_fallo', 'uuid', 'viajegm', 'numero_factura', 'importe', 'cliente_codigo'
+]
+
+
+def exitoso(prefactura, timestamp, viajegm='COB-1', uuid='UUID-1', numero_factura='F-1'):
+    return {'timestamp': timestamp, 'prefactura': prefactura, 'estatus': 'EXITOSO',
+            'viajegm': viajegm, 'uuid': uuid, 'numero_factura': numero_factura}
+
+
+def fallido(prefactura, timestamp, motivo='gm_salida'):
+    return {'timestamp': timestamp, 'prefactura': prefactura, 'estatus': 'FALLIDO', 'motivo_fallo': motivo}
+
+
+@pytest.fixture
+def sync(tmp_path, monkeypatch):
+    # El watermark se guarda con ruta relativa
+    monkeypatch.chdir(tmp_path)
+    destino = DestinoSQLite(str(tmp_path / "prefacturarobot.db"))
+    sincronizador = MySQLSimple(
+        str(tmp_path / "viajes_log.csv"),
+        outbox=OutboxMySQL(str(tmp_path / "mysql_outbox.db")),
+        destino=destino
+    )
+    escribir_log(sincronizador.archivo_csv, [], modo='w')
+    yield sincronizador
+    destino.cerrar()
+
+
+def escribir_log(archivo, registros, modo='a'):
+    with open(archivo, modo, newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPOS_LOG)
+        if modo == 'w':
+            writer.writeheader()
+        for registro in registros:
+            writer.writerow(registro)
+
+
+def remoto(sincronizador, prefactura):
+    return sincronizador.destino.conectar().execute(
+        "SELECT VIAJEGM, FACTURAGM, UUID, erroresrobot, estatusr FROM prefacturarobot WHERE NOPREFACTURA = ?",
+        (prefactura,)
+    ).fetchone()
+
+
+def rechazar_prefactura(sincronizador, prefactura):
+    """MySQL rechaza la fila (ej: dato inválido) con la conexión viva"""
+    sincronizador.destino.conectar().execute(f"""
+        CREATE TRIGGER rechazar_{prefactura} BEFORE INSERT ON prefacturarobot
+        WHEN NEW.NOPREFACTURA = '{prefactura}'
+        BEGIN SELECT RAISE(ABORT, 'fila rechazada'); END
+    """)
+
+
+def test_lote_sube_exitosos_y_fallidos(sync):
+    escribir_log(sync.archivo_csv, [
+        exitoso('7400001', '2026-01-01 10:00:00'),
+        exitoso('7400002', '2026-01-01 10:05:00', uuid=''),
+        fallido('7400003', '2026-01-01 10:10:00'),
+    ])
+
+    estadisticas = sync.sincronizar_desde_csv()
+
+    assert estadisticas['procesados'] == 3
+    assert (estadisticas['exitosos'], estadisticas['fallidos'], estadisticas['errores']) == (2, 1, 0)
+    assert not estadisticas['conexion_fallida']
+    assert remoto(sync, '7400001') == ('COB-1', 'F-1', 'UUID-1', '', 'facturado')
+    # Sin UUID el viaje queda pendiente de facturar
+    assert remoto(sync, '7400002')[4] == 'pendiente'
+    assert remoto(sync, '7400003') == ('0', '0', '0', 'gm_salida', 'pendiente')
+    assert sync.outbox.contar_pendientes() == 0
+
+
+def test_fallido_no_pisa_prefactura_facturada(sync):
+    escribir_log(sync.archivo_csv, [exitoso('7400001', '2026-01-01 10:00:00')])
+    sync.sincronizar_desde_csv()
+
+    escribir_log(sync.archivo_csv, [fallido('7400001', '2026-01-02 09:00:00', 'reintento manual')])
+    estadisticas = sync.sincronizar_desde_csv()
+
+    assert estadisticas['procesados'] == 1
+    assert remoto(sync, '7400001') == ('COB-1', 'F-1', 'UUID-1', '', 'facturado')
+
+
+def test_watermark_solo_lee_filas_agregadas(sync, monkeypatch):
+    escribir_log(sync.archivo_csv, [exitoso('7400001', '2026-01-01 10:00:00'),
+                                    fallido('7400002', '2026-01-01 10:05:00')])
+    sync.sincronizar_desde_csv()
+
+    leidos = []
+    agregar_lote = sync.outbox.agregar_lote
+    monkeypatch.setattr(sync.outbox, 'agregar_lote',
+                        lambda registros: leidos.extend(registros) or agregar_lote(registros))
+
+    escribir_log(sync.archivo_csv, [exitoso('7400002', '2026-01-01 11:00:00')])
+    # Fila a medio escribir al final: se deja para el siguiente sync
+    with open(sync.archivo_csv, 'a', encoding='utf-8') as f:
+        f.write('2026-01-01 11:05:00,7400003')
+    sync.sincronizar_desde_csv()
+
+    assert [(r['prefactura'], r['estatus']) for r in leidos] == [('7400002', 'EXITOSO')]
+    assert remoto(sync, '7400002')[4] == 'facturado'
+    assert remoto(sync, '7400003') is None
+
+
+def test_reconciliacion_tras_reescritura_del_csv(sync):
+    escribir_log(sync.archivo_csv, [exitoso('7400001', '2026-01-01 10:00:00'),
+                                    exitoso('7400002', '2026-01-01 10:05:00', viajegm='COB-2')])
+    sync.sincronizar_desde_csv()
+
+    # MySQL perdió una fila y el CSV se reescribió (limpieza de duplicados)
+    conexion = sync.destino.conectar()
+    conexion.execute("DELETE FROM prefacturarobot WHERE NOPREFACTURA = '7400001'")
+    conexion.commit()
+    escribir_log(sync.archivo_csv, [exitoso('7400001', '2026-01-01 10:00:00')], modo='w')
+
+    estadisticas = sync.sincronizar_desde_csv()
+
+    assert estadisticas['procesados'] == 1
+    assert remoto(sync, '7400001') == ('COB-1', 'F-1', 'UUID-1', '', 'facturado')
+    assert remoto(sync, '7400002')[0] == 'COB-2'
+
+    # Con el watermark al día el siguiente sync no vuelve a reconciliar
+    assert sync.sincronizar_desde_csv()['procesados'] == 0
+
+
+def test_rechazado_tras_max_intentos(sync):
+    rechazar_prefactura(sync, '6660000')
+    escribir_log(sync.archivo_csv, [fallido('6660000', '2026-01-01 10:00:00'),
+                                    exitoso('7400001', '2026-01-01 10:05:00')])
+
+    for intento in range(MAX_INTENTOS_OUTBOX):
+        estadisticas = sync.sincronizar_desde_csv()
+        # Una fila rechazada con MySQL vivo no es una caída de conexión
+        assert not estadisticas['conexion_fallida']
+        assert estadisticas['rechazados'] == 1
+        if intento == 0:
+            assert remoto(sync, '7400001')[4] == 'facturado'
+
+    assert sync.outbox.contar_rechazados() == 1
+    assert sync.outbox.contar_pendientes() == 0
+    assert sync.sincronizar_desde_csv()['rechazados'] == 0
+
+
+def test_prefactura_con_varios_viajes_es_una_fila(sync):
+    filas_xls = [{'fila': 8, 'placa_tractor': '22AA1'}, {'fila': 11, 'placa_tractor': '33BB2'}]
+    viaje = viaje_de_prefactura(filas_xls, '7400001')
+    assert (viaje['prefactura'], viaje['fila'], viaje['filas_adicionales']) == ('7400001', 8, [11])
+
+    # El viaje falla y luego se reprocesa; MySQL rechaza el FALLIDO pero acepta el EXITOSO
+    sync.destino.conectar().execute("""
+        CREATE TRIGGER rechazar_fallido BEFORE INSERT ON prefacturarobot
+        WHEN NEW.erroresrobot != '' BEGIN SELECT RAISE(ABORT, 'fila rechazada'); END
+    """)
+    escribir_log(sync.archivo_csv, [fallido('7400001', '2026-01-01 10:00:00'),
+                                    exitoso('7400001', '2026-01-01 12:00:00', viajegm='COB-7')])
+    estadisticas = sync.sincronizar_desde_csv()
+
+    assert estadisticas['exitosos'] == 1
+    assert remoto(sync, '7400001') == ('COB-7', 'F-1', 'UUID-1', '', 'facturado')
+    # El FALLIDO viejo quedó superado: no se reintenta ni termina como rechazado
+    assert sync.outbox.contar_pendientes() == 0
+    assert sync.outbox.contar_rechazados() == 0
@@ -11,6 +11,7 @@ import json
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
+from modules.mysql_outbox import outbox
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -42,7 +43,19 @@ class ViajesLogManager:
             'importe',
             'cliente_codigo'
         ]
+        # Callbacks que reciben cada registro recién escrito (ej: sync worker de MySQL)
+        self._observadores = []
         self._verificar_archivo()
+
+    def agregar_observador(self, callback):
+        """
+        Registra un callback que se llama con cada registro escrito al CSV
+
+        Args:
+            callback: Función que recibe el dict del registro
+        """
+        if callback not in self._observadores:
+            self._observadores.append(callback)
     
     def _verificar_archivo(self):
         """Verifica que el archivo CSV existe y tiene los headers correctos"""
@@ -184,10 +197,18 @@ class ViajesLogManager:
                 'cliente_codigo': kwargs.get('cliente_codigo', '')
             }
             
-            # Escribir al archivo CSV
-            with open(self.archivo_csv, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=self.campos)
-                writer.writerow(registro)
+            # Escribir al archivo CSV (el registro entra al outbox de MySQL solo si
+            # la escritura tuvo éxito)
+            with outbox.registrar(registro):
+                with open(self.archivo_csv, 'a', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=self.campos)
+                    writer.writerow(registro)
+
+            for callback in self._observadores:
+                try:
+                    callback(registro)
+                except Exception as e:
+                    logger.warning(f"Error notificando registro a observador: {e}")
 
             # Log del registro en CSV
             estatus = registro['estatus']
@@ -287,6 +308,34 @@ class ViajesLogManager:
             logger.error(f"Error leyendo viajes por estatus: {e}")
             return viajes
     
+    def obtener_indice_estatus(self):
+        """
+        Índice prefactura → estatus en una sola lectura del CSV (para revisiones masivas)
+
+        Misma priorización que verificar_viaje_existe: EXITOSO gana sobre FALLIDO.
+
+        Returns:
+            Dict[str, str]: Estatus de cada prefactura registrada
+        """
+        indice = {}
+        try:
+            if not os.path.exists(self.archivo_csv):
+                return indice
+
+            with open(self.archivo_csv, 'r', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+
+                for row in reader:
+                    prefactura = row.get('prefactura')
+                    if prefactura and indice.get(prefactura) != 'EXITOSO':
+                        indice[prefactura] = row.get('estatus')
+
+            return indice
+
+        except Exception as e:
+            logger.error(f"Error leyendo índice del log: {e}")
+            return indice
+    
     def obtener_estadisticas(self):
         """
         Obtiene estadísticas del log de viajes
@@ -509,10 +558,18 @@ def registrar_viaje_fallido(prefactura, motivo_fallo, determinante=None,
         cliente_codigo=cliente_codigo
     )
 
+def agregar_observador(callback):
+    """Función de conveniencia para recibir cada registro nuevo del log"""
+    viajes_log.agregar_observador(callback)
+
 def verificar_viaje_existe(prefactura, determinante=None):
     """Función de conveniencia para verificar si viaje existe"""
     return viajes_log.verificar_viaje_existe(prefactura, determinante)
 
+def obtener_indice_estatus():
+    """Función de conveniencia para obtener el índice prefactura → estatus"""
+    return viajes_log.obtener_indice_estatus()
+
 def obtener_estadisticas():
     """Función de conveniencia para obtener estadísticas"""
     return viajes_log.obtener_estadisticas()